@@ -0,0 +1,100 @@
+import asyncio, utime
+import latency_trace, menus
+from tipup_device import TipupDevice
+
+# Time between flash toggles while the alert screen is up
+ALERT_FLASH_MS = 500
+# Alerts arriving within this of the last redraw wait for the next one, so a burst of trips takes a few redraws
+ALERT_REDRAW_MS = 100
+
+class AlertScheduler:
+    """Owns the single alert screen and the one task that draws and flashes it
+
+    notify_tipup() only records the alert on its TipupDevice and wakes the task, so a burst of indications
+    is merged into one redraw of the same AlertMenu every ALERT_REDRAW_MS at most
+    """
+    def __init__(self, display, manager):
+        self.display = display
+        self.manager = manager
+        self.menu = manager.register(menus.AlertMenu(display, manager, self))
+        self.return_menu = None         # Menu that was up when the first unacknowledged alert arrived
+        self.wake = asyncio.ThreadSafeFlag()
+        # Indications from a connection that isn't a tipup are merged into this one entry
+        self.unknown = TipupDevice(None, "Unknown", None)
+        self.notified = 0
+        self.renders = 0
+
+    def tipup_for_handle(self, conn_handle):
+        return self.manager.links.get(conn_handle, self.unknown)
+
+    def notify_tipup(self, tipup):
+        tipup.record_alert(utime.ticks_ms())
+        self.notified += 1
+        self.wake.set()
+
+    def notify_link_lost(self, tipup):
+        """Put a tipup whose link couldn't be made again on the alert screen, it can't report a trip until it's back"""
+        tipup.record_alert(utime.ticks_ms())
+        self.wake.set()
+
+    def all_tipups(self):
+        yield from self.manager.connected_devices.values()
+        for tipup in self.manager.links.values():
+            # Connected but still being armed the first time
+            if tipup.address not in self.manager.connected_devices:
+                yield tipup
+        yield from self.manager.broadcast_devices.values()
+        yield self.unknown
+
+    def active_alerts(self):
+        """Unacknowledged tipups, oldest alert first"""
+        alerts = [tipup for tipup in self.all_tipups() if not tipup.alert_acknowledged]
+        alerts.sort(key=lambda tipup: tipup.alert_first_ms)
+        return alerts
+
+    def acknowledge(self):
+        for tipup in self.all_tipups():
+            tipup.acknowledge_alert()
+
+    def showing(self):
+        return self.manager.active_menu is self.menu
+
+    async def run(self):
+        next_flash = 0
+        next_draw = 0
+        pending = False     # Woken for alerts the screen doesn't show yet
+        while True:
+            if self.showing():
+                # Keep flashing on schedule even while a chattering flag keeps waking the task
+                now = utime.ticks_ms()
+                wait_ms = utime.ticks_diff(next_flash, now)
+                if wait_ms <= 0:
+                    self.menu.toggle_flash()
+                    next_flash = utime.ticks_add(utime.ticks_ms(), ALERT_FLASH_MS)
+                    continue
+                draw_ms = utime.ticks_diff(next_draw, now)
+                if not pending or draw_ms > 0:
+                    if pending:
+                        wait_ms = min(wait_ms, draw_ms)
+                    try:
+                        await asyncio.wait_for_ms(self.wake.wait(), wait_ms)
+                        pending = True
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+            elif not pending:
+                await self.wake.wait()
+            pending = False
+            if not self.active_alerts():
+                # Acknowledged before it was drawn, the trace begun for it would never finish
+                self.manager.latency.cancel()
+                continue
+            self.renders += 1
+            self.manager.latency.mark(latency_trace.STAGE_WAKE)
+            if self.showing():
+                await self.menu.draw_alerts()
+            else:
+                self.return_menu = self.manager.active_menu
+                await self.manager.set_active_menu(self.menu)
+                next_flash = utime.ticks_add(utime.ticks_ms(), ALERT_FLASH_MS)
+            next_draw = utime.ticks_add(utime.ticks_ms(), ALERT_REDRAW_MS)
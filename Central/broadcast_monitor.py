@@ -0,0 +1,52 @@
+import utime
+from tipup_device import TipupDevice, address_from_bytes, parse_broadcast, BROADCAST_COMPANY_ID, BROADCAST_FLAG_UP
+
+# A counter step above this is a tipup that rebooted (battery swap, brownout) and counts from 0 again
+BROADCAST_REBOOT_STEP = 128
+
+class BroadcastMonitor:
+    """Watches tipups in broadcast mode from their advertisements alone, no connection is made
+
+    observe() is registered with the BackgroundScanner. Each tipup is a TipupDevice in
+    manager.broadcast_devices, a change of its rolling trip counter raises one alert per trip through
+    the AlertScheduler. A counter that jumps back is a reboot and raises at most one
+    """
+    def __init__(self, manager, scheduler):
+        self.manager = manager
+        self.scheduler = scheduler
+        self.tipups = manager.broadcast_devices
+        self.adverts = 0
+        self.trips = 0
+
+    def observe(self, result):
+        for _, data in result.manufacturer(BROADCAST_COMPANY_ID):
+            decoded = parse_broadcast(data)
+            if decoded is None:
+                continue
+            device_id, flags, trips = decoded
+            addr = address_from_bytes(result.device.addr)
+            if addr in self.manager.connected_devices:
+                # Armed over GATT, its trips arrive as indications
+                return
+            self.adverts += 1
+            tipup = self.tipups.get(addr)
+            if tipup is None:
+                tipup = TipupDevice(None, result.name() or f"Tipup {device_id:04X}", addr)
+                tipup.status = "broadcast"
+                tipup.trip_counter = trips
+                self.tipups[addr] = tipup
+                new_trips = 1 if flags & BROADCAST_FLAG_UP else 0
+            else:
+                # The counter wraps at 256, no tipup trips anywhere near that often between two adverts heard
+                new_trips = (trips - tipup.trip_counter) & 0xFF
+                if new_trips > BROADCAST_REBOOT_STEP:
+                    # Far more than can happen between adverts, so the counter started over from 0: resync,
+                    # alerting once only if the flag is up
+                    tipup.reboots += 1
+                    new_trips = 1 if flags & BROADCAST_FLAG_UP else 0
+                tipup.trip_counter = trips
+            tipup.last_seen_ms = utime.ticks_ms()
+            for _ in range(new_trips):
+                self.trips += 1
+                self.scheduler.notify_tipup(tipup)
+            return
@@ -0,0 +1,99 @@
+import asyncio, utime
+from array import array
+
+class EventQueue:
+    """Fixed-size ring of one-byte event codes that can be filled from an IRQ handler"""
+    def __init__(self, size=16):
+        self.codes = bytearray(size)
+        self.head = 0   # Next slot the IRQ writes to
+        self.tail = 0   # Next slot the consumer reads from
+        self.dropped = 0
+        self.flag = asyncio.ThreadSafeFlag()
+
+    def push(self, code):
+        # Called from IRQ context, so no allocation here
+        next_head = (self.head + 1) % len(self.codes)
+        if next_head == self.tail:
+            self.dropped += 1
+        else:
+            self.codes[self.head] = code
+            self.head = next_head
+        self.flag.set()
+
+    def pending(self):
+        return (self.head - self.tail) % len(self.codes)
+
+    async def get(self):
+        """Wait for and return the oldest event code"""
+        while self.head == self.tail:
+            await self.flag.wait()
+        code = self.codes[self.tail]
+        self.tail = (self.tail + 1) % len(self.codes)
+        return code
+
+class IndicationQueue:
+    """Fixed-capacity ring of preallocated indication slots (conn handle, value handle, payload)"""
+    def __init__(self, capacity=8, width=20):
+        # One spare slot tells a full ring apart from an empty one without a shared counter
+        self.slots = capacity + 1
+        self.width = width
+        self.conn_handles = array('H', bytes(2 * self.slots))
+        self.value_handles = array('H', bytes(2 * self.slots))
+        self.lengths = bytearray(self.slots)
+        self.arrivals = array('L', [0] * self.slots)  # ticks_us() when each slot was filled
+        self.payloads = bytearray(self.slots * width)
+        view = memoryview(self.payloads)
+        self.views = [view[i * width:(i + 1) * width] for i in range(self.slots)]
+        self.head = 0
+        self.tail = 0
+
+        self.received = 0
+        self.dropped = 0    # Ring was full, event discarded
+        self.overflows = 0  # Payload longer than a slot, truncated
+        self.flag = asyncio.ThreadSafeFlag()
+
+    def push(self, conn_handle, value_handle, data):
+        # Called from the BLE IRQ: copies into the next slot without touching the heap
+        next_head = (self.head + 1) % self.slots
+        if next_head == self.tail:
+            self.dropped += 1
+            self.flag.set()
+            return
+
+        length = len(data)
+        if length > self.width:
+            self.overflows += 1
+            length = self.width
+        payloads = self.payloads
+        offset = self.head * self.width
+        for i in range(length):
+            payloads[offset + i] = data[i]
+
+        self.conn_handles[self.head] = conn_handle
+        self.value_handles[self.head] = value_handle
+        self.lengths[self.head] = length
+        self.arrivals[self.head] = utime.ticks_us()
+        self.head = next_head
+        self.received += 1
+        self.flag.set()
+
+    def pending(self):
+        return (self.head - self.tail) % self.slots
+
+    async def get(self):
+        """Wait for the oldest indication, returns (conn_handle, value_handle, payload)
+
+        The payload is a view into the slot and stays valid until release() is called
+        """
+        while self.head == self.tail:
+            await self.flag.wait()
+        i = self.tail
+        return self.conn_handles[i], self.value_handles[i], self.views[i][:self.lengths[i]]
+
+    def arrival_us(self):
+        """ticks_us() at which the slot returned by get() was pushed"""
+        return self.arrivals[self.tail]
+
+    def release(self):
+        """Hand the slot returned by get() back to the IRQ"""
+        self.tail = (self.tail + 1) % self.slots
@@ -0,0 +1,53 @@
+import json
+
+GATT_CACHE_FILE = "gatt_cache.json"
+
+# Bump whenever the tipup firmware's GATT table changes so every cached handle is discarded
+GATT_LAYOUT_VERSION = 1
+
+class GattCache:
+    """Discovered IO service handles per peripheral address, kept in flash between boots
+
+    Each entry is [name, service start, service end, characteristic end, value handle, properties, CCCD handle]
+    """
+    def __init__(self, path=GATT_CACHE_FILE, version=GATT_LAYOUT_VERSION):
+        self.path = path
+        self.version = version
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            if data.get("version") == self.version:
+                self.entries = data["devices"]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"GATT cache not loaded: { e }")
+
+    def save(self):
+        try:
+            with open(self.path, "w") as f:
+                json.dump({"version": self.version, "devices": self.entries}, f)
+        except OSError as e:
+            print(f"GATT cache not saved: { e }")
+
+    def get(self, addr, name):
+        entry = self.entries.get(addr)
+        # A renamed tipup has probably been reflashed, so its handles cannot be trusted
+        if entry is None or entry[0] != name:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def put(self, addr, name, service, characteristic, cccd):
+        self.entries[addr] = [name, service._start_handle, service._end_handle, characteristic._end_handle,
+                              characteristic._value_handle, characteristic.properties, cccd._value_handle]
+        self.save()
+
+    def remove(self, addr):
+        if self.entries.pop(addr, None) is not None:
+            self.save()
@@ -0,0 +1,69 @@
+import framebuf
+
+GLYPH_WIDTH = 5
+
+class GlyphCache:
+    def __init__(self, cmap, capacity=48):
+        self.capacity = capacity
+        self.glyphs = {}
+        self.tick = 0
+        self.hits = 0
+        self.misses = 0
+
+        # Convert the '0'/'1' strings once, one byte per glyph row with bit 4 as the leftmost pixel
+        self.bitmaps = []
+        for character in cmap:
+            rows = bytearray(len(character) // GLYPH_WIDTH)
+            for r in range(len(rows)):
+                rows[r] = int(character[r * GLYPH_WIDTH:(r + 1) * GLYPH_WIDTH], 2)
+            self.bitmaps.append(bytes(rows))
+
+        # Two-entry palette used to colour the 1-bpp glyphs while blitting: index 0 is the transparent key
+        self.palette = framebuf.FrameBuffer(bytearray(4), 2, 1, framebuf.RGB565)
+
+    def rasterize(self, index, size):
+        bitmap = self.bitmaps[index]
+        width = GLYPH_WIDTH * size
+        height = len(bitmap) * size
+        buf = bytearray(((width + 7) // 8) * height)
+        glyph = framebuf.FrameBuffer(buf, width, height, framebuf.MONO_HLSB)
+        for r in range(len(bitmap)):
+            row = bitmap[r]
+            for col in range(GLYPH_WIDTH):
+                if row & (1 << (GLYPH_WIDTH - 1 - col)):
+                    glyph.fill_rect(col * size, r * size, size, size, 1)
+        # Blitted in the tuple form so the target knows the glyph's size
+        return (buf, width, height, framebuf.MONO_HLSB)
+
+    def get(self, letter, size):
+        """Return [(buffer, width, height, format), height, last_used] for a character at the given scale"""
+        key = (ord(letter) << 2) | size
+        self.tick += 1
+        entry = self.glyphs.get(key)
+        if entry is not None:
+            self.hits += 1
+            entry[2] = self.tick
+            return entry
+
+        self.misses += 1
+        if len(self.glyphs) >= self.capacity:
+            # Evict the least recently used glyph
+            oldest = None
+            for k, e in self.glyphs.items():
+                if oldest is None or e[2] < self.glyphs[oldest][2]:
+                    oldest = k
+            del self.glyphs[oldest]
+
+        index = ord(letter) - 32  # start code, 32 or space
+        entry = [self.rasterize(index, size), len(self.bitmaps[index]) * size, self.tick]
+        self.glyphs[key] = entry
+        return entry
+
+    def draw(self, target, letter, xpos, ypos, size, c):
+        """Blit a character onto target in colour c, returns the glyph height in pixels"""
+        glyph, height, _ = self.get(letter, size)
+        key = c ^ 1
+        self.palette.pixel(0, 0, key)
+        self.palette.pixel(1, 0, c)
+        target.blit(glyph, xpos, ypos, key, self.palette)
+        return height
@@ -0,0 +1,123 @@
+import asyncio, gc, utime
+from array import array
+
+# Samples kept, the oldest is overwritten once the ring is full
+HEAP_SAMPLES = 32
+HEAP_SAMPLE_MS = 10000
+# Resolution of the largest block search, smaller costs more probe allocations per probe
+BLOCK_GRANULARITY = 256
+
+class HeapTelemetry:
+    """Periodic heap samples in a fixed ring plus the heap growth across menu transitions and connects
+
+    A largest allocatable block well below the free total means the heap is fragmented: an allocation that
+    size fails even though mem_free() says there is room. Finding it takes a collection per probe allocation,
+    milliseconds of stall, so periodic samples leave it out and only sample(probe=True) measures it
+    """
+    def __init__(self, size=HEAP_SAMPLES):
+        self.size = size
+        self.times = array('L', [0] * size)       # ticks_ms of each sample
+        self.free = array('L', [0] * size)
+        self.allocated = array('L', [0] * size)
+        self.largest = array('L', [0] * size)     # 0 for samples taken without the block probe
+        self.head = 0
+        self.count = 0
+        self.low_water = 0xFFFFFFFF             # Least free heap seen at any sample or measurement
+        # Label -> [count, bytes total, bytes max, collected], collected counts measurements a GC ran through
+        self.deltas = {}
+
+    def begin(self):
+        return gc.mem_alloc()
+
+    def end(self, label, before):
+        """Record the heap growth since begin() under label, e.g. a menu class name or "connect" """
+        delta = gc.mem_alloc() - before
+        entry = self.deltas.get(label)
+        if entry is None:
+            entry = self.deltas[label] = [0, 0, 0, 0]
+        entry[0] += 1
+        if delta < 0:
+            # A collection ran in between, the growth is unknown
+            entry[3] += 1
+        else:
+            entry[1] += delta
+            entry[2] = max(entry[2], delta)
+        self.low_water = min(self.low_water, gc.mem_free())
+
+    def largest_block(self, free):
+        """Largest bytearray that can be allocated right now, found by binary search"""
+        low, high = 0, free
+        while high - low > BLOCK_GRANULARITY:
+            size = (low + high) // 2
+            try:
+                block = bytearray(size)
+            except MemoryError:
+                high = size
+                continue
+            block = None
+            # Free the probe before the next, bigger one
+            gc.collect()
+            low = size
+        return low
+
+    def sample(self, probe=False):
+        if probe:
+            # Garbage still counted as allocated would hide the blocks it frees
+            gc.collect()
+        free = gc.mem_free()
+        head = self.head
+        self.times[head] = utime.ticks_ms()
+        self.free[head] = free
+        self.allocated[head] = gc.mem_alloc()
+        self.largest[head] = self.largest_block(free) if probe else 0
+        self.head = (head + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+        self.low_water = min(self.low_water, free)
+
+    def latest(self):
+        """(free, allocated, largest block, free at the probe) from the newest sample, None before the first
+
+        The last two come from the newest probed sample and are None if no sample in the ring was probed
+        """
+        if not self.count:
+            return None
+        last = (self.head - 1) % self.size
+        for i in range(self.count):
+            slot = (self.head - 1 - i) % self.size
+            if self.largest[slot]:
+                return self.free[last], self.allocated[last], self.largest[slot], self.free[slot]
+        return self.free[last], self.allocated[last], None, None
+
+    def samples(self):
+        # Oldest first
+        for i in range(self.count):
+            slot = (self.head - self.count + i) % self.size
+            yield self.times[slot], self.free[slot], self.allocated[slot], self.largest[slot]
+
+    def growth(self):
+        """(label, average bytes, max bytes, count) sorted by the largest single growth first"""
+        result = []
+        for label, (count, total, top, collected) in self.deltas.items():
+            measured = count - collected
+            result.append((label, total // measured if measured else 0, top, count))
+        result.sort(key=lambda entry: entry[2], reverse=True)
+        return result
+
+    def report(self):
+        latest = self.latest()
+        if latest is not None:
+            free, allocated, largest, _ = latest
+            print(f"Heap free { free } allocated { allocated } largest block { largest } low water { self.low_water }")
+        for label, average, top, count in self.growth():
+            print(f"  { label }: { count }x avg +{ average } max +{ top }")
+
+    def reset(self):
+        self.head = 0
+        self.count = 0
+        self.low_water = 0xFFFFFFFF
+        self.deltas = {}
+
+    async def run(self):
+        while True:
+            self.sample()
+            await asyncio.sleep_ms(HEAP_SAMPLE_MS)
@@ -0,0 +1,133 @@
+import utime
+from array import array
+
+# Stages of one fish-on, in order:
+#   tipup   flag IRQ to gatts_indicate() on the tipup, reported in the message
+#   air     one way over the link, half the round trip the tipup measured for its previous indication
+#   queue   MenuManager.ble_irq() to the dequeue in main.indication_task()
+#   wake    dequeue to AlertMenu drawing
+#   draw    drawing to the end of the first show() with the alert on it
+STAGES = ("tipup", "air", "queue", "wake", "draw", "total")
+STAGE_TIPUP = 0
+STAGE_AIR = 1
+STAGE_QUEUE = 2
+STAGE_WAKE = 3
+STAGE_DRAW = 4
+STAGE_COUNT = len(STAGES)
+TOTAL = STAGE_COUNT - 1
+
+# Upper bounds of the histogram buckets in microseconds, anything slower lands in the last bucket
+BUCKET_BOUNDS_US = (1000, 2000, 5000, 10000, 20000, 50000, 100000, 200000, 500000, 1000000)
+BUCKETS = len(BUCKET_BOUNDS_US) + 1
+# Stage values are kept within this, a longer one means the trace went wrong rather than the alert being that slow
+STAGE_LIMIT_US = 60000000
+# Largest value an array('L') slot holds
+SLOT_MAX = 0xFFFFFFFF
+
+def bounded(us):
+    return 0 if us < 0 else min(us, STAGE_LIMIT_US)
+
+class LatencyTrace:
+    """Fixed-bucket histograms of each fish-on stage, filled without allocating once created
+
+    Only one fish-on is traced at a time: alerts arriving while one is being drawn are merged into that redraw
+    """
+    def __init__(self):
+        self.counts = array('L', [0] * (STAGE_COUNT * BUCKETS))
+        self.minimum = array('L', [0xFFFFFFFF] * STAGE_COUNT)
+        self.maximum = array('L', [0] * STAGE_COUNT)
+        self.total_us = array('L', [0] * STAGE_COUNT)
+        self.samples = 0
+        # The trace in flight: stage durations so far and the tick the next stage started at
+        self.current = array('L', [0] * STAGE_COUNT)
+        self.active = False
+        self.stage_start = 0
+
+    def begin(self, tipup_us, air_us, irq_us):
+        """Start a trace at the dequeue, irq_us is when ble_irq() queued the indication"""
+        if self.active:
+            return
+        now = utime.ticks_us()
+        self.current[STAGE_TIPUP] = bounded(tipup_us)
+        self.current[STAGE_AIR] = bounded(air_us)
+        self.current[STAGE_QUEUE] = bounded(utime.ticks_diff(now, irq_us))
+        self.stage_start = now
+        self.active = True
+
+    def mark(self, stage):
+        """End stage, one of the STAGE_ constants, and start the next one"""
+        if not self.active:
+            return
+        now = utime.ticks_us()
+        self.current[stage] = bounded(utime.ticks_diff(now, self.stage_start))
+        self.stage_start = now
+
+    def cancel(self):
+        """Drop the trace in flight, e.g. the alert was acknowledged before it was drawn"""
+        self.active = False
+
+    def finish(self):
+        # Called once the first show() with the alert on it has returned
+        if not self.active:
+            return
+        self.mark(STAGE_DRAW)
+        total = 0
+        for stage in range(TOTAL):
+            total += self.current[stage]
+        self.current[TOTAL] = total
+        for stage in range(STAGE_COUNT):
+            self.add(stage, self.current[stage])
+        self.samples += 1
+        self.active = False
+
+    def add(self, stage, us):
+        bucket = 0
+        while bucket < BUCKETS - 1 and us > BUCKET_BOUNDS_US[bucket]:
+            bucket += 1
+        self.counts[stage * BUCKETS + bucket] += 1
+        self.total_us[stage] = min(self.total_us[stage] + us, SLOT_MAX)
+        if us < self.minimum[stage]:
+            self.minimum[stage] = us
+        if us > self.maximum[stage]:
+            self.maximum[stage] = us
+
+    def percentile(self, stage, fraction):
+        """Upper bound in microseconds of the bucket holding that fraction of samples, None with no samples"""
+        if not self.samples:
+            return None
+        wanted = fraction * self.samples
+        seen = 0
+        for bucket in range(BUCKETS):
+            seen += self.counts[stage * BUCKETS + bucket]
+            if seen >= wanted:
+                # The slowest sample is a tighter bound than the bucket edge
+                return min(BUCKET_BOUNDS_US[bucket], self.maximum[stage]) if bucket < BUCKETS - 1 else self.maximum[stage]
+        return self.maximum[stage]
+
+    def stats(self):
+        """{stage: (avg, p50, p90, max)} in microseconds"""
+        result = {}
+        for stage in range(STAGE_COUNT):
+            if self.samples:
+                result[STAGES[stage]] = (self.total_us[stage] // self.samples, self.percentile(stage, 0.5),
+                                         self.percentile(stage, 0.9), self.maximum[stage])
+        return result
+
+    def histogram(self, stage=TOTAL):
+        """Bucket counts of one stage, paired with each bucket's upper bound (None for the overflow bucket)"""
+        return [(BUCKET_BOUNDS_US[b] if b < BUCKETS - 1 else None, self.counts[stage * BUCKETS + b]) for b in range(BUCKETS)]
+
+    def report(self):
+        print(f"Fish-on latency, { self.samples } samples (us avg/p50/p90/max)")
+        for name, (avg, p50, p90, top) in self.stats().items():
+            print(f"  { name }: { avg }/{ p50 }/{ p90 }/{ top }")
+
+    def reset(self):
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+        for stage in range(STAGE_COUNT):
+            self.minimum[stage] = 0xFFFFFFFF
+            self.maximum[stage] = 0
+            self.total_us[stage] = 0
+        self.samples = 0
+        self.active = False
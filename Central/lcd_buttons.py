@@ -1,9 +1,23 @@
 from machine import Pin
+from event_queue import EventQueue
 import utime
 
+# Event codes pushed by the button IRQs, BUTTON_NAMES[code] is the name passed to MenuManager.button_pressed
+BUTTON_A = 0
+BUTTON_B = 1
+BUTTON_X = 2
+BUTTON_Y = 3
+BUTTON_UP = 4
+BUTTON_DOWN = 5
+BUTTON_LEFT = 6
+BUTTON_RIGHT = 7
+BUTTON_SELECT = 8
+
+BUTTON_NAMES = ("A", "B", "X", "Y", "UP", "DOWN", "LEFT", "RIGHT", "SELECT")
+
 class ButtonHandler:
     def __init__(self):
-        self.button_callbacks = {}
+        self.events = EventQueue()
 
         self.A_button= Pin(15,Pin.IN,Pin.PULL_UP)
         self.B_button = Pin(17,Pin.IN,Pin.PULL_UP)
@@ -15,73 +29,35 @@ class ButtonHandler:
         self.right_button = Pin(20,Pin.IN,Pin.PULL_UP)
         self.select_button = Pin(3,Pin.IN,Pin.PULL_UP)
 
-        self.A_button_pressed = False
-        self.B_button_pressed = False
-        self.X_button_pressed = False
-        self.Y_button_pressed = False
-        self.up_button_pressed = False
-        self.down_button_pressed = False
-        self.left_button_pressed = False
-        self.right_button_pressed = False
-        self.select_button_pressed = False
+        # Debounced per button so simultaneous presses on different buttons are all kept
+        self.last_times = [0] * len(BUTTON_NAMES)
+        self.debounce_limit = 300
 
         self.set_handlers()
 
-        self.new_time = 0
-        self.last_time = 0
-        self.debounce_limit = 300
-
-    def wait_time_has_elapsed(self):
-        self.new_time = utime.ticks_ms()
-        if (self.new_time - self.last_time > self.debounce_limit):
-            self.last_time = self.new_time
+    def wait_time_has_elapsed(self, code):
+        new_time = utime.ticks_ms()
+        if utime.ticks_diff(new_time, self.last_times[code]) > self.debounce_limit:
+            self.last_times[code] = new_time
             return True
         else:
             return False
 
-    def A_button_handler(self, pin):
-        if self.wait_time_has_elapsed():
-            self.A_button_pressed = True
-
-    def B_button_handler(self, pin):
-        if self.wait_time_has_elapsed():
-            self.B_button_pressed = True
-
-    def X_button_handler(self, pin):
-        if self.wait_time_has_elapsed:
-            self.X_button_pressed = True
-
-    def Y_button_handler(self, pin):
-        if self.wait_time_has_elapsed:
-            self.Y_button_pressed = True
-
-    def up_button_handler(self, pin):
-        if self.wait_time_has_elapsed:
-            self.up_button_pressed = True
-
-    def down_button_handler(self, pin):
-        if self.wait_time_has_elapsed:
-            self. down_button_pressed = True
-
-    def left_button_handler(self, pin):
-        if self.wait_time_has_elapsed:
-            self.left_button_pressed = True
-
-    def right_button_handler(self, pin):
-        if self.wait_time_has_elapsed:
-            self.right_button_pressed = True
-
-    def select_button_handler(self, pin):
-        if self.wait_time_has_elapsed:
-            self.select_button_pressed = True
+    def button_handler(self, code):
+        if self.wait_time_has_elapsed(code):
+            self.events.push(code)
 
     def set_handlers(self):
-        self.A_button.irq(trigger=Pin.IRQ_FALLING, handler = lambda pin: self.A_button_handler(pin))
-        self.B_button.irq(trigger=Pin.IRQ_FALLING, handler = lambda pin: self.B_button_handler(pin))
-        self.X_button.irq(trigger=Pin.IRQ_FALLING, handler = lambda pin: self.X_button_handler(pin))
-        self.Y_button.irq(trigger=Pin.IRQ_FALLING, handler = lambda pin: self.Y_button_handler(pin))
-        self.up_button.irq(trigger=Pin.IRQ_FALLING, handler = lambda pin: self.up_button_handler(pin))
-        self.down_button.irq(trigger=Pin.IRQ_FALLING, handler = lambda pin: self.down_button_handler(pin))
-        self.left_button.irq(trigger=Pin.IRQ_FALLING, handler = lambda pin: self.left_button_handler(pin))
-        self.right_button.irq(trigger=Pin.IRQ_FALLING, handler = lambda pin: self.right_button_handler(pin))
-        self.select_button.irq(trigger=Pin.IRQ_FALLING, handler = lambda pin: self.select_button_handler(pin))
\ No newline at end of file
+        self.A_button.irq(trigger=Pin.IRQ_FALLING, handler = lambda pin: self.button_handler(BUTTON_A))
+        self.B_button.irq(trigger=Pin.IRQ_FALLING, handler = lambda pin: self.button_handler(BUTTON_B))
+        self.X_button.irq(trigger=Pin.IRQ_FALLING, handler = lambda pin: self.button_handler(BUTTON_X))
+        self.Y_button.irq(trigger=Pin.IRQ_FALLING, handler = lambda pin: self.button_handler(BUTTON_Y))
+        self.up_button.irq(trigger=Pin.IRQ_FALLING, handler = lambda pin: self.button_handler(BUTTON_UP))
+        self.down_button.irq(trigger=Pin.IRQ_FALLING, handler = lambda pin: self.button_handler(BUTTON_DOWN))
+        self.left_button.irq(trigger=Pin.IRQ_FALLING, handler = lambda pin: self.button_handler(BUTTON_LEFT))
+        self.right_button.irq(trigger=Pin.IRQ_FALLING, handler = lambda pin: self.button_handler(BUTTON_RIGHT))
+        self.select_button.irq(trigger=Pin.IRQ_FALLING, handler = lambda pin: self.button_handler(BUTTON_SELECT))
+
+    async def get_button(self):
+        """Wait for the next button press and return its name"""
+        return BUTTON_NAMES[await self.events.get()]
@@ -1,8 +1,22 @@
 from machine import Pin, SPI, PWM
-import framebuf, gc
+import asyncio, framebuf, gc, machine, utime
+from glyph_cache import GlyphCache
+try:
+    import rp2
+except ImportError:
+    rp2 = None
+
+# Draw into a 4-bpp buffer of palette indexes instead of RGB565, rows are expanded through the palette as
+# they are sent. The UI only uses a handful of colours, and this frees 86 KB of RAM for connections
+PALETTE_MODE = False
+PALETTE_SIZE = 16
+# Rows expanded to RGB565 at a time while flushing in palette mode
+PALETTE_LINE_ROWS = 8
+RGB565_BUFFER_SIZE = 240*240*2
+PALETTE_BUFFER_SIZE = 240*240//2
 
 #This is important to keep at the module level to prevent memory allocation errors caused by memory fragmentation
-screen_buffer = bytearray(240*240*2)
+screen_buffer = bytearray(PALETTE_BUFFER_SIZE if PALETTE_MODE else RGB565_BUFFER_SIZE)
 
 # Pins used for display screen
 BL = 13  
@@ -12,6 +26,57 @@ MOSI = 11
 SCK = 10
 CS = 9
 
+# Damaged regions are merged into at most this many rectangles before show() sends them
+MAX_DIRTY_RECTS = 4
+
+# The compositor flushes at most once per frame, about 30 fps
+FRAME_MS = 33
+
+# The compositor streams each frame in bands of this many rows and lets other tasks run between them,
+# so the longest the event loop waits on the panel is one band (24 rows = 11.5 KB, ~1 ms at 100 MHz)
+ASYNC_FLUSH = True
+FLUSH_BAND_ROWS = 24
+# Full-width bands go out by DMA on the RP2040 while the CPU keeps running tasks, rp2.DMA needs v1.21+
+USE_DMA = True
+# SPI1 on the RP2040: TX DREQ, data register and status register with its busy bit
+SPI1_TX_DREQ = 18
+SPI1_SSPDR = 0x40040008
+SPI1_SSPSR = 0x4004000C
+SSPSR_BSY = 0x10
+
+# Bits of LCD_1inch3.modes_pending
+MODE_INVERT = 1
+MODE_IDLE = 2
+
+# Horizontal advance per character for each text size, lines advance by one and a half times this
+CHAR_SPACING = {1: 8, 2: 14, 3: 18}
+
+# Who asked for a flush, set LCD_1inch3.caller before drawing so show() can attribute its cost
+CALLER_MENU = 0
+CALLER_SPINNER = 1
+CALLER_ALERT = 2
+CALLER_NAMES = ("menu", "spinner", "alert")
+
+# ST7789 power-on sequence as (command, parameter count, parameters...) entries
+INIT_SEQUENCE = bytes((
+    0x36, 1, 0x70,                          # MADCTL
+    0x3A, 1, 0x05,                          # COLMOD, 16-bit colour
+    0xB2, 5, 0x0C, 0x0C, 0x00, 0x33, 0x33,  # Porch control
+    0xB7, 1, 0x35,                          # Gate control
+    0xBB, 1, 0x19,                          # VCOM
+    0xC0, 1, 0x2C,                          # LCM control
+    0xC2, 1, 0x01,                          # VDV/VRH enable
+    0xC3, 1, 0x12,                          # VRH
+    0xC4, 1, 0x20,                          # VDV
+    0xC6, 1, 0x0F,                          # Frame rate
+    0xD0, 2, 0xA4, 0xA1,                    # Power control
+    0xE0, 14, 0xD0, 0x04, 0x0D, 0x11, 0x13, 0x2B, 0x3F, 0x54, 0x4C, 0x18, 0x0D, 0x0B, 0x1F, 0x23,  # Positive gamma
+    0xE1, 14, 0xD0, 0x04, 0x0C, 0x11, 0x13, 0x2C, 0x3F, 0x44, 0x51, 0x2F, 0x1F, 0x1F, 0x20, 0x23,  # Negative gamma
+    0x21, 0,                                # Inversion on
+    0x11, 0,                                # Sleep out
+    0x29, 0,                                # Display on
+))
+
 class LCD_1inch3(framebuf.FrameBuffer):
     def __init__(self):
         self.width = 240
@@ -25,7 +90,62 @@ class LCD_1inch3(framebuf.FrameBuffer):
         self.dc = Pin(DC, Pin.OUT)
         self.dc(1)
         self.buffer = screen_buffer
-        super().__init__(self.buffer, self.width, self.height, framebuf.RGB565)
+        self.buffer_view = memoryview(self.buffer)
+        # Preallocated so commands and window updates do not allocate on every flush
+        self.cmd_buf = bytearray(1)
+        self.window_buf = bytearray(4)
+        if PALETTE_MODE:
+            self.row_bytes = self.width // 2
+            super().__init__(self.buffer, self.width, self.height, framebuf.GS4_HMSB)
+            # RGB565 value of each colour index, applied by blit() while rows are copied into the line buffer
+            self.palette = framebuf.FrameBuffer(bytearray(PALETTE_SIZE * 2), PALETTE_SIZE, 1, framebuf.RGB565)
+            self.palette_used = 0
+            self.line_buffer = bytearray(self.width * 2 * PALETTE_LINE_ROWS)
+            self.line_view = memoryview(self.line_buffer)
+            self.line_fb = framebuf.FrameBuffer(self.line_buffer, self.width, PALETTE_LINE_ROWS, framebuf.RGB565)
+            # Index 0 is black so the zeroed buffer starts out blank
+            self.palette_index(0)
+        else:
+            self.row_bytes = self.width * 2
+            super().__init__(self.buffer, self.width, self.height, framebuf.RGB565)
+
+        # Dirty rectangles stored as inclusive x0, y0, x1, y1 quads
+        self.dirty_rects = [0] * (MAX_DIRTY_RECTS * 4)
+        self.dirty_count = 0
+        # The running show_async()'s own copy, drawing between its bands dirties the next frame instead
+        self.flush_rects = [0] * (MAX_DIRTY_RECTS * 4)
+        self.flushing = False               # A show_async() owns flush_rects, later ones wait for flush_done
+        self.flush_done = asyncio.Event()
+        # Set from a band's window command to the end of its DMA transfer, while CS is low.
+        # show(), invert() and idle_mode() can't wait for it, they check it and defer instead
+        self.band_active = False
+        # Panel modes set while a band was going out, sent once it has finished
+        self.inverted = False
+        self.idle = False
+        self.modes_pending = 0      # MODE_INVERT | MODE_IDLE
+        self.dma = None
+        if USE_DMA and rp2 is not None:
+            try:
+                self.dma = rp2.DMA()
+                self.dma_ctrl = self.dma.pack_ctrl(size=0, inc_write=False, treq_sel=SPI1_TX_DREQ)
+            except Exception as e:
+                # Older firmware without rp2.DMA, the bands are written by the CPU instead
+                print(f"No DMA for the display: { e }")
+                self.dma = None
+        self.mark_dirty()
+
+        # Flush counters, cheap enough to stay on in production builds
+        self.caller = CALLER_MENU
+        self.caller_shows = [0] * len(CALLER_NAMES)
+        self.caller_bytes = [0] * len(CALLER_NAMES)
+        self.reset_stats()
+
+        # Compositor state, see request_show()
+        self.frame_requested = asyncio.ThreadSafeFlag()
+        self.frame_caller = None    # Caller of the first request since the last flush
+        self.last_frame = utime.ticks_ms()
+        self.compositor_task = None
+
         self.init_display()
         
         self.red = self.color(255, 0, 0)
@@ -143,108 +263,417 @@ class LCD_1inch3(framebuf.FrameBuffer):
         '01000001000010000010001000010001000', #}
         '01000101010001000000000000000000000' #}~
         ]
+        self.glyphs = GlyphCache(self.cmap)
 
-    def write_cmd(self, cmd):
+    def write_cmd(self, cmd, params=None):
+        """Send a command byte and its parameters in a single CS-low transaction"""
+        self.cmd_buf[0] = cmd
+        self.commands += 1
+        self.bytes_sent += 1
         self.cs(1)
         self.dc(0)
         self.cs(0)
-        self.spi.write(bytearray([cmd]))
-        self.cs(1)  
-
-    def write_data(self, buf):
-        self.cs(1)
-        self.dc(1)
-        self.cs(0)
-        self.spi.write(bytearray([buf]))
+        self.spi.write(self.cmd_buf)
+        if params:
+            self.dc(1)
+            self.spi.write(params)
+            self.bytes_sent += len(params)
         self.cs(1)
 
+    def run_sequence(self, table):
+        """Send a command table of (command, parameter count, parameters...) entries"""
+        view = memoryview(table)
+        i = 0
+        while i < len(table):
+            count = table[i + 1]
+            self.write_cmd(table[i], view[i + 2:i + 2 + count])
+            i += 2 + count
+
     def init_display(self):
         """Initialize display"""  
         self.rst(1)
         self.rst(0)
         self.rst(1)
-        
-        self.write_cmd(0x36)
-        self.write_data(0x70)
-        self.write_cmd(0x3A) 
-        self.write_data(0x05)
-        self.write_cmd(0xB2)
-        self.write_data(0x0C)
-        self.write_data(0x0C)
-        self.write_data(0x00)
-        self.write_data(0x33)
-        self.write_data(0x33)
-        self.write_cmd(0xB7)
-        self.write_data(0x35) 
-        self.write_cmd(0xBB)
-        self.write_data(0x19)
-        self.write_cmd(0xC0)
-        self.write_data(0x2C)
-        self.write_cmd(0xC2)
-        self.write_data(0x01)
-        self.write_cmd(0xC3)
-        self.write_data(0x12)   
-        self.write_cmd(0xC4)
-        self.write_data(0x20)
-        self.write_cmd(0xC6)
-        self.write_data(0x0F) 
-        self.write_cmd(0xD0)
-        self.write_data(0xA4)
-        self.write_data(0xA1)
-        self.write_cmd(0xE0)
-        self.write_data(0xD0)
-        self.write_data(0x04)
-        self.write_data(0x0D)
-        self.write_data(0x11)
-        self.write_data(0x13)
-        self.write_data(0x2B)
-        self.write_data(0x3F)
-        self.write_data(0x54)
-        self.write_data(0x4C)
-        self.write_data(0x18)
-        self.write_data(0x0D)
-        self.write_data(0x0B)
-        self.write_data(0x1F)
-        self.write_data(0x23)
-        self.write_cmd(0xE1)
-        self.write_data(0xD0)
-        self.write_data(0x04)
-        self.write_data(0x0C)
-        self.write_data(0x11)
-        self.write_data(0x13)
-        self.write_data(0x2C)
-        self.write_data(0x3F)
-        self.write_data(0x44)
-        self.write_data(0x51)
-        self.write_data(0x2F)
-        self.write_data(0x1F)
-        self.write_data(0x1F)
-        self.write_data(0x20)
-        self.write_data(0x23)
-        self.write_cmd(0x21)
-        self.write_cmd(0x11)
-        self.write_cmd(0x29)
+        self.run_sequence(INIT_SEQUENCE)
+
+    def mark_dirty(self, x=0, y=0, w=240, h=240):
+        """Record a region of the buffer that has to be sent on the next show()"""
+        x0 = max(x, 0)
+        y0 = max(y, 0)
+        x1 = min(x + w, self.width) - 1
+        y1 = min(y + h, self.height) - 1
+        if x1 < x0 or y1 < y0:
+            return
+
+        rects = self.dirty_rects
+        count = self.dirty_count
+        i = 0
+        while i < count:
+            o = i * 4
+            # Absorb any rectangle that overlaps or touches the new one, then rescan
+            if x0 <= rects[o + 2] + 1 and rects[o] <= x1 + 1 and y0 <= rects[o + 3] + 1 and rects[o + 1] <= y1 + 1:
+                x0 = min(x0, rects[o])
+                y0 = min(y0, rects[o + 1])
+                x1 = max(x1, rects[o + 2])
+                y1 = max(y1, rects[o + 3])
+                count -= 1
+                last = count * 4
+                rects[o] = rects[last]
+                rects[o + 1] = rects[last + 1]
+                rects[o + 2] = rects[last + 2]
+                rects[o + 3] = rects[last + 3]
+                i = 0
+            else:
+                i += 1
+
+        if count == MAX_DIRTY_RECTS:
+            # Out of slots, collapse everything into one bounding rectangle
+            for i in range(count):
+                o = i * 4
+                x0 = min(x0, rects[o])
+                y0 = min(y0, rects[o + 1])
+                x1 = max(x1, rects[o + 2])
+                y1 = max(y1, rects[o + 3])
+            count = 0
+
+        o = count * 4
+        rects[o] = x0
+        rects[o + 1] = y0
+        rects[o + 2] = x1
+        rects[o + 3] = y1
+        self.dirty_count = count + 1
+
+    def set_window(self, x0, y0, x1, y1):
+        window = self.window_buf
+        window[0] = x0 >> 8
+        window[1] = x0 & 0xFF
+        window[2] = x1 >> 8
+        window[3] = x1 & 0xFF
+        self.write_cmd(0x2A, window)
+
+        window[0] = y0 >> 8
+        window[1] = y0 & 0xFF
+        window[2] = y1 >> 8
+        window[3] = y1 & 0xFF
+        self.write_cmd(0x2B, window)
 
-    def show(self):
-        self.write_cmd(0x2A)
-        self.write_data(0x00)
-        self.write_data(0x00)
-        self.write_data(0x00)
-        self.write_data(0xef)
-        
-        self.write_cmd(0x2B)
-        self.write_data(0x00)
-        self.write_data(0x00)
-        self.write_data(0x00)
-        self.write_data(0xEF)
-        
         self.write_cmd(0x2C)
-        
+
+    def write_indexed(self, x0, y0, x1, y1):
+        """Expand rows of the 4-bpp buffer through the palette into the line buffer and send them"""
+        line_bytes = self.width * 2
+        span = (x1 - x0 + 1) * 2
+        y = y0
+        while y <= y1:
+            rows = min(PALETTE_LINE_ROWS, y1 - y + 1)
+            # Column x0 of row y lands at the line buffer's origin, blit() clips the rest of the frame
+            self.line_fb.blit(self, -x0, -y, -1, self.palette)
+            if span == line_bytes:
+                self.spi.write(self.line_view[:rows * line_bytes])
+            else:
+                for row in range(rows):
+                    self.spi.write(self.line_view[row * line_bytes:row * line_bytes + span])
+            y += rows
+
+    def flush_rect(self, x0, y0, x1, y1):
+        self.set_window(x0, y0, x1, y1)
+
+        self.dc(1)
+        self.cs(0)
+        row_bytes = self.row_bytes
+        if PALETTE_MODE:
+            self.write_indexed(x0, y0, x1, y1)
+        elif x0 == 0 and x1 == self.width - 1:
+            if y0 == 0 and y1 == self.height - 1:
+                self.spi.write(self.buffer)
+            else:
+                # Full-width band is contiguous in the buffer
+                self.spi.write(self.buffer_view[y0 * row_bytes:(y1 + 1) * row_bytes])
+        else:
+            start = y0 * row_bytes + x0 * 2
+            span = (x1 - x0 + 1) * 2
+            for _ in range(y1 - y0 + 1):
+                self.spi.write(self.buffer_view[start:start + span])
+                start += row_bytes
         self.cs(1)
+        self.bytes_sent += (x1 - x0 + 1) * (y1 - y0 + 1) * 2
+
+    def request_show(self):
+        """Flush on the compositor's next frame, every request made within one frame becomes a single show()
+
+        show() is still there for the few flushes that must reach the panel right away, like a new alert
+        """
+        self.show_requests += 1
+        if self.compositor_task is None:
+            # Nothing to coalesce with before the compositor runs, e.g. at boot
+            self.show()
+            return
+        if self.frame_caller is None:
+            self.frame_caller = self.caller
+        self.frame_requested.set()
+
+    def start_compositor(self):
+        if self.compositor_task is None:
+            self.compositor_task = asyncio.create_task(self.compositor())
+
+    async def compositor(self):
+        while True:
+            await self.frame_requested.wait()
+            # An isolated request goes out straight away, a run of them at the frame rate
+            wait_ms = utime.ticks_diff(utime.ticks_add(self.last_frame, FRAME_MS), utime.ticks_ms())
+            if wait_ms > 0:
+                await asyncio.sleep_ms(wait_ms)
+            if self.dirty_count:
+                caller = self.caller if self.frame_caller is None else self.frame_caller
+                if ASYNC_FLUSH:
+                    await self.show_async(caller)
+                else:
+                    self.caller, previous = caller, self.caller
+                    self.show()
+                    self.caller = previous
+            else:
+                self.frame_caller = None
+
+    def start_band(self, x0, y0, x1, y1):
+        """Open one band's window and CS transaction and send it, True while its DMA transfer is still running.
+        Each band has its own window, so a show() between bands can't interleave"""
+        self.band_active = True
+        self.set_window(x0, y0, x1, y1)
         self.dc(1)
         self.cs(0)
-        self.spi.write(self.buffer)
+        row_bytes = self.row_bytes
+        if PALETTE_MODE:
+            self.write_indexed(x0, y0, x1, y1)
+        elif x0 == 0 and x1 == self.width - 1:
+            band = self.buffer_view[y0 * row_bytes:(y1 + 1) * row_bytes]
+            if self.dma is not None:
+                self.dma.config(read=band, write=SPI1_SSPDR, count=len(band), ctrl=self.dma_ctrl, trigger=True)
+                return True
+            self.spi.write(band)
+        else:
+            start = y0 * row_bytes + x0 * 2
+            span = (x1 - x0 + 1) * 2
+            for _ in range(y1 - y0 + 1):
+                self.spi.write(self.buffer_view[start:start + span])
+                start += row_bytes
+        return False
+
+    def end_band(self, x0, y0, x1, y1):
         self.cs(1)
+        self.band_active = False
+        self.bytes_sent += (x1 - x0 + 1) * (y1 - y0 + 1) * 2
+        self.send_modes()
+
+    async def show_async(self, caller=None):
+        """show() in bands of FLUSH_BAND_ROWS, yielding to the event loop after each one
+
+        Bands are started and finished by plain methods and the waits are sleep_ms(0), so nothing is allocated
+        per band. A second call, like the alert's, waits for this one and then sends everything drawn meanwhile
+        """
+        while self.flushing:
+            await self.flush_done.wait()
+        self.frame_caller = None
+        count = self.dirty_count
+        if count == 0:
+            return
+        self.flushing = True
+        self.flush_done.clear()
+        start = utime.ticks_us()
+        sent = self.bytes_sent
+        rects = self.flush_rects
+        dirty = self.dirty_rects
+        for i in range(count * 4):
+            rects[i] = dirty[i]
+        self.dirty_count = 0
+        try:
+            for i in range(count):
+                o = i * 4
+                x0, y0, x1, y1 = rects[o], rects[o + 1], rects[o + 2], rects[o + 3]
+                while y0 <= y1:
+                    band_end = min(y0 + FLUSH_BAND_ROWS - 1, y1)
+                    if self.start_band(x0, y0, x1, band_end):
+                        while self.dma.active():
+                            await asyncio.sleep_ms(0)
+                        # The last bytes are still in the SPI FIFO when the DMA channel finishes
+                        while machine.mem32[SPI1_SSPSR] & SSPSR_BSY:
+                            pass
+                    self.end_band(x0, y0, x1, band_end)
+                    y0 = band_end + 1
+                    await asyncio.sleep_ms(0)
+        finally:
+            if self.band_active:
+                # Cancelled during a band: stop the transfer, the panel drops a RAMWR cut short when CS goes high
+                if self.dma is not None:
+                    self.dma.active(0)
+                self.cs(1)
+                self.band_active = False
+            self.flushing = False
+            self.flush_done.set()
+        self.record_flush(start, sent, self.caller if caller is None else caller)
+
+    def show(self):
+        """Send only the damaged regions of the buffer to the panel"""
+        if self.dirty_count == 0:
+            self.frame_caller = None
+            return
+        if self.band_active:
+            # A band is going out, the compositor sends this damage with its next frame instead
+            if self.frame_caller is None:
+                self.frame_caller = self.caller
+            self.frame_requested.set()
+            return
+        self.frame_caller = None
+        start = utime.ticks_us()
+        sent = self.bytes_sent
+        rects = self.dirty_rects
+        for i in range(self.dirty_count):
+            o = i * 4
+            self.flush_rect(rects[o], rects[o + 1], rects[o + 2], rects[o + 3])
+        self.dirty_count = 0
+        self.record_flush(start, sent, self.caller)
+
+    def record_flush(self, start, sent, caller):
+        duration = utime.ticks_diff(utime.ticks_us(), start)
+        self.show_count += 1
+        self.flush_us_total += duration
+        if duration < self.flush_us_min:
+            self.flush_us_min = duration
+        if duration > self.flush_us_max:
+            self.flush_us_max = duration
+        self.caller_shows[caller] += 1
+        self.caller_bytes[caller] += self.bytes_sent - sent
+        self.last_frame = utime.ticks_ms()
+
+    def reset_stats(self):
+        self.show_count = 0
+        self.show_requests = 0
+        self.bytes_sent = 0
+        self.commands = 0
+        self.flush_us_min = 0x3FFFFFFF
+        self.flush_us_max = 0
+        self.flush_us_total = 0
+        for i in range(len(CALLER_NAMES)):
+            self.caller_shows[i] = 0
+            self.caller_bytes[i] = 0
+
+    def stats(self):
+        """Snapshot of the flush counters, per-caller entries are (shows, bytes)"""
+        count = self.show_count
+        return {
+            "shows": count,
+            "requests": self.show_requests,
+            "bytes": self.bytes_sent,
+            "commands": self.commands,
+            "flush_us_min": self.flush_us_min if count else 0,
+            "flush_us_avg": self.flush_us_total // count if count else 0,
+            "flush_us_max": self.flush_us_max,
+            "callers": {name: (self.caller_shows[i], self.caller_bytes[i]) for i, name in enumerate(CALLER_NAMES)},
+        }
+
+    def invert(self, inverted):
+        """Flip the whole panel's colours with a single command, the frame buffer is untouched"""
+        self.inverted = inverted
+        self.modes_pending |= MODE_INVERT
+        self.send_modes()
+
+    def idle_mode(self, idle):
+        """Switch the panel to its 8-colour idle mode (0x39) or back to full colour (0x38)"""
+        self.idle = idle
+        self.modes_pending |= MODE_IDLE
+        self.send_modes()
+
+    def send_modes(self):
+        # Not in the middle of a band, show_async() calls this again after each one
+        if not self.modes_pending or self.band_active:
+            return
+        if self.modes_pending & MODE_INVERT:
+            # This panel needs INVON (0x21) for correct colours, so INVOFF (0x20) gives the inverted look
+            self.write_cmd(0x20 if self.inverted else 0x21)
+        if self.modes_pending & MODE_IDLE:
+            self.write_cmd(0x39 if self.idle else 0x38)
+        self.modes_pending = 0
+
+    def palette_index(self, value):
+        """Index of an RGB565 value in the palette, adding it if it isn't there yet"""
+        for index in range(self.palette_used):
+            if self.palette.pixel(index, 0) == value:
+                return index
+        if self.palette_used == PALETTE_SIZE:
+            raise ValueError("Palette full")
+        index = self.palette_used
+        self.palette.pixel(index, 0, value)
+        self.palette_used += 1
+        return index
+
+    def swap_palette(self, a, b):
+        """Exchange the colours of two palette indexes, every pixel drawn with them changes without a redraw"""
+        palette = self.palette
+        value = palette.pixel(a, 0)
+        palette.pixel(a, 0, palette.pixel(b, 0))
+        palette.pixel(b, 0, value)
+        self.mark_dirty()
+
+    def fill(self, c):
+        super().fill(c)
+        self.mark_dirty()
+
+    def fill_rect(self, x, y, w, h, c):
+        super().fill_rect(x, y, w, h, c)
+        self.mark_dirty(x, y, w, h)
+
+    # Every drawing primitive records what it touched, anything drawn without marking would never reach the panel
+    def pixel(self, x, y, c=None):
+        if c is None:
+            return super().pixel(x, y)
+        super().pixel(x, y, c)
+        self.mark_dirty(x, y, 1, 1)
+
+    def hline(self, x, y, w, c):
+        super().hline(x, y, w, c)
+        self.mark_dirty(x, y, w, 1)
+
+    def vline(self, x, y, h, c):
+        super().vline(x, y, h, c)
+        self.mark_dirty(x, y, 1, h)
+
+    def rect(self, x, y, w, h, c, f=False):
+        super().rect(x, y, w, h, c, f)
+        self.mark_dirty(x, y, w, h)
+
+    def line(self, x0, y0, x1, y1, c):
+        super().line(x0, y0, x1, y1, c)
+        self.mark_dirty(min(x0, x1), min(y0, y1), abs(x1 - x0) + 1, abs(y1 - y0) + 1)
+
+    def ellipse(self, x, y, xr, yr, c, f=False, m=0xF):
+        super().ellipse(x, y, xr, yr, c, f, m)
+        self.mark_dirty(x - xr, y - yr, 2 * xr + 1, 2 * yr + 1)
+
+    def poly(self, x, y, coords, c, f=False):
+        super().poly(x, y, coords, c, f)
+        # coords holds x, y pairs relative to x, y
+        x0 = x1 = coords[0]
+        y0 = y1 = coords[1]
+        for i in range(2, len(coords), 2):
+            x0 = min(x0, coords[i])
+            x1 = max(x1, coords[i])
+            y0 = min(y0, coords[i + 1])
+            y1 = max(y1, coords[i + 1])
+        self.mark_dirty(x + x0, y + y0, x1 - x0 + 1, y1 - y0 + 1)
+
+    def text(self, s, x, y, c=1):
+        super().text(s, x, y, c)
+        self.mark_dirty(x, y, 8 * len(s), 8)
+
+    def scroll(self, xstep, ystep):
+        super().scroll(xstep, ystep)
+        self.mark_dirty()
+
+    def blit(self, fbuf, x, y, key=-1, palette=None):
+        # A FrameBuffer doesn't expose its size, so sources come as (buffer, width, height, format) to know the damage
+        if not isinstance(fbuf, (tuple, list)):
+            raise TypeError("blit() onto the display needs a (buffer, width, height, format) source")
+        super().blit(fbuf, x, y, key, palette)
+        self.mark_dirty(x, y, fbuf[1], fbuf[2])
 
     def color(self, R, G, B):
         rp = int(R * 31 / 255)
@@ -265,37 +694,17 @@ class LCD_1inch3(framebuf.FrameBuffer):
         bp = max(0, bp)
         b = bp * 256
         
+        if PALETTE_MODE:
+            return self.palette_index(r + g + b)
         return r + g + b
 
     def printchar(self, letter, xpos, ypos, size, charupdate, c=None):
         if c is None:
             c = self.white
-        origin = xpos
-        charval = ord(letter)
-        index = charval - 32  # start code, 32 or space
-        character = self.cmap[index]
-        rows = [character[i:i+5] for i in range(0, len(character), 5)]
-        
-        for row in rows:
-            for bit in row:
-                if bit == '1':
-                    self.pixel(xpos, ypos, c)
-                    if size == 2:
-                        self.pixel(xpos, ypos + 1, c)
-                        self.pixel(xpos + 1, ypos, c)
-                        self.pixel(xpos + 1, ypos + 1, c)
-                    if size == 3:
-                        self.pixel(xpos + 1, ypos + 2, c)
-                        self.pixel(xpos + 2, ypos + 1, c)
-                        self.pixel(xpos + 2, ypos + 2, c)
-                        self.pixel(xpos, ypos + 2, c)
-                        self.pixel(xpos, ypos + 1, c)
-                        self.pixel(xpos + 1, ypos, c)
-                xpos += size
-            xpos = origin
-            ypos += size
+        # The blit marks the glyph's area dirty
+        self.glyphs.draw(self, letter, xpos, ypos, size, c)
         if charupdate:
-            self.show()
+            self.request_show()
 
     def delchar(self, xpos, ypos, size, delupdate):
         charwidth = size * 5
@@ -303,7 +712,7 @@ class LCD_1inch3(framebuf.FrameBuffer):
         c = self.bg_color # Background colour
         self.fill_rect(xpos, ypos, charwidth, charheight, c)  # xywh
         if delupdate:
-            self.show()
+            self.request_show()
 
     def move_cursor(self, x, y):
         self.cursor_x = x
@@ -313,7 +722,7 @@ class LCD_1inch3(framebuf.FrameBuffer):
         if color is None:
             color = self.white
 
-        spacing = {1: 8, 2: 14, 3: 18}.get(size, 8)
+        spacing = CHAR_SPACING.get(size, 8)
         if clearscreen:
             self.clear()
         for i in string:
@@ -325,7 +734,7 @@ class LCD_1inch3(framebuf.FrameBuffer):
                 self.cursor_x = 0
                 self.cursor_y += spacing + int(spacing / 2)
         if strupdate:
-            self.show()
+            self.request_show()
         if newline:
             self.cursor_x = 0
             self.cursor_y += spacing + int(spacing / 2)
@@ -334,4 +743,4 @@ class LCD_1inch3(framebuf.FrameBuffer):
         self.fill(self.bg_color)
         self.cursor_x = 0
         self.cursor_y = 0
-        self.show()
\ No newline at end of file
+        self.request_show()
\ No newline at end of file
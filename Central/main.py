@@ -1,64 +1,70 @@
-import lcd_screen, lcd_buttons, menus
-import asyncio, gc
+import lcd_screen, lcd_buttons, menus, tipup_protocol
+from alert_scheduler import AlertScheduler
+from broadcast_monitor import BroadcastMonitor
+import asyncio
 
 
 buttons = lcd_buttons.ButtonHandler()
-menu_manager = menus.MenuManager()
 display = lcd_screen.LCD_1inch3()
+menu_manager = menus.MenuManager(display)
+alert_scheduler = AlertScheduler(display, menu_manager)
+menu_manager.on_link_lost = alert_scheduler.notify_link_lost
 
-def gc_test():
-    free = gc.mem_free()
-    used = gc.mem_alloc()
-    print("Free memory:", free)
-    print("Allocated memory:", used)
-    print(f"Used { int(used/(free + used)*100) }% of total memory")
+# Watch tipups in broadcast mode through the background scan, no connection slots needed
+BROADCAST_MONITOR = True
+if BROADCAST_MONITOR:
+    menu_manager.broadcast_monitor = BroadcastMonitor(menu_manager, alert_scheduler)
+    menu_manager.scanner.observers.append(menu_manager.broadcast_monitor.observe)
 
-async def check_input():
-    if buttons.A_button_pressed:
-        await menu_manager.button_pressed("A")
-        buttons.A_button_pressed = False
-    elif buttons.B_button_pressed:
-        await menu_manager.button_pressed("B")
-        buttons.B_button_pressed = False
-    elif buttons.X_button_pressed:
-        await menu_manager.button_pressed("X")
-        gc_test()
-        buttons.X_button_pressed = False
-    elif buttons.Y_button_pressed:
-        await menu_manager.button_pressed("Y")
-        buttons.Y_button_pressed = False
-    elif buttons.up_button_pressed:
-        await menu_manager.button_pressed("UP")
-        buttons.up_button_pressed = False
-    elif buttons.down_button_pressed:
-        await menu_manager.button_pressed("DOWN")
-        buttons.down_button_pressed = False
-    elif buttons.left_button_pressed:
-        await menu_manager.button_pressed("LEFT")
-        buttons.left_button_pressed = False
-    elif buttons.right_button_pressed:
-        await menu_manager.button_pressed("RIGHT")
-        buttons.right_button_pressed = False
-    elif buttons.select_button_pressed:
-        await menu_manager.button_pressed("SELECT")
-        buttons.select_button_pressed = False
-
-async def run():
-    main_menu = menus.MainMenu(display, menu_manager)
-    await menu_manager.set_active_menu(main_menu)
+async def input_task():
+    # Sleeps until a button IRQ queues an event, presses are handled in the order they arrived
+    while True:
+        button = await buttons.get_button()
+        await menu_manager.button_pressed(button)
+        if button == "X":
+            menu_manager.heap.sample(probe=True)
+            menu_manager.heap.report()
 
+async def indication_task():
+    indications = menu_manager.indications
     while True:
-        if len(menu_manager.indication_buffer) > 0:
-            for i in menu_manager.indication_buffer:
-                conn_handle, val_handle, val = i
-                print("####[Indication Received]####")
-                print(f"Connection Handle: { conn_handle }")
-                print(f"Value Handle: { val_handle }")
-                print(f"Value: { val }")
-                del menu_manager.indication_buffer[0]
-                await menu_manager.set_active_menu(menus.AlertMenu(display, menu_manager))
+        conn_handle, val_handle, val = await indications.get()
+        # Decoded straight from the ring slot, which is free again right after
+        message = tipup_protocol.unpack(val)
+        arrived_us = indications.arrival_us()
+        indications.release()
+        print("####[Indication Received]####")
+        print(f"Connection Handle: { conn_handle }")
+        print(f"Value Handle: { val_handle }")
+        print(f"Message: { message }")
+        if indications.dropped:
+            print(f"Indications dropped: { indications.dropped }")
 
-        await check_input()
-        await asyncio.sleep(0.01)
+        tipup = alert_scheduler.tipup_for_handle(conn_handle)
+        if message is not None:
+            _, event, seq, uptime_ms, flags, battery, delay_us, rtt_us = message
+            if not tipup.record_message(event, seq, uptime_ms, flags, battery) or event != tipup_protocol.EVENT_TRIP:
+                continue
+            if tipup.missed_events:
+                print(f"Missed events from { tipup.name }: { tipup.missed_events }")
+            menu_manager.latency.begin(delay_us, rtt_us // 2, arrived_us)
+        else:
+            menu_manager.latency.begin(0, 0, arrived_us)
+        # The scheduler's own task draws the alert, repeats only update the same screen
+        alert_scheduler.notify_tipup(tipup)
+
+async def run():
+    display.start_compositor()
+    await menu_manager.set_active_menu(menu_manager.menu(menus.MainMenu))
+    asyncio.create_task(input_task())
+    asyncio.create_task(alert_scheduler.run())
+    # Always scanning at a low duty cycle, the device picker and broadcast tipups both read from it
+    menu_manager.scanner.start()
+    asyncio.create_task(menu_manager.link_profile_task())
+    asyncio.create_task(menu_manager.link_watch_task())
+    asyncio.create_task(menu_manager.heap.run())
+    await indication_task()
 
-asyncio.run(run())
\ No newline at end of file
+# main.py runs as __main__ on the board, the guard lets the simulation import it without starting
+if __name__ == "__main__":
+    asyncio.run(run())
\ No newline at end of file
@@ -1,15 +1,86 @@
-import aioble, asyncio, gc
+import aioble, asyncio, utime
+import lcd_screen, widgets, tipup_protocol
 from bluetooth import UUID
-from tipup_device import TipupDevice
+from tipup_device import TipupDevice, ScannedDevice, IO_SERVICE_UUID, IO_CHARACTERISTIC_UUID, address_from_bytes
+from event_queue import IndicationQueue
+from gatt_cache import GattCache
+from scanner import BackgroundScanner
+import latency_trace
+from latency_trace import LatencyTrace
+from heap_telemetry import HeapTelemetry
+
+# Matches MAX_NR_HCI_CONNECTIONS in the custom firmware build, see readme.txt
+MAX_CONNECTIONS = 3
+
+# Per-stage timeouts for the connect pipeline
+CONNECT_TIMEOUT_MS = 5000
+DISCOVERY_TIMEOUT_MS = 2000
+SUBSCRIBE_TIMEOUT_MS = 2000
+# A link dropped to change its profile is made again this many times, the wait between attempts grows by the backoff
+RECONNECT_ATTEMPTS = 3
+RECONNECT_BACKOFF_MS = 1000
+# After that the tipup is shown as lost and retried at this slower pace until it's back
+LINK_LOST_RETRY_MS = 30000
+
+# Connection parameters per link: (min interval us, max interval us, slave latency, supervision timeout ms).
+# MicroPython can only ask for the interval when connecting, latency and timeout are what we would ask for and
+# are compared with what the controller reports in _IRQ_CONNECTION_UPDATE
+LINK_PROFILES = {
+    "alert-critical": (7500, 15000, 0, 4000),
+    "idle": (100000, 200000, 4, 6000),
+}
+PROFILE_ACTIVE = "alert-critical"
+PROFILE_IDLE = "idle"
+# No button pressed for this long moves every link to the idle profile
+RECEIVER_IDLE_MS = 120000
+
+# How long the device picker keeps the background scanner at full duty
+PICKER_SCAN_MS = 5000
+
+# How AlertMenu flashes: panel inversion costs one command byte per toggle, the border fallback repaints
+# and flushes only a frame around the screen edge. With lcd_screen.PALETTE_MODE the palette flash swaps
+# two colours without drawing anything, the whole frame is sent again. The panel's idle mode is no use
+# here, its 8 colours leave the cyan, black and green of this screen as they are
+ALERT_FLASH_INVERT = 0
+ALERT_FLASH_BORDER = 1
+ALERT_FLASH_PALETTE = 2
+ALERT_FLASH_MODE = ALERT_FLASH_INVERT
+ALERT_BORDER = 12
+# Tipup names listed on the alert screen, the last line becomes "+N more" when there are more
+ALERT_LINES = 3
+
+# DiagnosticsMenu pages, LEFT/RIGHT flips between them
+DIAGNOSTICS_PAGES = ("Display", "Latency", "Heap")
+
+CCCD_UUID = UUID(0x2902)
+CCCD_INDICATE = b'\x02\x00'
 
 class MenuManager:
-    def __init__(self):
+    def __init__(self, display):
+        self.display = display
         self.previous_menu = None
         self.active_menu = None
+        # One long-lived instance per menu class, navigating re-enters them instead of allocating new ones
+        self.menus = {}
 
         #Testing below
-        self.indication_buffer = []
+        self.indications = IndicationQueue()
         self.connected_devices = {}
+        # conn_handle -> TipupDevice from the moment connect() returns, before it is armed, so indications a tipup
+        # sends straight away are matched to it
+        self.links = {}
+        self.broadcast_devices = {}     # Tipups only heard through their advertisements
+        self.broadcast_monitor = None   # BroadcastMonitor, when the receiver watches broadcast tipups
+        self.scanner = BackgroundScanner(self)
+        # Only one connection can be pending in the controller at a time, later stages run concurrently
+        self.connect_lock = asyncio.Lock()
+        self.gatt_cache = GattCache()
+        self.link_profile = PROFILE_ACTIVE
+        self.latency = LatencyTrace()           # Flag trip to alert on screen, see latency_trace.STAGES
+        self.heap = HeapTelemetry()             # Heap samples and growth per menu transition and connect
+        self.activity = asyncio.ThreadSafeFlag()    # Set on every button press
+        self.on_link_lost = None                # Called with a TipupDevice whose link couldn't be made again
+        self.link_dropped = asyncio.ThreadSafeFlag()    # Set from the IRQ when an armed tipup's link drops
         aioble.core.register_irq_handler(self.ble_irq, None)
 
     def ble_irq(self, event, data):
@@ -20,23 +91,244 @@ class MenuManager:
         #_IRQ_PERIPHERAL_DISCONNECT
         elif event == 8:
             conn_handle, addr_type, addr = data
-            pass
+            tipup = self.links.pop(conn_handle, None)
+            if tipup is not None and tipup.status == "armed":
+                # Nothing here dropped it, the tipup went out of range or ran flat. link_watch_task() reports it
+                tipup.status = "dropped"
+                self.link_dropped.set()
         #_IRQ_GATTC_INDICATE
         elif event == 19:
             conn_handle, val_handle, val = data
-            self.indication_buffer.append((conn_handle, val_handle, bytes(val)))
+            self.indications.push(conn_handle, val_handle, val)
+        #_IRQ_CONNECTION_UPDATE
+        elif event == 27:
+            conn_handle, conn_interval, conn_latency, supervision_timeout, status = data
+            tipup = self.links.get(conn_handle)
+            if tipup is not None:
+                # Units of 1.25 ms and 10 ms on the air
+                tipup.conn_interval_us = conn_interval * 1250
+                tipup.conn_latency = conn_latency
+                tipup.supervision_timeout_ms = supervision_timeout * 10
+                tipup.conn_updates += 1
     
+    def register(self, menu):
+        """Pool a menu built elsewhere, e.g. the AlertMenu owned by AlertScheduler"""
+        self.menus[type(menu)] = menu
+        return menu
+
+    def menu(self, menu_class, *args):
+        """The pooled instance of menu_class, entered afresh with args
+
+        Returned from handle_input() to navigate. A menu that is only being shown again, like the one
+        an alert interrupted, is passed to set_active_menu() as it is and keeps its state
+        """
+        menu = self.menus.get(menu_class)
+        if menu is None:
+            menu = self.register(menu_class(self.display, self))
+        menu.enter(*args)
+        return menu
+
     async def set_active_menu(self, menu):
         #Only assigns current active_menu to previous_menu if it isn't None type, or the same type as the incoming menu
         if self.active_menu is not None and not isinstance(self.active_menu, type(menu)):
             self.previous_menu = self.active_menu
+        before = self.heap.begin()
         if self.active_menu != None:
             self.active_menu.exit()
         self.active_menu = menu
         await menu.draw_menu()
-        gc.collect()
+        self.heap.end(type(menu).__name__, before)
+
+    async def connect_device(self, name, device):
+        """Connect, discover and subscribe to one scanned device, the outcome is recorded in its TipupDevice"""
+        addr = address_from_bytes(device.addr)
+        tipup = self.connected_devices.get(addr)
+        if tipup is not None and tipup.status == "armed":
+            return tipup
+
+        if tipup is None:
+            tipup = TipupDevice(None, name, addr)
+        else:
+            # Reconnecting a known tipup keeps its alert state
+            tipup.connection = None
+            tipup.io_characteristic = None
+            tipup.error = None
+        tipup.status = "connecting"
+        tipup.profile = self.link_profile
+        min_interval_us, max_interval_us, _, _ = LINK_PROFILES[tipup.profile]
+        start = utime.ticks_ms()
+        heap_before = self.heap.begin()
+        try:
+            tipup.stage = "connect"
+            async with self.connect_lock:
+                # The controller can't connect while the background scanner is running
+                scanning = self.scanner.task is not None and not self.scanner.task.done()
+                await self.scanner.stop()
+                try:
+                    tipup.connection = await device.connect(timeout_ms=CONNECT_TIMEOUT_MS, min_conn_interval_us=min_interval_us, max_conn_interval_us=max_interval_us)
+                finally:
+                    if scanning:
+                        self.scanner.start()
+            tipup.connection_handle = tipup.connection._conn_handle
+            # The tipup indicates trips it queued as soon as it is connected, before discovery and the CCCD write
+            self.links[tipup.connection_handle] = tipup
+
+            entry = self.gatt_cache.get(addr, name)
+            if entry is not None:
+                tipup.stage = "subscribe"
+                try:
+                    tipup.io_characteristic = await self.subscribe_cached(tipup.connection, entry)
+                except Exception as e:
+                    # Stale or wrong handles, forget them and fall back to a full discovery
+                    print(f"Cached handles failed for { name }: { e }")
+                    self.gatt_cache.remove(addr)
+                    tipup.io_characteristic = None
+
+            if tipup.io_characteristic is None:
+                await self.discover_and_subscribe(tipup)
+            tipup.stage = "mtu"
+            try:
+                tipup.mtu = await tipup.connection.exchange_mtu(tipup_protocol.PROTOCOL_MTU, timeout_ms=SUBSCRIBE_TIMEOUT_MS)
+            except Exception as e:
+                # Messages fit the default MTU, a tipup that won't negotiate still works
+                print(f"MTU exchange with { name } failed: { e }")
+            tipup.status = "armed"
+            self.connected_devices[addr] = tipup
+            # Seen advertising before it was armed, from now on its trips arrive as indications
+            self.broadcast_devices.pop(addr, None)
+        except Exception as e:
+            tipup.status = "failed"
+            tipup.error = f"{ tipup.stage }: { e }"
+            print(f"Error arming { name }: { tipup.error }")
+            if tipup.connection is not None:
+                await self.disconnect(tipup)
+                self.links.pop(tipup.connection_handle, None)
+        tipup.arm_ms = utime.ticks_diff(utime.ticks_ms(), start)
+        self.heap.end("connect", heap_before)
+        return tipup
+
+    async def renegotiate(self, tipup):
+        """Move an armed tipup to the current link profile
+
+        There is no connection update call in MicroPython, so the link is dropped and made again with the new
+        interval. The GATT cache keeps that to a connect and one CCCD write, and the tipup queues trips meanwhile
+        """
+        if tipup.status != "armed" or tipup.profile == self.link_profile:
+            return
+        print(f"Link profile for { tipup.name }: { tipup.profile } -> { self.link_profile }")
+        device = tipup.connection.device
+        tipup.status = "renegotiating"
+        await self.disconnect(tipup)
+        await self.reconnect(tipup, device)
+
+    async def disconnect(self, tipup):
+        try:
+            await tipup.connection.disconnect()
+        except Exception as e:
+            # Already gone or the controller timed out, a new link replaces it either way
+            print(f"Disconnect from { tipup.name } failed: { e }")
+
+    async def reconnect(self, tipup, device):
+        """Make a dropped link again, a tipup still not armed after RECONNECT_ATTEMPTS is reported lost"""
+        for attempt in range(RECONNECT_ATTEMPTS):
+            if attempt:
+                await asyncio.sleep_ms(RECONNECT_BACKOFF_MS * attempt)
+            await self.connect_device(tipup.name, device)
+            if tipup.status == "armed":
+                return True
+        self.link_lost(tipup, device)
+        return False
+
+    def link_lost(self, tipup, device):
+        tipup.status = "lost"
+        print(f"Link to { tipup.name } lost: { tipup.error }")
+        # It can't report a trip like this, so the angler has to know
+        if self.on_link_lost is not None:
+            self.on_link_lost(tipup)
+        asyncio.create_task(self.relink(tipup, device))
+
+    async def link_watch_task(self):
+        # Links that dropped without the receiver asking, see ble_irq()
+        while True:
+            await self.link_dropped.wait()
+            for tipup in list(self.connected_devices.values()):
+                if tipup.status == "dropped":
+                    tipup.error = "link dropped"
+                    self.link_lost(tipup, tipup.connection.device)
+
+    async def relink(self, tipup, device):
+        # Out of range or switched off, keep trying at a pace that leaves the radio to the other tipups
+        while tipup.status == "lost" and self.connected_devices.get(tipup.address) is tipup:
+            await asyncio.sleep_ms(LINK_LOST_RETRY_MS)
+            await self.connect_device(tipup.name, device)
+            if tipup.status != "armed":
+                tipup.status = "lost"
+
+    async def link_profile_task(self):
+        # Short intervals while someone is using the receiver, long ones with slave latency when it's left alone
+        while True:
+            try:
+                await asyncio.wait_for_ms(self.activity.wait(), RECEIVER_IDLE_MS)
+                profile = PROFILE_ACTIVE
+            except asyncio.TimeoutError:
+                profile = PROFILE_IDLE
+            if profile != self.link_profile:
+                self.link_profile = profile
+                # Disconnects and later stages overlap, the connect stage still takes one link at a time.
+                # One tipup failing must not take the others, or this task, with it
+                results = await asyncio.gather(*[self.renegotiate(tipup) for tipup in list(self.connected_devices.values())],
+                                               return_exceptions=True)
+                for result in results:
+                    if isinstance(result, Exception):
+                        print(f"Link profile change failed: { result }")
+
+    async def discover_and_subscribe(self, tipup):
+        tipup.stage = "discover"
+        io_service = await tipup.connection.service(IO_SERVICE_UUID, timeout_ms=DISCOVERY_TIMEOUT_MS)
+        if io_service is None:
+            raise ValueError("IO service not found")
+        io_characteristic = await io_service.characteristic(IO_CHARACTERISTIC_UUID, timeout_ms=DISCOVERY_TIMEOUT_MS)
+        if io_characteristic is None:
+            raise ValueError("IO characteristic not found")
+        cccd = await io_characteristic.descriptor(CCCD_UUID, timeout_ms=DISCOVERY_TIMEOUT_MS)
+        if cccd is None:
+            raise ValueError("CCCD not found")
+
+        tipup.stage = "subscribe"
+        io_characteristic._register_with_connection()
+        await cccd.write(CCCD_INDICATE, response=True, timeout_ms=SUBSCRIBE_TIMEOUT_MS)
+        tipup.io_characteristic = io_characteristic
+        self.gatt_cache.put(tipup.address, tipup.name, io_service, io_characteristic, cccd)
+
+    async def subscribe_cached(self, connection, entry):
+        """Rebuild the IO characteristic from cached handles and enable indications without discovery"""
+        _, start_handle, end_handle, char_end_handle, value_handle, properties, cccd_handle = entry
+        io_service = aioble.client.ClientService(connection, start_handle, end_handle, IO_SERVICE_UUID)
+        io_characteristic = aioble.client.ClientCharacteristic(io_service, char_end_handle, value_handle, properties, IO_CHARACTERISTIC_UUID)
+        cccd = aioble.client.ClientDescriptor(io_characteristic, cccd_handle, CCCD_UUID)
+        io_characteristic._register_with_connection()
+        await cccd.write(CCCD_INDICATE, response=True, timeout_ms=SUBSCRIBE_TIMEOUT_MS)
+        return io_characteristic
+
+    async def connect_devices(self, devices, limit=MAX_CONNECTIONS):
+        """Arm several ScannedDevice entries at once
+
+        Up to limit devices go through the pipeline concurrently. Returns the TipupDevice results keyed by address
+        """
+        pending = list(devices)
+        results = {}
+
+        async def worker():
+            while pending:
+                entry = pending.pop(0)
+                tipup = await self.connect_device(entry.name, entry.device)
+                results[tipup.address] = tipup
+
+        await asyncio.gather(*[worker() for _ in range(min(limit, len(pending)))])
+        return results
 
     async def button_pressed(self, button):
+        self.activity.set()
         if self.active_menu:
             result = await self.active_menu.handle_input(button)
             if isinstance(result, BaseMenu):
@@ -47,6 +339,10 @@ class BaseMenu:
         self.display = display
         self.manager = manager
 
+    def enter(self):
+        # Override to reset state and take arguments each time the menu is navigated to
+        pass
+
     async def draw_menu(self):
         raise NotImplementedError("Subclass needs to override draw_menu() method")
     
@@ -70,18 +366,23 @@ class SplashMenu(BaseMenu):
     
     async def handle_input(self, input):
         print(f"Button pressed: { input }")
-        return ScanMenu(self.display, self.manager)
+        return self.manager.menu(ScanMenu)
     
 class MainMenu(BaseMenu):
     def __init__(self, display, manager):
         super().__init__(display, manager)
         self.selected_option_index = 0
+        self.screen = widgets.Screen(display)
+        self.screen.add(widgets.Label(0, 0, "   Main Menu", color=display.cyan))
+        self.selector = self.screen.add(widgets.Selector(70, 21, 0, color=display.yellow))
+        self.screen.add(widgets.ListWidget(0, 39, ("0: Scan for          Devices", "1: Connected         Devices", "2: Options")))
+
+    def enter(self):
+        self.selected_option_index = 0
+        self.selector.set(0)
 
     async def draw_menu(self):
-        self.display.clear()
-        self.display.printstring("   Main Menu", color=self.display.cyan)
-        self.draw_selection()
-        self.list_options()
+        self.screen.render(full=True)
 
     def exit(self):
         pass
@@ -99,30 +400,126 @@ class MainMenu(BaseMenu):
             self.draw_selection()
         elif input == "SELECT":
             if self.selected_option_index == 0:
-                return ScanMenu(self.display, self.manager)
+                return self.manager.menu(ScanMenu)
             elif self.selected_option_index == 1:
                 print("==[ Connected Devices ]==")
                 for device in self.manager.connected_devices.keys():
                     print(device)
+            elif self.selected_option_index == 2:
+                return self.manager.menu(DiagnosticsMenu)
 
+    def draw_selection(self):
+        self.selector.set(self.selected_option_index)
+        self.screen.render()
 
-    def list_options(self):
-        self.display.printstring("0: Scan for          Devices")
-        self.display.printstring("1: Connected         Devices")
-        self.display.printstring("2: Options")
+class DiagnosticsMenu(BaseMenu):
+    def __init__(self, display, manager):
+        super().__init__(display, manager)
+        self.page = 0
+        self.screen = widgets.Screen(display)
+        self.screen.add(widgets.Label(0, 0, "  Diagnostics", color=display.cyan))
+        self.page_label = self.screen.add(widgets.Label(0, 21, color=display.yellow))
+        self.lines = self.screen.add(widgets.ListWidget(0, 42))
+        self.screen.add(widgets.Label(0, 210, "A:Refresh B:Reset", color=display.green))
 
-    def draw_selection(self):
-        self.display.delchar(98, 21, 2, False)
-        self.display.printchar('<', 70, 21, 2, False)
-        self.display.printchar(str(self.selected_option_index), 98, 21, 2, True, self.display.yellow)
-        self.display.printchar('>', 126, 21, 2, False)
-        self.display.move_cursor(0, 39)
+    def enter(self):
+        self.page = 0
+
+    async def draw_menu(self):
+        self.update_lines()
+        self.screen.render(full=True)
+
+    def update_lines(self):
+        # Only the values that changed since the last refresh are redrawn
+        page = DIAGNOSTICS_PAGES[self.page]
+        self.page_label.set(f"{ page } { self.page + 1 }/{ len(DIAGNOSTICS_PAGES) }")
+        if page == "Display":
+            lines = self.display_lines()
+        elif page == "Latency":
+            lines = self.latency_lines()
+        else:
+            lines = self.heap_lines()
+        self.lines.set_items(lines)
+
+    def display_lines(self):
+        stats = self.display.stats()
+        lines = [f"Shows: { stats['shows'] }",
+                 f"KB: { stats['bytes'] // 1024 }",
+                 f"Cmds: { stats['commands'] }",
+                 # Milliseconds keep the line within the 17 characters a size 2 line holds
+                 f"ms { stats['flush_us_min'] / 1000:.1f}/{ stats['flush_us_avg'] / 1000:.1f}/{ stats['flush_us_max'] / 1000:.1f}"]
+        for name, (shows, sent) in stats["callers"].items():
+            lines.append(f"{ name } { shows } { sent // 1024 }K")
+        return lines
+
+    def latency_lines(self):
+        latency = self.manager.latency.stats()
+        if not latency:
+            return ["No fish yet"]
+        _, p50, p90, top = latency["total"]
+        # One figure per line, a size 2 line holds 17 characters
+        lines = [f"Fish p50 { p50 // 1000 }ms",
+                 f"p90 { p90 // 1000 }ms",
+                 f"Max { top // 1000 }ms"]
+        # Stage that took longest on average, where to look first
+        slowest = max(latency_trace.STAGES[:latency_trace.TOTAL], key=lambda name: latency[name][0])
+        lines.append(f"Slow { slowest } { latency[slowest][0] // 1000 }ms")
+        return lines
+
+    def heap_lines(self):
+        heap = self.manager.heap
+        latest = heap.latest()
+        if latest is None:
+            return ["No samples yet"]
+        free, _, largest, probed_free = latest
+        lines = [f"Free: { free // 1024 }K",
+                 f"Low: { heap.low_water // 1024 }K"]
+        if largest is None:
+            lines.append("A: probe blocks")
+        else:
+            lines.append(f"Block: { largest // 1024 }K")
+            lines.append(f"Frag: { 100 - largest * 100 // probed_free if probed_free else 0 }%")
+        # Biggest single growth first, that's where a leak or a fragmenting allocation comes from
+        for label, _, top, _ in heap.growth()[:4]:
+            lines.append(f"{ label[:11] } +{ top }")
+        return lines
+
+    def exit(self):
+        pass
+
+    async def handle_input(self, input):
+        if input == "LEFT" or input == "RIGHT":
+            self.page = (self.page + (1 if input == "RIGHT" else -1)) % len(DIAGNOSTICS_PAGES)
+            self.update_lines()
+            self.screen.render()
+        elif input == "A":
+            if DIAGNOSTICS_PAGES[self.page] == "Heap":
+                # The block probe stalls for a few ms, only on request
+                self.manager.heap.sample(probe=True)
+            self.update_lines()
+            self.screen.render()
+        elif input == "B":
+            page = DIAGNOSTICS_PAGES[self.page]
+            if page == "Display":
+                self.display.reset_stats()
+            elif page == "Latency":
+                self.manager.latency.reset()
+            else:
+                self.manager.heap.reset()
+                self.manager.heap.sample()
+            self.update_lines()
+            self.screen.render()
+        elif input == "Y":
+            return self.manager.menu(MainMenu)
 
 class ConnectedDevices(BaseMenu):
     def __init__(self, display, manager):
         super().__init__(display, manager)
         self.selected_option_index = 0
 
+    def enter(self):
+        self.selected_option_index = 0
+
     async def draw_menu(self):
         self.display.clear()
         self.display.printstring(" Connected Devices", color=self.display.green)
@@ -159,15 +556,15 @@ class ConnectedDevices(BaseMenu):
     
 class ScanMenu(BaseMenu):
     def __init__(self, display, manager):
-        self.display = display
-        self.manager = manager
-        self.scanned_devices = {}
+        super().__init__(display, manager)
+        self.target_count = None
 
-    async def draw_menu(self):
-        self.display.clear()
-        await self.scan_for_devices()
+    def enter(self, target_count=None):
+        self.target_count = target_count
 
-        await self.manager.set_active_menu(DevicesMenu(self.display, self.manager, self.scanned_devices))
+    async def draw_menu(self):
+        # Results stream straight into the device list, so hand over to it right away
+        await self.manager.set_active_menu(self.manager.menu(DevicesMenu, self.target_count))
 
     def exit(self):
         pass
@@ -175,104 +572,162 @@ class ScanMenu(BaseMenu):
     async def handle_input(self, input):
         pass
 
-    async def scan_for_devices(self):
-        scan_task_obj = asyncio.create_task(self.scan_task())
-        spinner_task_obj = asyncio.create_task(self.spinner_task(scan_task_obj))
+class DevicesMenu(BaseMenu):
+    def __init__(self, display, manager):
+        super().__init__(display, manager)
+        self.device_list = {}       # ScannedDevice entries keyed by address, for O(1) dedup
+        self.device_order = []      # The same entries in the order they were found, indexed by the selector
+        self.selected_device_index = 0
+        self.no_devices = False
+        self.target_count = None    # Stop scanning early once this many tipups have been seen
+        self.scan_task_obj = None
+        self.spinner_task_obj = None
+        self.target_reached = asyncio.ThreadSafeFlag()
+
+        self.list_screen = widgets.Screen(display)
+        self.list_screen.add(widgets.Label(0, 0, "  Select Device", color=display.cyan))
+        self.spinner = self.list_screen.add(widgets.Label(226, 0, color=display.cyan))
+        # Added to the screen once there is something to select
+        self.selector = widgets.Selector(70, 21, 0, color=display.yellow)
+        self.devices = self.list_screen.add(widgets.ListWidget(0, 39))
+        self.empty_screen = widgets.Screen(display)
+        self.empty_screen.add(widgets.Banner(0, 0, 240, 84, "No Devices Found", size=2, color=display.red, background=display.black))
+        self.empty_screen.add(widgets.Label(0, 90, "Press any button to scan again"))
+        self.screen = self.list_screen
+
+    def enter(self, target_count=None):
+        self.device_list.clear()
+        self.device_order.clear()
+        self.selected_device_index = 0
+        self.no_devices = False
+        self.target_count = target_count
+        self.scan_task_obj = None
+        self.spinner_task_obj = None
+        self.target_reached.clear()
+        self.list_screen.remove(self.selector)
+        self.selector.set(0)
+        self.devices.set_items(())
+        self.spinner.set("")
+        self.screen = self.list_screen
 
-        await scan_task_obj
-        await spinner_task_obj
-    
-    async def spinner_task(self, scan_task_obj):
+    async def draw_menu(self):
+        self.screen.render(full=True)
+        self.scan_task_obj = asyncio.create_task(self.scan_task())
+        self.spinner_task_obj = asyncio.create_task(self.spinner_task())
+
+    def exit(self):
+        for task in (self.scan_task_obj, self.spinner_task_obj):
+            if task is not None and not task.done():
+                task.cancel()
+
+    async def stop_scan(self):
+        # Wait for the scan to really stop so the radio is free before connecting
+        for task in (self.scan_task_obj, self.spinner_task_obj):
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+
+    async def spinner_task(self):
         spinner = '-\\|/-\\|/'
-        scan_ongoing = True
-        while scan_ongoing:  # Keep the spinner running indefinitely
+        while not self.scan_task_obj.done():
             for x in spinner:
-                c = self.display.cyan
-                center = int(240/2) - 18
-                self.display.delchar(center, center, 3, True)
-                self.display.printchar(x, center, center, 3, True, c)
+                self.display.caller = lcd_screen.CALLER_SPINNER
+                self.spinner.set(x)
+                self.screen.render()
+                self.display.caller = lcd_screen.CALLER_MENU
                 await asyncio.sleep(0.05)
-
-                if scan_task_obj.done():
-                    scan_ongoing = False   
-        print("Spinner task completed")                 
+        self.spinner.set("")
+        self.screen.render()
+        print("Spinner task completed")
 
     async def scan_task(self):
-        # Start scanning
-        print("Scanning for devices...")
-        self.display.move_cursor(48, 147)
-        self.display.printstring("Scanning", size=3, newline=False)
-        async with aioble.scan(5000, interval_us=30000, window_us=30000, active=False) as scanner:
-            #Scan for 5 seconds total, scan every 30 milliseconds (interval), for 30 milliseconds (window) in active or passive mode
-            async for result in scanner:
-                print(f"Found device: {result.device.addr} (Name: {result.name()})")
-                if result.device.addr not in [d.addr for d in self.scanned_devices.values()] and result.name() != None:
-                    self.scanned_devices[result.name()] = result.device
+        scanner = self.manager.scanner
+        # The background scanner's table is already warm, list it right away and add whatever turns up
+        for slot in scanner.slots():
+            self.found(slot)
+        boosted = False
+        try:
+            # Inside the try so a cancel during boost(True) still unhooks found() and drops the boost
+            scanner.on_new = self.found
+            boosted = True
+            await scanner.boost(True)
+            if not (self.target_count and len(self.device_order) >= self.target_count):
+                await asyncio.wait_for_ms(self.target_reached.wait(), PICKER_SCAN_MS)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            scanner.on_new = None
+            if boosted:
+                await scanner.boost(False)
         print("Scan task finished")
 
-class DevicesMenu(BaseMenu):
-    def __init__(self, display, manager, device_list):
-        super().__init__(display, manager)
-        self.device_list = device_list
-        self.selected_device_index = 0
-        self.no_devices = False
-
-    async def draw_menu(self):
-        self.display.clear()
-        if len(self.device_list) > 0:
-            self.display.printstring("  Select Device", color=self.display.cyan)
-            self.draw_selection()
-            self.list_devices()
-        else:
-            self.display.printstring("  No Devices", size=3, color=self.display.red)
-            self.display.printstring("    Found", size = 3, color=self.display.red)
-            self.display.printstring("Press any button to scan again", size=2)
+        if not self.device_order:
+            self.screen = self.empty_screen
+            self.screen.render(full=True)
             self.no_devices = True
 
-    def exit(self):
-        pass
+    def found(self, slot):
+        scanner = self.manager.scanner
+        device = scanner.devices[slot]
+        if device.addr in self.device_list:
+            return
+        print(f"Found device: {device.addr} (Name: {scanner.names[slot]})")
+        self.add_device(ScannedDevice(scanner.names[slot], device, scanner))
+        if self.target_count and len(self.device_order) >= self.target_count:
+            self.target_reached.set()
+
+    def add_device(self, entry):
+        index = len(self.device_order)
+        self.device_list[entry.device.addr] = entry
+        self.device_order.append(entry)
+        if index == 0:
+            self.list_screen.add(self.selector)
+        # Lines left over from an earlier scan are reused in place
+        self.devices.set_line(index, f"{ index }:{ entry.name }")
+        self.screen.render()
 
     def draw_selection(self):
-        self.display.delchar(98, 21, 2, False)
-        self.display.printchar('<', 70, 21, 2, False)
-        self.display.printchar(str(self.selected_device_index), 98, 21, 2, True, self.display.yellow)
-        self.display.printchar('>', 126, 21, 2, False)
-        self.display.move_cursor(0, 39)
+        self.selector.set(self.selected_device_index)
+        self.screen.render()
 
     async def handle_input(self, input):
-        # TODO - add logic to start a new scan if no devices are found, make buttons change selction index
         if self.no_devices:
-            self.manager.set_active_menu(ScanMenu(self.display, self.manager))
+            return self.manager.menu(ScanMenu, self.target_count)
+        elif not self.device_order:
+            # Nothing found yet
+            pass
         elif input == "LEFT":
             self.selected_device_index -= 1
             if self.selected_device_index < 0:
-                self.selected_device_index = len(self.device_list) - 1
+                self.selected_device_index = len(self.device_order) - 1
             self.draw_selection()
         elif input == "RIGHT":
             self.selected_device_index += 1
-            if self.selected_device_index > len(self.device_list) - 1:
+            if self.selected_device_index > len(self.device_order) - 1:
                 self.selected_device_index = 0
             self.draw_selection()
+        elif input == "A":
+            await self.stop_scan()
+            return self.manager.menu(ArmAllMenu, self.device_order)
         elif input == "SELECT":
-            try:
-                selected_device = list(self.device_list.keys())[self.selected_device_index]
-                print(f"You selected { selected_device }")
-                connected_menu = TestConnectedMenu(self.display, self.manager, selected_device, self.device_list[selected_device])
-                return connected_menu
-            except ValueError as e:
-                print(e)
-
-    def list_devices(self):
-        for index, name in enumerate(self.device_list.keys()):
-            self.display.printstring(f"{ index }:{ name }")
+            await self.stop_scan()
+            selected_device = self.device_order[self.selected_device_index]
+            print(f"You selected { selected_device.name }")
+            return self.manager.menu(TestConnectedMenu, selected_device.name, selected_device.device)
 
 class TestConnectedMenu(BaseMenu):
-        def __init__(self, display, manager, device_name, device):
+        def __init__(self, display, manager):
             super().__init__(display, manager)
+            self.device_name = None
+            self.device = None
+            self.io_characteristic = None
+
+        def enter(self, device_name, device):
             self.device_name = device_name
             self.device = device
-            self.io_service_uuid = UUID('0e024d3a-fa3e-455c-bb2c-4a3bcfaf8454')
-            self.io_characteristic_uuid = UUID('1a0e5013-fbd8-4ca7-b38d-683e25c9eb97')
             self.io_characteristic = None
         
         async def draw_menu(self):
@@ -288,11 +743,8 @@ class TestConnectedMenu(BaseMenu):
             elif input == "B":
                 await self.set_io_characteristic(0)
             elif input == "Y":
-                return MainMenu(self.display, self.manager)      
+                return self.manager.menu(MainMenu)      
 
-        def address_from_bytes(self, bytes_object):
-            return ':'.join(f'{byte:02X}' for byte in bytes_object)
-        
         def decode_characteristic_properties(self, properties):
             descriptions = []
             if properties & 0x01:  # Broadcast
@@ -318,72 +770,123 @@ class TestConnectedMenu(BaseMenu):
             await self.io_characteristic.write(bytearray([byte_value]))
 
         async def connect_to_device(self, device):
-            addr = self.address_from_bytes(device.addr)
-            if addr not in self.manager.connected_devices:
-                # try:
-                #Connect to the selected device
-                connection = await device.connect()
-                new_device = TipupDevice(connection._conn_handle, self.device_name, addr)
-                # except Exception as e:
-                #     print(f"Connection Error: {e}")
+            tipup = await self.manager.connect_device(self.device_name, device)
+            if tipup.status != "armed":
+                self.display.printstring(f"Failed to connect", clearscreen=True, color=self.display.red)
+                self.display.printstring(f"{ tipup.error }")
+                return
+
+            self.io_characteristic = tipup.io_characteristic
+            print(f"Characteristic properties: { self.decode_characteristic_properties(self.io_characteristic.properties) }")
+            led_value = await self.io_characteristic.read()
+            if led_value == b'\x01':
+                print(f"Current peripheral LED value: ON")
+            else:
+                print(f"Current peripheral LED value: OFF")
+            
+            self.display.printstring(f"Connected to", clearscreen=True, color=self.display.green)
+            self.display.printstring(f"{ tipup.address }", color=self.display.green)
 
-                try:
-                    #Discover services and subscribe to characteristics
-                    io_service = await connection.service(self.io_service_uuid)
-                    self.io_characteristic = await io_service.characteristic(self.io_characteristic_uuid)
-                    print(f"Characteristic properties: { self.decode_characteristic_properties(self.io_characteristic.properties) }")
-                    await self.io_characteristic.subscribe(indicate=True)
-                except Exception as e:
-                    print(f"Error discovering services/characteristics: {e}")
 
-                #Adds the new device to the connected devices list
-                self.manager.connected_devices[addr] = new_device
 
-                led_value = await self.io_characteristic.read()
-                if led_value == b'\x01':
-                    print(f"Current peripheral LED value: ON")
-                else:
-                    print(f"Current peripheral LED value: OFF")
-            
-            self.display.printstring(f"Connected to", clearscreen=True, color=self.display.green)
-            self.display.printstring(f"{ addr }", color=self.display.green)
+class ArmAllMenu(BaseMenu):
+    def __init__(self, display, manager):
+        super().__init__(display, manager)
+        self.device_list = ()
 
+    def enter(self, device_list):
+        self.device_list = device_list
 
+    async def draw_menu(self):
+        self.display.clear()
+        self.display.printstring(f"Arming { len(self.device_list) } tipups", color=self.display.cyan)
+        results = await self.manager.connect_devices(self.device_list)
+        self.display.clear()
+        self.display.printstring("  Arm Results", color=self.display.cyan)
+        for tipup in results.values():
+            color = self.display.green if tipup.status == "armed" else self.display.red
+            self.display.printstring(f"{ tipup.name }: { tipup.status }", color=color)
+        self.display.printstring("Y: Main Menu")
+
+    def exit(self):
+        pass
+
+    async def handle_input(self, input):
+        if input == "Y":
+            return self.manager.menu(MainMenu)
 
 class AlertMenu(BaseMenu):
-    def __init__(self, display, manager):
+    """The alert screen, one instance owned by AlertScheduler which also drives the flashing"""
+    def __init__(self, display, manager, scheduler):
         super().__init__(display, manager)
-        self.flashing_task = None
-        self.flashing = True
+        self.scheduler = scheduler
+        self.flash_mode = ALERT_FLASH_MODE
+        self.flash_on = False
         
     async def draw_menu(self):
-        self.display.clear()
-        self.flashing_task = asyncio.create_task(self.draw_background())
+        # The alert screen is drawn once, flashing is done by the panel itself afterwards
+        self.display.caller = lcd_screen.CALLER_ALERT
+        if self.flash_mode == ALERT_FLASH_BORDER or (self.flash_mode == ALERT_FLASH_PALETTE and not lcd_screen.PALETTE_MODE):
+            self.display.fill(self.display.black)
+        else:
+            self.display.fill(self.display.cyan)
+        self.display.fill_rect(8, 56, 224, 128, self.display.black)
+        # Only lost links on the screen, it's not a fish
+        title = "LINK LOST" if all(tipup.status == "lost" for tipup in self.scheduler.active_alerts()) else "FISH ON!"
+        self.display.move_cursor((240 - len(title) * lcd_screen.CHAR_SPACING[3]) // 2, 64)
+        self.display.printstring(title, size=3, strupdate=False, newline=False, color=self.display.cyan)
+        self.display.move_cursor(22, 162)
+        self.display.printstring("Any btn: clear", strupdate=False, newline=False, color=self.display.green)
+        await self.draw_alerts()
         print("draw_menu() finished")
-        # await flash_background_task
+
+    async def draw_alerts(self):
+        """Redraw only the lines naming the tipups that fired"""
+        self.display.caller = lcd_screen.CALLER_ALERT
+        self.display.fill_rect(16, 96, 208, 60, self.display.black)
+        alerts = self.scheduler.active_alerts()
+        for line, tipup in enumerate(alerts[:ALERT_LINES]):
+            self.display.move_cursor(16, 96 + line * 21)
+            if line == ALERT_LINES - 1 and len(alerts) > ALERT_LINES:
+                text = f"+{ len(alerts) - line } more"
+            else:
+                text = f"{ tipup.name[:11] } lost" if tipup.status == "lost" else f"{ tipup.name[:11] } x{ tipup.alert_count }"
+            self.display.printstring(text, strupdate=False, newline=False)
+        # Straight to the panel rather than through the compositor, this is the frame the angler waits for.
+        # Still in bands so indications and input keep flowing while it goes out
+        await self.display.show_async(lcd_screen.CALLER_ALERT)
+        self.manager.latency.finish()
+        self.display.caller = lcd_screen.CALLER_MENU
 
     def exit(self):
-        if not self.flashing_task.done():
-            self.flashing_task.cancel()
+        self.set_flash(False)
 
     async def handle_input(self, input):
-        self.flashing = False
-        await self.manager.set_active_menu(self.manager.previous_menu)
-
-    async def draw_background(self):
-        print("Drawing background")
-        bg_colors = [self.display.cyan, self.display.black]
-
-        while self.flashing:
-            self.display.fill_rect(0, 0, 240, 240, bg_colors[0])    #xywh
-            #Swap colors to imitate screen flashing
-            bg_colors[0], bg_colors[1] = bg_colors[1], bg_colors[0]
-            self.display.fill_rect(40, 92, 160, 100, self.display.black)
-            self.write_message()
-            await asyncio.sleep(.5)
-        print("Flashing task finished")
-    
-    def write_message(self):
-        self.display.move_cursor(0, int(240 * .5) - 18)
-        self.display.printstring("   FISH ON!", size=3, strupdate=False, color=self.display.cyan)
-        self.display.printstring("    Press any          button          to clear")
+        self.scheduler.acknowledge()
+        return self.scheduler.return_menu or self.manager.menu(MainMenu)
+
+    def toggle_flash(self):
+        self.set_flash(not self.flash_on)
+
+    def set_flash(self, flash_on):
+        changed = flash_on != self.flash_on
+        self.flash_on = flash_on
+        if self.flash_mode == ALERT_FLASH_INVERT:
+            self.display.invert(flash_on)
+        elif self.flash_mode == ALERT_FLASH_PALETTE and lcd_screen.PALETTE_MODE:
+            # The swap is its own inverse, so only swap on a real change
+            if changed:
+                self.display.caller = lcd_screen.CALLER_ALERT
+                self.display.swap_palette(self.display.cyan, self.display.black)
+                self.display.request_show()
+                self.display.caller = lcd_screen.CALLER_MENU
+        else:
+            # Fallback: only the frame around the screen edge is repainted and flushed
+            self.display.caller = lcd_screen.CALLER_ALERT
+            color = self.display.cyan if flash_on else self.display.black
+            self.display.fill_rect(0, 0, 240, ALERT_BORDER, color)
+            self.display.fill_rect(0, 240 - ALERT_BORDER, 240, ALERT_BORDER, color)
+            self.display.fill_rect(0, ALERT_BORDER, ALERT_BORDER, 240 - 2 * ALERT_BORDER, color)
+            self.display.fill_rect(240 - ALERT_BORDER, ALERT_BORDER, ALERT_BORDER, 240 - 2 * ALERT_BORDER, color)
+            self.display.request_show()
+            self.display.caller = lcd_screen.CALLER_MENU
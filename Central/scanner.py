@@ -0,0 +1,138 @@
+import aioble, asyncio, utime
+from array import array
+
+# Named devices remembered at once, the least recently seen one makes room for a newcomer
+SCAN_TABLE_SIZE = 16
+# Entries not heard from for this long are dropped
+SCAN_STALE_MS = 60000
+# Scan parameters are re-chosen after every chunk
+SCAN_CHUNK_MS = 2000
+
+# Background duty cycle, 10% of the airtime before backing off
+SCAN_INTERVAL_US = 300000
+SCAN_WINDOW_US = 30000
+# While the device picker is open
+SCAN_FAST_INTERVAL_US = 30000
+SCAN_FAST_WINDOW_US = 30000
+# Upper bound on the interval while broadcast tipups are being watched, their trips only arrive this way
+SCAN_WATCH_INTERVAL_US = 150000
+# More results than this in one chunk doubles the interval for the next, up to SCAN_MAX_BACKOFF times
+SCAN_BUSY_RESULTS = 100
+SCAN_MAX_BACKOFF = 3
+
+class BackgroundScanner:
+    """Always-on passive scan keeping a fixed-size table of nearby named devices
+
+    The table holds the aioble Device, name, last RSSI and last-seen tick per slot so the device picker
+    can list tipups straight away. Every raw result is also handed to the observers, e.g. the
+    BroadcastMonitor. Only one scan can run on the radio, so anything else that needs it calls stop()
+    and start() around its own use
+    """
+    def __init__(self, manager, size=SCAN_TABLE_SIZE):
+        self.manager = manager
+        self.size = size
+        self.devices = [None] * size        # None marks a free slot
+        self.names = [None] * size
+        self.rssi = array('b', bytes(size))
+        self.last_seen = array('L', [0] * size)
+        self.slot_for = {}                  # Device address bytes -> slot
+        self.observers = []                 # Called with every ScanResult
+        self.on_new = None                  # Called with the slot of each device added to the table
+        self.boosts = 0
+        self.backoff = 0
+        self.interval_us = SCAN_INTERVAL_US
+        self.window_us = SCAN_WINDOW_US
+        self.task = None
+        self.results = 0
+        self.evictions = 0
+
+    def slots(self):
+        return [slot for slot in range(self.size) if self.devices[slot] is not None]
+
+    def observe(self, result):
+        self.results += 1
+        for observer in self.observers:
+            observer(result)
+        addr = result.device.addr
+        slot = self.slot_for.get(addr)
+        if slot is None:
+            name = result.name()
+            if name is None:
+                return
+            slot = self.free_slot()
+            self.devices[slot] = result.device
+            self.names[slot] = name
+            self.slot_for[addr] = slot
+            new = True
+        else:
+            new = False
+        self.rssi[slot] = result.rssi
+        self.last_seen[slot] = utime.ticks_ms()
+        if new and self.on_new is not None:
+            self.on_new(slot)
+
+    def free_slot(self):
+        oldest = 0
+        for slot in range(self.size):
+            if self.devices[slot] is None:
+                return slot
+            if utime.ticks_diff(self.last_seen[slot], self.last_seen[oldest]) < 0:
+                oldest = slot
+        self.evictions += 1
+        self.remove(oldest)
+        return oldest
+
+    def remove(self, slot):
+        del self.slot_for[self.devices[slot].addr]
+        self.devices[slot] = None
+        self.names[slot] = None
+
+    def expire(self):
+        now = utime.ticks_ms()
+        for slot in range(self.size):
+            if self.devices[slot] is not None and utime.ticks_diff(now, self.last_seen[slot]) > SCAN_STALE_MS:
+                self.remove(slot)
+
+    def duty_cycle(self):
+        if self.boosts:
+            return SCAN_FAST_INTERVAL_US, SCAN_FAST_WINDOW_US
+        # Every armed link needs its connection events, and every result costs the CPU time away from drawing
+        links = len(self.manager.connected_devices)
+        interval_us = (SCAN_INTERVAL_US * (1 + links)) << self.backoff
+        if self.manager.broadcast_devices:
+            interval_us = min(interval_us, SCAN_WATCH_INTERVAL_US)
+        return interval_us, SCAN_WINDOW_US
+
+    async def run(self):
+        while True:
+            self.interval_us, self.window_us = self.duty_cycle()
+            start = self.results
+            async with aioble.scan(SCAN_CHUNK_MS, interval_us=self.interval_us, window_us=self.window_us, active=False) as scanner:
+                async for result in scanner:
+                    self.observe(result)
+            if self.results - start > SCAN_BUSY_RESULTS:
+                self.backoff = min(self.backoff + 1, SCAN_MAX_BACKOFF)
+            elif self.backoff and self.results - start < SCAN_BUSY_RESULTS // 4:
+                self.backoff -= 1
+            self.expire()
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+            # The scan task's own CancelledError comes back as a result, a cancel of the caller still goes through
+            await asyncio.gather(self.task, return_exceptions=True)
+
+    async def boost(self, on):
+        """Scan at full duty while on, e.g. while the device picker is open"""
+        self.boosts += 1 if on else -1
+        if self.task is not None and not self.task.done():
+            # Restart right away with the new parameters rather than at the end of the chunk, and restart
+            # even when cancelled while stopping so the background scan keeps going
+            try:
+                await self.stop()
+            finally:
+                self.start()
@@ -1,9 +1,104 @@
+from bluetooth import UUID
+
+IO_SERVICE_UUID = UUID('0e024d3a-fa3e-455c-bb2c-4a3bcfaf8454')
+IO_CHARACTERISTIC_UUID = UUID('1a0e5013-fbd8-4ca7-b38d-683e25c9eb97')
+
+# Manufacturer-specific advertising data sent by tipups in broadcast mode, after the company ID:
+# magic, layout version, device ID (uint16 LE), flag state, rolling trip counter
+BROADCAST_COMPANY_ID = 0xFFFF       # Reserved for testing, the magic byte tells our tipups apart
+BROADCAST_MAGIC = 0x54
+BROADCAST_VERSION = 1
+BROADCAST_FLAG_UP = 0x01
+
+def parse_broadcast(data):
+    """(device_id, flags, trips) from a tipup's manufacturer data, None if it isn't one"""
+    if len(data) < 6 or data[0] != BROADCAST_MAGIC or data[1] != BROADCAST_VERSION:
+        return None
+    return data[2] | (data[3] << 8), data[4], data[5]
+
+def address_from_bytes(bytes_object):
+    return ':'.join(f'{byte:02X}' for byte in bytes_object)
+
 class TipupDevice():
     def __init__(self, conn_handle, name, addr) -> None:
         self.connection_handle = conn_handle
         self.name = name
         self.address = addr
+        self.connection = None
         self.io_characteristic = None
+
+        # Result of the last connect attempt
+        self.status = "new"     # "new", "connecting", "armed", "failed", "renegotiating", "dropped" or "lost"
+        self.stage = None       # Pipeline stage reached, or the one that failed
+        self.error = None
+        self.arm_ms = 0         # Time from starting the connect to being subscribed
+
+        # Link profile asked for at connect, and the parameters the controller last reported (None until it does)
+        self.profile = None
+        self.conn_interval_us = None
+        self.conn_latency = None
+        self.supervision_timeout_ms = None
+        self.conn_updates = 0
+        self.mtu = 23
+
+        # From the last message the tipup indicated, see tipup_protocol
+        self.last_seq = None
+        self.last_event = None
+        self.uptime_ms = 0
+        self.flag_state = 0
+        self.battery = None
+        self.missed_events = 0  # Sequence numbers skipped over, events the tipup sent that never arrived
+        self.duplicates = 0
+        self.reboots = 0        # Seen as its uptime going backwards
+
+        # Alert state, repeated indications before an acknowledge only bump the count
+        self.alert_first_ms = 0
+        self.alert_count = 0
+        self.alert_acknowledged = True
+
+        # Broadcast mode only, last trip counter and time seen in an advertisement
+        self.trip_counter = 0
+        self.last_seen_ms = 0
+
+    def record_message(self, event, seq, uptime_ms, flags, battery):
+        """Keep a decoded message, False for a repeat of the last one (its confirmation got lost and it was resent)"""
+        if self.last_seq is not None and uptime_ms < self.uptime_ms:
+            # The tipup rebooted and numbers from 1 again, nothing to compare the sequence with. Its ticks_ms
+            # wrapping every 12 days looks the same and only skips one gap check
+            self.reboots += 1
+            self.last_seq = None
+        if self.last_seq is not None:
+            if seq == self.last_seq:
+                self.duplicates += 1
+                return False
+            self.missed_events += (seq - self.last_seq - 1) & 0xFFFF
+        self.last_seq = seq
+        self.last_event = event
+        self.uptime_ms = uptime_ms
+        self.flag_state = flags
+        self.battery = battery
+        return True
+
+    def record_alert(self, now_ms):
+        if self.alert_acknowledged:
+            self.alert_first_ms = now_ms
+            self.alert_count = 0
+            self.alert_acknowledged = False
+        self.alert_count += 1
+
+    def acknowledge_alert(self):
+        self.alert_acknowledged = True
     
     def __str__(self):
-        return f"[TipUp Device]: connection_handle={ self.connection_handle } name={ self.name } address={ self.addr }"
\ No newline at end of file
+        return f"[TipUp Device]: connection_handle={ self.connection_handle } name={ self.name } address={ self.address } status={ self.status } profile={ self.profile } interval_us={ self.conn_interval_us } latency={ self.conn_latency }"
+
+class ScannedDevice():
+    def __init__(self, name, device, scanner) -> None:
+        self.name = name
+        self.device = device    # aioble Device used to connect
+        self.scanner = scanner  # Its table keeps the RSSI of the latest advertisement
+
+    def rssi(self):
+        """RSSI of the last advertisement heard, None once the scanner dropped the device from its table"""
+        slot = self.scanner.slot_for.get(self.device.addr)
+        return None if slot is None else self.scanner.rssi[slot]
@@ -0,0 +1,22 @@
+import struct
+
+# Indication payload sent by a tipup, little-endian:
+# layout version, event type, sequence number, tipup uptime in ms, flag state, battery percent,
+# flag IRQ to gatts_indicate() in us, round trip of the tipup's previous indication in us
+PROTOCOL_VERSION = 2
+MESSAGE_FORMAT = "<BBHIBBII"
+MESSAGE_SIZE = struct.calcsize(MESSAGE_FORMAT)
+
+EVENT_TRIP = 1
+
+# ATT MTU asked for once subscribed, the default of 23 already fits MESSAGE_SIZE and this leaves room to grow
+PROTOCOL_MTU = 64
+
+def unpack(view):
+    """(version, event, seq, uptime_ms, flags, battery, delay_us, rtt_us) read in place from a received payload
+
+    Returns None for payloads that aren't this layout, e.g. the single byte older tipups indicate
+    """
+    if len(view) < MESSAGE_SIZE or view[0] != PROTOCOL_VERSION:
+        return None
+    return struct.unpack_from(MESSAGE_FORMAT, view)
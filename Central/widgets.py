@@ -0,0 +1,210 @@
+from lcd_screen import CHAR_SPACING
+
+SCREEN_WIDTH = 240
+
+def text_extent(x, y, text, size):
+    """Bounding box (x, y, w, h) printstring() covers for text starting at x, y, wrapping like it does"""
+    spacing = CHAR_SPACING.get(size, 8)
+    line_height = spacing + spacing // 2
+    cursor_x = x
+    cursor_y = y
+    right = x
+    bottom = y
+    for _ in text:
+        right = max(right, cursor_x + 5 * size)
+        bottom = cursor_y
+        cursor_x += spacing
+        if cursor_x > SCREEN_WIDTH - spacing:
+            cursor_x = 0
+            cursor_y += line_height
+    if bottom > y:
+        # Wrapped text runs back to the left edge
+        x = 0
+    return x, y, min(right, SCREEN_WIDTH) - x, bottom - y + 9 * size
+
+class Widget:
+    """Something on screen that remembers what it last drew
+
+    Menus call set() as often as they like; update() only touches pixels when the value differs from
+    the one rendered last time
+    """
+    def __init__(self, value=None):
+        self.value = value
+        self.rendered = None
+        self.dirty = True
+        self.extent = None      # (x, y, w, h) of the last render
+
+    def set(self, value):
+        if value != self.value:
+            self.value = value
+            self.dirty = True
+
+    def invalidate(self):
+        # The pixels underneath were wiped, draw again even if the value is unchanged
+        self.rendered = None
+        self.extent = None
+        self.dirty = True
+
+    def update(self, display):
+        if not self.dirty:
+            return False
+        self.render(display)
+        self.rendered = self.value
+        self.dirty = False
+        return True
+
+    def render(self, display):
+        raise NotImplementedError("Subclass needs to override render() method")
+
+    def erase(self, display, background):
+        if self.extent is not None:
+            x, y, w, h = self.extent
+            display.fill_rect(x, y, w, h, background)
+            self.extent = None
+
+class Label(Widget):
+    def __init__(self, x, y, text="", size=2, color=None):
+        super().__init__(text)
+        self.x = x
+        self.y = y
+        self.size = size
+        self.color = color
+
+    def render(self, display):
+        self.erase(display, display.bg_color)
+        if self.value:
+            display.move_cursor(self.x, self.y)
+            display.printstring(self.value, size=self.size, strupdate=False, newline=False, color=self.color)
+            self.extent = text_extent(self.x, self.y, self.value, self.size)
+
+class Banner(Label):
+    """A label on a filled band, the band stays put while the text changes"""
+    def __init__(self, x, y, w, h, text="", size=2, color=None, background=0):
+        super().__init__(x, y, text, size, color)
+        self.box = (x, y, w, h)
+        self.background = background
+
+    def render(self, display):
+        x, y, w, h = self.box
+        display.fill_rect(x, y, w, h, self.background)
+        if self.value:
+            spacing = CHAR_SPACING.get(self.size, 8)
+            display.move_cursor(x + max(0, (w - len(self.value) * spacing) // 2), y + max(0, (h - 7 * self.size) // 2))
+            display.printstring(self.value, size=self.size, strupdate=False, newline=False, color=self.color)
+
+class Selector(Widget):
+    """"< n >" index picker, a move only repaints the number between the arrows"""
+    def __init__(self, x, y, index=None, size=2, color=None):
+        super().__init__(index)
+        self.x = x
+        self.y = y
+        self.size = size
+        self.color = color
+        self.step = 2 * CHAR_SPACING.get(size, 8)
+
+    def render(self, display):
+        number_x = self.x + self.step
+        if self.rendered is None:
+            display.printchar('<', self.x, self.y, self.size, False)
+            display.printchar('>', number_x + self.step, self.y, self.size, False)
+        else:
+            display.delchar(number_x, self.y, self.size, False)
+        if self.value is not None:
+            display.printchar(str(self.value), number_x, self.y, self.size, False, self.color)
+
+class ListWidget(Widget):
+    """Lines of text stacked from x, y, each line is its own Label so only changed lines are redrawn"""
+    def __init__(self, x, y, items=(), size=2, color=None):
+        super().__init__()
+        self.x = x
+        self.y = y
+        self.size = size
+        self.color = color
+        self.labels = []
+        self.set_items(items)
+
+    def set_items(self, items):
+        for index, text in enumerate(items):
+            self.set_line(index, text)
+        for label in self.labels[len(items):]:
+            label.set("")
+
+    def set_line(self, index, text, color=None):
+        while len(self.labels) <= index:
+            self.labels.append(Label(self.x, self.next_y(), "", self.size, self.color))
+        label = self.labels[index]
+        label.set(text)
+        if label.dirty:
+            # A line that starts or stops wrapping moves every line below it
+            self.layout(index + 1)
+        if color is not None and color != label.color:
+            label.color = color
+            label.dirty = True
+        self.dirty = self.dirty or label.dirty
+
+    def append(self, text, color=None):
+        self.set_line(len(self.labels), text, color)
+
+    def line_below(self, label):
+        spacing = CHAR_SPACING.get(self.size, 8)
+        _, y, _, h = text_extent(label.x, label.y, label.value or " ", self.size)
+        # Continue one printstring() line below the last line of the label
+        return y + h - 9 * self.size + spacing + spacing // 2
+
+    def next_y(self):
+        return self.line_below(self.labels[-1]) if self.labels else self.y
+
+    def layout(self, start):
+        for index in range(max(start, 1), len(self.labels)):
+            y = self.line_below(self.labels[index - 1])
+            label = self.labels[index]
+            if label.y != y:
+                label.y = y
+                label.dirty = True
+                self.dirty = True
+
+    def invalidate(self):
+        super().invalidate()
+        for label in self.labels:
+            label.invalidate()
+
+    def update(self, display):
+        if not self.dirty:
+            return False
+        # Clear every line that changes before drawing any, a line that moved down may sit where another
+        # line's old pixels are
+        for label in self.labels:
+            if label.dirty:
+                label.erase(display, display.bg_color)
+        changed = False
+        for label in self.labels:
+            changed = label.update(display) or changed
+        self.dirty = False
+        return changed
+
+class Screen:
+    """The widgets of one menu, render() draws what changed and asks the compositor for one flush"""
+    def __init__(self, display):
+        self.display = display
+        self.widgets = []
+
+    def add(self, widget):
+        self.widgets.append(widget)
+        return widget
+
+    def remove(self, widget):
+        if widget in self.widgets:
+            self.widgets.remove(widget)
+
+    def render(self, full=False):
+        display = self.display
+        if full:
+            display.fill(display.bg_color)
+            for widget in self.widgets:
+                widget.invalidate()
+        changed = full
+        for widget in self.widgets:
+            changed = widget.update(display) or changed
+        if changed:
+            display.request_show()
+        return changed
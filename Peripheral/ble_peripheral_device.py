@@ -50,6 +50,16 @@ _FLAG_WRITE_ENCRYPTED = const(0x1000)
 _FLAG_WRITE_AUTHENTICATED = const(0x2000)
 _FLAG_WRITE_AUTHORIZED = const(0x4000)
 
+# Broadcast mode: never connect, the flag state and trip counter ride in the advertisement instead
+BROADCAST_MODE = False
+# Manufacturer data after the company ID: magic, layout version, device ID, flag state, trip counter
+_BROADCAST_COMPANY_ID = const(0xFFFF)
+_BROADCAST_MAGIC = const(0x54)
+_BROADCAST_VERSION = const(1)
+
+# Flag switch between this GPIO and ground, closed when the flag is tripped
+FLAG_PIN = const(15)
+
 class BLEPeripheral:
     def __init__(self):
         self.ble = ubluetooth.BLE()
@@ -57,11 +67,18 @@ class BLEPeripheral:
         self.ble.irq(self.on_ble_event)
         self.display_config()
         self.binary_state = False
+        self.trip_counter = 0   # Rolling count of flag trips, advertised for receivers that don't connect
+        mac = self.ble.config('mac')[1]
+        self.device_id = mac[-2] << 8 | mac[-1]
         
         # Initialize the LED pin
         self.led = Pin("LED", Pin.OUT)  #Specific for Pi Pico
         self.led_on = False
         self.advertising = False
+
+        self.flag = Pin(FLAG_PIN, Pin.IN, Pin.PULL_UP)
+        # Soft IRQ: the handler runs scheduled, outside the interrupt, so re-advertising may allocate
+        self.flag.irq(trigger=Pin.IRQ_FALLING | Pin.IRQ_RISING, handler=self.flag_changed)
         
         self.init_ble_services()
         self.advertise()
@@ -92,10 +109,36 @@ class BLEPeripheral:
         print(f"Characteristic updated to: {self.binary_state}")
 
 
+    def manufacturer_data(self):
+        payload = bytes((_BROADCAST_COMPANY_ID & 0xFF, _BROADCAST_COMPANY_ID >> 8, _BROADCAST_MAGIC, _BROADCAST_VERSION,
+                         self.device_id & 0xFF, self.device_id >> 8, int(self.binary_state), self.trip_counter))
+        # Manufacturer Specific Data (type 0xFF)
+        return bytes((len(payload) + 1, 0xFF)) + payload
+
+    def trip(self):
+        # Count a flag trip, the next advertisement carries it
+        self.trip_counter = (self.trip_counter + 1) & 0xFF
+        if self.advertising:
+            self.advertise()
+
+    def flag_changed(self, pin):
+        closed = pin.value() == 0
+        if closed == self.binary_state:
+            # Contact bounce, the switch is where it was
+            return
+        self.binary_state = closed
+        self.update_characteristic()
+        if closed:
+            self.trip()
+        elif self.advertising:
+            # Advertise the flag state going back to set
+            self.advertise()
+
     def advertise(self):
         # BLE advertising parameters
         name = "Matts Pico"  # Name of the device
-        self.ble.gap_advertise(100, b'\x02\x01\x06\x03\x03\xAA\xFE\x0B\x09' + name.encode())
+        adv_data = b'\x02\x01\x06\x03\x03\xAA\xFE\x0B\x09' + name.encode() + self.manufacturer_data()
+        self.ble.gap_advertise(100, adv_data, connectable=not BROADCAST_MODE)
         self.advertising = True
         print("Advertising started...")
 
@@ -135,10 +178,11 @@ class BLEPeripheral:
 
         self.led.value(self.led_on)
 
-# Create an instance of the BLEPeripheral class to start advertising
-ble_peripheral = BLEPeripheral()
+if __name__ == "__main__":
+    # Create an instance of the BLEPeripheral class to start advertising
+    ble_peripheral = BLEPeripheral()
 
-# Keep the script running
-while True:
-    time.sleep(.5)
-    ble_peripheral.update_led()
\ No newline at end of file
+    # Keep the script running
+    while True:
+        time.sleep(.5)
+        ble_peripheral.update_led()
\ No newline at end of file
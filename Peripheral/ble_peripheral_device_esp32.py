@@ -1,13 +1,17 @@
-from machine import Pin
+from machine import Pin, ADC, lightsleep, wake_reason, PIN_WAKE
+import esp32
 from math import floor
 import ubluetooth
-import time
+import asyncio, struct, time
+from array import array
 from micropython import const
 
 _IRQ_CENTRAL_CONNECT = const(1)
 _IRQ_CENTRAL_DISCONNECT = const(2)
 _IRQ_GATTS_WRITE = const(3)
 _IRQ_GATTS_READ_REQUEST = const(4)
+_IRQ_GATTS_INDICATE_DONE = const(20)
+_IRQ_MTU_EXCHANGED = const(21)
 
 _FLAG_READ = const(0x0002)
 _FLAG_WRITE_NO_RESPONSE = const(0x0004)
@@ -15,22 +19,74 @@ _FLAG_WRITE = const(0x0008)
 _FLAG_NOTIFY = const(0x0010)
 _FLAG_INDICATE = const(0x0020)
 
+# Short LED pulse while advertising, a 50% blink costs more than the rest of the board when idle
+LED_PULSE_MS = const(20)
+LED_PERIOD_MS = const(2000)
+
+# The stock ESP32 build drops the BLE link in lightsleep, so only sleep while the radio is idle.
+# Set this on builds with BT modem sleep enabled to also sleep between LED pulses while advertising
+LIGHTSLEEP_WITH_RADIO = False
+# Stop advertising after this long without a central and sleep until the flag closes, 0 advertises forever.
+# With LIGHTSLEEP_WITH_RADIO off this is the only way an unarmed tipup gets to sleep, but a receiver can't
+# arm or relink it again until someone closes the flag by hand, so it is off by default
+ADVERTISE_TIMEOUT_MS = 0
+
+# Trip events wait here until the central confirms the indication for the one before
+TRIP_QUEUE_SIZE = const(8)
+INDICATE_TIMEOUT_MS = const(1000)
+INDICATE_RETRIES = const(3)
+INDICATE_BACKOFF_MS = const(50)   # Grows with every attempt
+
+# Indication payload, little-endian: layout version, event type, sequence number, uptime in ms, flag state,
+# battery percent, flag IRQ to gatts_indicate() in us, round trip of the previous indication in us.
+# Must match Central/tipup_protocol.py
+_PROTOCOL_VERSION = const(2)
+_MESSAGE_FORMAT = "<BBHIBBII"
+_DELAY_OFFSET = const(10)   # Of the two timing fields, filled in right before each gatts_indicate()
+_EVENT_TRIP = const(1)
+PROTOCOL_MTU = const(64)
+
+# Battery through a 1:2 divider, read with 11 dB attenuation
+BATTERY_PIN = const(35)
+BATTERY_FULL_SCALE_MV = const(3600)
+BATTERY_EMPTY_MV = const(3300)
+BATTERY_FULL_MV = const(4200)
+
+# Broadcast mode: never connect, the flag state and trip counter ride in the advertisement instead
+BROADCAST_MODE = False
+# Manufacturer data after the company ID: magic, layout version, device ID, flag state, trip counter
+_BROADCAST_COMPANY_ID = const(0xFFFF)
+_BROADCAST_MAGIC = const(0x54)
+_BROADCAST_VERSION = const(1)
+
+
+# Flag switch contacts settle within this, edges before then are bounce
+FLAG_DEBOUNCE_MS = const(20)
 
 # button_a = Button(12, invert=True)  #Signal button
 button_a= Pin(27,Pin.IN,Pin.PULL_UP)
 
-button_a_pressed = False
+# Set from the IRQ, wakes indication_task() straight away
+button_a_flag = asyncio.ThreadSafeFlag()
+# ticks_us of the first flag edge indication_task() hasn't looked at yet, arrays so the IRQ handler doesn't allocate
+trip_irq_us = array('L', [0])
+flag_edge_pending = bytearray(1)
 
 def button_a_handler(pin):
-    global button_a_pressed
-    button_a_pressed = True
+    if not flag_edge_pending[0]:
+        flag_edge_pending[0] = 1
+        trip_irq_us[0] = time.ticks_us()
+    button_a_flag.set()
 
-button_a.irq(trigger=Pin.IRQ_FALLING, handler=button_a_handler)
+# Both edges, indication_task() compares levels so a switch that opens cleanly is seen too
+button_a.irq(trigger=Pin.IRQ_FALLING | Pin.IRQ_RISING, handler=button_a_handler)
 
 class BLEPeripheral:
     def __init__(self):
         self.ble = ubluetooth.BLE()
         self.ble.active(True)
+        self.ble.config(mtu=PROTOCOL_MTU)
+        self.mtu = 23   # Until the central exchanges a larger one
         self.ble.irq(self.on_ble_event)
         self.display_config()
         
@@ -41,6 +97,33 @@ class BLEPeripheral:
         self.connected = False  #Track connection status
         self.connection_handle = None #Store the connection once made to a central device
         self.registered_service = None  # Will hold the service and characteristic
+        self.state_changed = asyncio.ThreadSafeFlag()   # Set on connect/disconnect so led_task() can react
+        self.advertise_started = 0
+        self.flag_closed = button_a.value() == 0
+
+        # Trip times (ticks_ms) waiting for delivery, a ring with one slot kept free
+        self.trips = array('L', [0] * TRIP_QUEUE_SIZE)
+        self.trip_seqs = array('H', [0] * TRIP_QUEUE_SIZE)
+        self.trip_irq = array('L', [0] * TRIP_QUEUE_SIZE)     # ticks_us of the flag edge
+        self.last_rtt_us = 0
+        self.seq = 0
+        self.message = bytearray(struct.calcsize(_MESSAGE_FORMAT))
+        self.battery_adc = ADC(Pin(BATTERY_PIN))
+        self.battery_adc.atten(ADC.ATTN_11DB)
+        self.trip_head = 0
+        self.trip_tail = 0
+        self.trip_queued = asyncio.ThreadSafeFlag()
+        self.indicate_done = asyncio.ThreadSafeFlag()
+        self.indicate_status = 0
+        self.sent = 0
+        self.confirmed = 0
+        self.retried = 0
+        self.dropped = 0
+
+        # Rolling count of flag trips, advertised in every mode so a receiver can watch without connecting
+        self.trip_counter = 0
+        mac = self.ble.config('mac')[1]
+        self.device_id = mac[-2] << 8 | mac[-1]
         self.io_service_uuid = ubluetooth.UUID('0e024d3a-fa3e-455c-bb2c-4a3bcfaf8454')
         self.io_char = (ubluetooth.UUID('1a0e5013-fbd8-4ca7-b38d-683e25c9eb97'), _FLAG_READ | _FLAG_WRITE_NO_RESPONSE | _FLAG_INDICATE)
         
@@ -71,11 +154,88 @@ class BLEPeripheral:
         self.ble.gatts_write(self.registered_service[0][0], state_bytes)
         print(f"Characteristic updated to: {self.led_on}")
 
-    def send_indication(self):
-        #Notify central device of characteristic state change
-        if self.connected and self.conn_handle is not None:
-            self.ble.gatts_indicate(self.conn_handle, self.registered_service[0][0])
-            print(f"--Notification sent to central: {self.conn_handle}")
+    def trip(self, irq_us=None):
+        """The flag switch closed: count it, advertise it and, when connected, indicate it"""
+        self.trip_counter = (self.trip_counter + 1) & 0xFF
+        if self.advertising or BROADCAST_MODE:
+            self.advertise()
+        if not BROADCAST_MODE:
+            self.send_indication(irq_us)
+
+    def manufacturer_data(self):
+        flags = 1 if button_a.value() == 0 else 0
+        payload = bytes((_BROADCAST_COMPANY_ID & 0xFF, _BROADCAST_COMPANY_ID >> 8, _BROADCAST_MAGIC, _BROADCAST_VERSION,
+                         self.device_id & 0xFF, self.device_id >> 8, flags, self.trip_counter))
+        # Manufacturer Specific Data (type 0xFF)
+        return bytes((len(payload) + 1, 0xFF)) + payload
+
+    def send_indication(self, irq_us=None):
+        """Queue a trip event, delivery_task() indicates it once the previous one has been confirmed"""
+        # Every trip takes a sequence number, even one dropped here, so the central sees the gap
+        self.seq = (self.seq + 1) & 0xFFFF
+        head = (self.trip_head + 1) % TRIP_QUEUE_SIZE
+        if head == self.trip_tail:
+            self.dropped += 1
+            return False
+        self.trips[self.trip_head] = time.ticks_ms()
+        self.trip_seqs[self.trip_head] = self.seq
+        self.trip_irq[self.trip_head] = time.ticks_us() if irq_us is None else irq_us
+        self.trip_head = head
+        self.trip_queued.set()
+        return True
+
+    async def delivery_task(self):
+        while True:
+            if self.trip_head == self.trip_tail or not self.connected:
+                # Also set on connect, so trips queued while disconnected go out then
+                await self.trip_queued.wait()
+                continue
+            delivered = await self.deliver()
+            if delivered is None:
+                # Link lost, keep the trip for the next central
+                continue
+            if delivered:
+                self.confirmed += 1
+            else:
+                self.dropped += 1
+            self.trip_tail = (self.trip_tail + 1) % TRIP_QUEUE_SIZE
+
+    def battery_percent(self):
+        mv = self.battery_adc.read_u16() * BATTERY_FULL_SCALE_MV * 2 // 65535
+        return max(0, min(100, (mv - BATTERY_EMPTY_MV) * 100 // (BATTERY_FULL_MV - BATTERY_EMPTY_MV)))
+
+    async def deliver(self):
+        """Indicate the oldest trip until the central confirms it: True, gave up: False, disconnected: None"""
+        tail = self.trip_tail
+        flags = 1 if button_a.value() == 0 else 0
+        struct.pack_into(_MESSAGE_FORMAT, self.message, 0, _PROTOCOL_VERSION, _EVENT_TRIP, self.trip_seqs[tail],
+                         self.trips[tail], flags, self.battery_percent(), 0, 0)
+        for attempt in range(INDICATE_RETRIES + 1):
+            if attempt:
+                self.retried += 1
+                await asyncio.sleep_ms(INDICATE_BACKOFF_MS * attempt)
+            if not self.connected:
+                return None
+            self.indicate_done.clear()
+            sent_us = time.ticks_us()
+            struct.pack_into("<II", self.message, _DELAY_OFFSET, time.ticks_diff(sent_us, self.trip_irq[tail]), self.last_rtt_us)
+            try:
+                self.ble.gatts_indicate(self.connection_handle, self.registered_service[0][0], self.message)
+            except OSError as e:
+                print(f"--Indication failed: { e }")
+                continue
+            self.sent += 1
+            try:
+                await asyncio.wait_for_ms(self.indicate_done.wait(), INDICATE_TIMEOUT_MS)
+            except asyncio.TimeoutError:
+                print("--Indication not confirmed")
+                continue
+            self.last_rtt_us = time.ticks_diff(time.ticks_us(), sent_us)
+            if self.indicate_status == 0:
+                print(f"--Indication confirmed by central: { self.connection_handle }")
+                return True
+            print(f"--Indication status: { self.indicate_status }")
+        return False
 
     def advertise(self):
         # BLE advertising parameters
@@ -85,15 +245,16 @@ class BLEPeripheral:
         adv_flags = b'\x02\x01\x06'
         
         # Complete Local Name (type 0x09)
-        adv_name = b'\x0B\x09' + name.encode()
+        adv_name = bytes((len(name) + 1, 0x09)) + name.encode()
         
-        # Combine advertising flags and name
-        adv_data = adv_flags + adv_name
+        # Combine advertising flags, name and the tipup state
+        adv_data = adv_flags + adv_name + self.manufacturer_data()
         
-        # Start advertising with the modified advertisement data
-        self.ble.gap_advertise(100, adv_data)
+        # Start advertising with the modified advertisement data, broadcast tipups don't take connections
+        self.ble.gap_advertise(100, adv_data, connectable=not BROADCAST_MODE)
         
         self.advertising = True
+        self.advertise_started = time.ticks_ms()
         message = "Advertising started..."
         print(message)
 
@@ -107,11 +268,13 @@ class BLEPeripheral:
         print(f"BLE Event code received: { event }")  # Debug line
 
         if event == _IRQ_CENTRAL_CONNECT:
-            self.conn_handle, addr_type, addr = data
+            self.connection_handle, addr_type, addr = data
             print(f"Connected to device { self.address_from_bytes(addr) }")
 
             self.stop_advertising()
             self.connected = True
+            self.state_changed.set()
+            self.trip_queued.set()
 
         elif event == _IRQ_CENTRAL_DISCONNECT:
             conn_handle, addr_type, addr = data
@@ -120,7 +283,17 @@ class BLEPeripheral:
             print(message)
             self.advertise()
             self.connected = False
-            self.conn_handle = None 
+            self.connection_handle = None 
+            self.state_changed.set()
+
+        elif event == _IRQ_MTU_EXCHANGED:
+            conn_handle, mtu = data
+            self.mtu = mtu
+
+        elif event == _IRQ_GATTS_INDICATE_DONE:
+            conn_handle, value_handle, status = data
+            self.indicate_status = status
+            self.indicate_done.set()
 
         elif event == _IRQ_GATTS_WRITE:
             conn_handle, attr_handle = data
@@ -138,23 +311,73 @@ class BLEPeripheral:
                 self.update_characteristic()  # Update the characteristic with new LED state
                 print(f"LED state toggled: OFF")
 
-    def update_led(self):
-        if self.advertising and not self.connected:
-            # Blink the LED while advertising and not connected
-            self.led_on = not self.led_on
-            self.led.value(self.led_on)
+    def radio_idle(self):
+        return not self.connected and not self.advertising
+
+    async def idle(self, ms):
+        """Wait ms, in lightsleep when nothing on the radio needs the CPU"""
+        if LIGHTSLEEP_WITH_RADIO or self.radio_idle():
+            closed = button_a.value() == 0
+            # Wake on the flag switch leaving its current position, waking on low while it is held closed
+            # would end every sleep straight away
+            esp32.wake_on_ext0(pin=button_a, level=esp32.WAKEUP_ANY_HIGH if closed else esp32.WAKEUP_ALL_LOW)
+            lightsleep(ms)
+            # The IRQ doesn't run for the edge that woke the chip
+            if wake_reason() == PIN_WAKE:
+                button_a_handler(button_a)
+            await asyncio.sleep_ms(0)
         else:
-            # Ensure the LED is set to the correct state if not advertising
-            self.led.value(self.led_on)
-
-# Create an instance of the BLEPeripheral class to start advertising
-ble_peripheral = BLEPeripheral()
-
-# Keep the script running
-while True:
-    time.sleep(0.5)
-    ble_peripheral.update_led()
-    if button_a_pressed:
-        print("Button A Pressed")
-        ble_peripheral.send_indication()
-        button_a_pressed = False
\ No newline at end of file
+            await asyncio.sleep_ms(ms)
+
+    async def indication_task(self):
+        while True:
+            await button_a_flag.wait()
+            irq_us = trip_irq_us[0]
+            flag_edge_pending[0] = 0
+            closed = button_a.value() == 0
+            if closed != self.flag_closed:
+                self.flag_closed = closed
+                if closed and not self.connected and not self.advertising:
+                    # Woken from the radio-off sleep: only make the tipup findable again, nobody armed it
+                    print("Flag closed, advertising again")
+                    self.advertise()
+                elif closed:
+                    print("Button A Pressed")
+                    self.trip(irq_us)
+                elif self.advertising:
+                    # Advertise the flag state going back to set
+                    self.advertise()
+            # Edges until the contacts settle are bounce, the level read after them decides the next change
+            await asyncio.sleep_ms(FLAG_DEBOUNCE_MS)
+
+    async def led_task(self):
+        while True:
+            if self.advertising and not self.connected:
+                self.led.value(1)
+                await asyncio.sleep_ms(LED_PULSE_MS)
+                self.led.value(0)
+                # A broadcast tipup has no other way to report, it never stops
+                if ADVERTISE_TIMEOUT_MS and not BROADCAST_MODE and time.ticks_diff(time.ticks_ms(), self.advertise_started) > ADVERTISE_TIMEOUT_MS:
+                    self.stop_advertising()
+                    continue
+                await self.idle(LED_PERIOD_MS - LED_PULSE_MS)
+            elif self.radio_idle():
+                self.led.value(0)
+                await self.idle(LED_PERIOD_MS)
+            else:
+                # Connected, the LED shows the state the central wrote and nothing changes until it does
+                self.led.value(self.led_on)
+                await self.state_changed.wait()
+
+    async def run(self):
+        asyncio.create_task(self.led_task())
+        if not BROADCAST_MODE:
+            asyncio.create_task(self.delivery_task())
+        await self.indication_task()
+
+if __name__ == "__main__":
+    # Create an instance of the BLEPeripheral class to start advertising
+    ble_peripheral = BLEPeripheral()
+
+    # Everything from here on is driven by IRQs and timers
+    asyncio.run(ble_peripheral.run())
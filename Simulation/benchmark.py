@@ -0,0 +1,603 @@
+"""Scripted scenarios against the simulated receiver and tipups, reporting display and latency numbers
+
+    python Simulation/benchmark.py [--tipups N] [--broadcast-tipups N] [--scenario NAME ...] [--output bench_output.txt]
+                                   [--verbose] [--palette]
+
+Times marked "virtual" come from the simulated clock (radio round trips, SPI transfer time at the
+RP2040 baud rate). "host" times are CPU time on this machine and are only useful for comparing runs.
+Rows with a limit are marked ok or FAIL and any failure makes the exit status 1. A scenario picked
+with --scenario also runs the scenarios it needs first, e.g. alerts needs the tipups armed.
+"""
+import argparse, asyncio, contextlib, io, os, sys, time, tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import simulator
+
+# Rough ESP32 supply current for the tipup sleep estimate: awake with the radio on, and in lightsleep
+ESP32_AWAKE_MA = 30.0
+ESP32_LIGHTSLEEP_MA = 0.8
+
+
+class Report:
+    def __init__(self):
+        self.rows = []
+
+    def add(self, name, value, unit, at_most=None, at_least=None, equals=None):
+        """Add a row, checked against whichever of the limits are given"""
+        passed = None
+        if at_most is not None or at_least is not None or equals is not None:
+            passed = ((at_most is None or value <= at_most) and (at_least is None or value >= at_least)
+                      and (equals is None or value == equals))
+        self.rows.append((name, value, unit, passed))
+
+    def failures(self):
+        return [name for name, _, _, passed in self.rows if passed is False]
+
+    def format(self):
+        width = max(len(name) for name, _, _, _ in self.rows)
+        lines = []
+        for name, value, unit, passed in self.rows:
+            if isinstance(value, float):
+                value = f"{ value:.2f}"
+            status = "" if passed is None else "ok    " if passed else "FAIL  "
+            lines.append(f"{ status or '      ' }{ name.ljust(width) }  { value } { unit }")
+        return "\n".join(lines)
+
+
+class DisplayProbe:
+    """Wraps LCD_1inch3.record_flush() to count flushes and remember when each one finished"""
+    def __init__(self, sim, display, manager):
+        self.sim = sim
+        self.display = display
+        self.manager = manager
+        self.shows = 0
+        self.flushes = []   # (virtual ms, active menu class name)
+        record_flush = display.record_flush
+
+        # Called at the end of both show() and show_async(), whichever the flush went through
+        def counted_flush(*args, **kwargs):
+            result = record_flush(*args, **kwargs)
+            self.shows += 1
+            menu = type(manager.active_menu).__name__ if manager.active_menu is not None else None
+            self.flushes.append((sim.now_ms(), menu))
+            return result
+        display.record_flush = counted_flush
+
+    def bytes(self):
+        return self.display.spi.bytes_written
+
+    def first_flush_after(self, start_ms, menu_name):
+        for when, menu in self.flushes:
+            if when >= start_ms and menu == menu_name:
+                return when
+        return None
+
+
+def addresses_of(peripherals):
+    return [":".join(f"{ b:02X}" for b in tipup.ble.config("mac")[1]) for tipup in peripherals]
+
+
+async def until(predicate, timeout=20, step=0.005):
+    deadline = asyncio.get_event_loop().time() + timeout
+    while not predicate():
+        if asyncio.get_event_loop().time() > deadline:
+            raise TimeoutError("scenario condition not reached")
+        await asyncio.sleep(step)
+
+
+async def press(pin, settle=0.35):
+    # Buttons are debounced for 300 ms, so leave room before the next press of the same button
+    pin.press()
+    await asyncio.sleep(settle)
+
+
+class Bench:
+    """What the scenarios share: the running receiver, the display probe and the simulated tipups"""
+    def __init__(self, sim, central, peripheral_module, tipups, broadcast_tipups, report):
+        self.sim = sim
+        self.central = central
+        self.peripheral_module = peripheral_module
+        self.tipups = tipups
+        self.broadcast_tipups = broadcast_tipups
+        self.report = report
+        self.display = central.display
+        self.manager = central.menu_manager
+        self.buttons = central.buttons
+        self.menus = central.menus
+        self.probe = DisplayProbe(sim, self.display, self.manager)
+        self.peripherals = []
+        self.tasks = []
+
+    async def alert_frame_after(self, start_ms):
+        """Virtual ms from start_ms to the first alert frame on the panel"""
+        probe = self.probe
+        await until(lambda: probe.first_flush_after(start_ms, "AlertMenu") is not None)
+        return probe.first_flush_after(start_ms, "AlertMenu") - start_ms
+
+    def stop(self):
+        for task in self.tasks:
+            task.cancel()
+
+
+# Name -> (scenario, names of the scenarios it needs run first), in the order they run
+SCENARIOS = {}
+
+
+def scenario(*needs):
+    def register(function):
+        SCENARIOS[function.__name__] = (function, needs)
+        return function
+    return register
+
+
+@scenario()
+async def boot(bench):
+    """Boot to the main menu"""
+    report, probe, manager = bench.report, bench.probe, bench.manager
+    start_bytes = probe.bytes()
+    bench.tasks.append(asyncio.create_task(bench.central.run()))
+    await until(lambda: isinstance(manager.active_menu, bench.menus.MainMenu))
+    # Nobody presses a button in the first half second after power-up
+    await asyncio.sleep(0.5)
+    # One full frame and the spinner, not a frame per widget
+    report.add("boot: bytes flushed", probe.bytes() - start_bytes, "B", at_most=120000)
+    report.add("boot: show() calls", probe.shows, "", at_most=2)
+
+
+@scenario("boot")
+async def navigation(bench):
+    """Move the main menu selector and redraw the whole menu"""
+    report, probe, manager = bench.report, bench.probe, bench.manager
+    moves = 6
+    start_bytes, start_shows = probe.bytes(), probe.shows
+    for _ in range(moves):
+        await press(bench.buttons.right_button)
+    # Only the cell the selector left and the one it moved to
+    report.add("selector move: bytes flushed", (probe.bytes() - start_bytes) / moves, "B/move", at_most=800)
+    report.add("selector move: show() calls", (probe.shows - start_shows) / moves, "/move", at_most=1)
+
+    # Full menu redraw, CPU cost on the host
+    repeats = 20
+    started = time.perf_counter()
+    for _ in range(repeats):
+        await manager.active_menu.draw_menu()
+    report.add("main menu redraw: render time", (time.perf_counter() - started) * 1000 / repeats, "ms host")
+    await manager.set_active_menu(manager.menu(bench.menus.MainMenu))
+
+
+@scenario("boot")
+async def scan(bench):
+    """Open the device picker with tipups advertising"""
+    sim, report, probe, manager, tipups = bench.sim, bench.report, bench.probe, bench.manager, bench.tipups
+    menus = bench.menus
+    bench.peripherals = sim.peripherals(bench.peripheral_module, tipups)
+    bench.tasks += [asyncio.create_task(tipup.delivery_task()) for tipup in bench.peripherals]
+    # The tipups are set out a little while before the receiver's device picker is opened
+    await asyncio.sleep(5)
+    report.add("scan: tipups in background table", len(manager.scanner.slots()), "", equals=tipups)
+    await manager.set_active_menu(manager.menu(menus.MainMenu))
+    start_ms, start_bytes, start_shows = sim.now_ms(), probe.bytes(), probe.shows
+    await press(bench.buttons.select_button, settle=0)
+    await until(lambda: isinstance(manager.active_menu, menus.DevicesMenu) and len(manager.active_menu.device_order) > 0)
+    # Listed straight from the background table, not after a fresh scan window
+    report.add("scan: first selectable device", sim.now_ms() - start_ms, "ms virtual", at_most=100)
+    await until(lambda: len(manager.active_menu.device_order) >= tipups)
+    report.add(f"scan: all { tipups } tipups listed", sim.now_ms() - start_ms, "ms virtual", at_most=1000)
+    await until(lambda: manager.active_menu.scan_task_obj.done(), timeout=10)
+    await asyncio.sleep(0.1)
+    report.add("scan: bytes flushed per show()", (probe.bytes() - start_bytes) / max(probe.shows - start_shows, 1), "B",
+               at_most=10000)
+
+
+@scenario("scan")
+async def arm(bench):
+    """Arm every tipup in the picker at once, one with a trip it queued while nobody was connected"""
+    sim, manager, report = bench.sim, bench.manager, bench.report
+    scheduler = bench.central.alert_scheduler
+    queued = bench.peripherals[0]
+    queued.send_indication()
+    start_ms = sim.now_ms()
+    await press(bench.buttons.A_button, settle=0)
+    await until(lambda: len(manager.connected_devices) >= bench.tipups, timeout=60)
+    # Connections overlap, arming all of them should not take a connect per tipup back to back
+    report.add(f"arm: { bench.tipups } tipups armed", sim.now_ms() - start_ms, "ms virtual", at_most=1000)
+    await asyncio.sleep(0.5)
+    # Indicated as soon as it was connected, before the receiver had it armed
+    tipup = manager.connected_devices[addresses_of([queued])[0]]
+    report.add("arm: queued trip alerted on its tipup", tipup.alert_count, "", equals=1)
+    report.add("arm: trips put down to an unknown tipup", 0 if scheduler.unknown.alert_acknowledged else scheduler.unknown.alert_count,
+               "", equals=0)
+    await press(bench.buttons.B_button)
+
+
+@scenario("arm")
+async def alerts(bench):
+    """Flag trips, from gatts_indicate() to the first alert frame on the panel"""
+    sim, report, probe = bench.sim, bench.report, bench.probe
+    latencies = []
+    for i in range(5):
+        start_ms = sim.now_ms()
+        bench.peripherals[i % bench.tipups].send_indication()
+        latencies.append(await bench.alert_frame_after(start_ms))
+        start_bytes, start_ms = probe.bytes(), sim.now_ms()
+        await asyncio.sleep(2)
+        if i == 0:
+            # The flashing alert only redraws what changes between phases
+            report.add("alert: bytes flushed per second", (probe.bytes() - start_bytes) * 1000 / (sim.now_ms() - start_ms),
+                       "B/s", at_most=1000)
+        await press(bench.buttons.B_button)
+    latencies.sort()
+    report.add("alert: latency min", latencies[0], "ms virtual")
+    report.add("alert: latency median", latencies[len(latencies) // 2], "ms virtual", at_most=50)
+    report.add("alert: latency max", latencies[-1], "ms virtual", at_most=100)
+
+
+@scenario("arm")
+async def burst(bench):
+    """A burst of trips from every tipup should still be one alert screen drawn by one task"""
+    report = bench.report
+    scheduler = bench.central.alert_scheduler
+    trips = 20
+    start_renders, start_notified = scheduler.renders, scheduler.notified
+    for i in range(trips):
+        bench.peripherals[i % bench.tipups].send_indication()
+    await asyncio.sleep(1)
+    render_tasks = [task for task in asyncio.all_tasks() if "AlertScheduler.run" in task.get_coro().__qualname__]
+    report.add(f"alert burst: { trips } indications handled", scheduler.notified - start_notified, "", equals=trips)
+    report.add("alert burst: render tasks", len(render_tasks), "", equals=1)
+    # The burst is confirmed one indication per tipup at a time over about 200 ms, a redraw every ALERT_REDRAW_MS
+    report.add("alert burst: screen updates", scheduler.renders - start_renders, "", at_most=5)
+    await press(bench.buttons.B_button)
+
+
+@scenario("arm")
+async def tipup_trips(bench):
+    """Flag switch on a tipup running its own event loop, then rapid trips queued on it"""
+    sim, report = bench.sim, bench.report
+    tipup = bench.peripherals[0]
+    indicated = []
+    gatts_indicate = tipup.ble.gatts_indicate
+
+    # Pin IRQ to gatts_indicate() and to the alert frame
+    def timed_indicate(*args):
+        indicated.append(sim.now_ms())
+        return gatts_indicate(*args)
+    tipup.ble.gatts_indicate = timed_indicate
+    tipup_task = asyncio.create_task(tipup.indication_task())
+    await asyncio.sleep(0.1)
+    start_ms = sim.now_ms()
+    flag = bench.peripheral_module.button_a
+    flag.hold()
+    # Contact bounce on the way closed, inside the debounce time
+    for _ in range(3):
+        flag.release()
+        flag.hold()
+    frame_ms = await bench.alert_frame_after(start_ms)
+    report.add("tipup: flag to indication sent", indicated[0] - start_ms, "ms virtual", at_most=5)
+    report.add("tipup: flag to alert frame", frame_ms, "ms virtual", at_most=100)
+    await asyncio.sleep(0.5)
+    report.add("tipup: indications from one bouncy closure", len(indicated), "", equals=1)
+    flag.release()
+    await asyncio.sleep(0.1)
+    await press(bench.buttons.B_button)
+    tipup_task.cancel()
+    tipup.ble.gatts_indicate = gatts_indicate
+
+    # Rapid trips go out back to back, each after the last one was confirmed
+    trips = 6
+    start_ms, start_confirmed = sim.now_ms(), tipup.confirmed
+    for _ in range(trips):
+        tipup.send_indication()
+    await until(lambda: tipup.confirmed - start_confirmed >= trips)
+    report.add(f"tipup: { trips } queued trips confirmed", sim.now_ms() - start_ms, "ms virtual", at_most=500)
+    await asyncio.sleep(1)
+    await press(bench.buttons.B_button)
+    peripherals = bench.peripherals
+    report.add("tipup: sent/confirmed/retried", "/".join(str(sum(getattr(tipup, name) for tipup in peripherals))
+                                                          for name in ("sent", "confirmed", "retried")), "")
+    report.add("tipup: trips dropped", sum(tipup.dropped for tipup in peripherals), "", equals=0)
+    report.add("indications dropped", bench.manager.indications.dropped, "", equals=0)
+
+
+@scenario("alerts")
+async def fish_on(bench):
+    """Where a fish-on spends its time, from every traced trip so far"""
+    import latency_trace
+    report = bench.report
+    latency = bench.manager.latency
+    for name, (avg, p50, p90, top) in latency.stats().items():
+        report.add(f"fish-on { name } avg/p50/p90/max", f"{ avg / 1000:.1f}/{ p50 / 1000:.1f}/{ p90 / 1000:.1f}/{ top / 1000:.1f}",
+                   "ms virtual")
+    report.add("fish-on total histogram", " ".join(f"<={ bound // 1000 if bound else 'inf' }ms:{ count }"
+                                                   for bound, count in latency.histogram() if count), f"{ latency.samples } samples")
+    p90 = latency.percentile(latency_trace.TOTAL, 0.9) / 1000
+    report.add("fish-on total p90", p90, "ms virtual", at_most=250)
+
+
+@scenario("arm")
+async def links(bench):
+    """Short connection intervals while the receiver is in use, long ones once it's left alone"""
+    sim, report, manager, menus = bench.sim, bench.report, bench.manager, bench.menus
+
+    def all_on(profile):
+        return all(t.status == "armed" and t.profile == profile for t in manager.connected_devices.values())
+
+    armed = list(manager.connected_devices.values())
+    report.add(f"links: { menus.PROFILE_ACTIVE } interval", armed[0].connection.link.interval_us / 1000, "ms virtual",
+               at_most=15)
+    await asyncio.sleep(menus.RECEIVER_IDLE_MS / 1000 + 1)
+    await until(lambda: all_on(menus.PROFILE_IDLE), timeout=10)
+    armed = list(manager.connected_devices.values())
+    report.add(f"links: { menus.PROFILE_IDLE } interval", armed[0].connection.link.interval_us / 1000, "ms virtual",
+               at_least=100)
+    start_ms = sim.now_ms()
+    bench.peripherals[0].send_indication()
+    report.add(f"links: alert latency on { menus.PROFILE_IDLE }", await bench.alert_frame_after(start_ms), "ms virtual",
+               at_most=500)
+    start_ms = sim.now_ms()
+    await press(bench.buttons.B_button, settle=0)
+    await until(lambda: all_on(menus.PROFILE_ACTIVE), timeout=10)
+    report.add(f"links: back to { menus.PROFILE_ACTIVE }", sim.now_ms() - start_ms, "ms virtual", at_most=1000)
+    # The controller reporting new parameters, e.g. after the tipup asked for them
+    tipup = armed[0]
+    sim.radio.update_connection(tipup.connection.link, 30000, 2, 5000)
+    report.add("links: recorded after update", f"{ tipup.conn_interval_us }us/{ tipup.conn_latency }/{ tipup.supervision_timeout_ms }ms",
+               "")
+    report.add("links: interval recorded after update", tipup.conn_interval_us, "us", equals=30000)
+    await asyncio.sleep(0.5)
+
+
+@scenario("arm")
+async def protocol(bench):
+    """Overfill one tipup's trip queue: the dropped trips show up as sequence gaps on the receiver"""
+    import tipup_protocol
+    report, manager = bench.report, bench.manager
+    tipup, sender = manager.connected_devices[addresses_of(bench.peripherals[1:2])[0]], bench.peripherals[1]
+    start_missed, start_confirmed = tipup.missed_events, sender.confirmed
+    for _ in range(10):
+        sender.send_indication()
+    await until(lambda: sender.trip_head == sender.trip_tail)
+    # The gap only shows once a later message arrives
+    sender.send_indication()
+    await until(lambda: sender.trip_head == sender.trip_tail)
+    await asyncio.sleep(0.5)
+    dropped = 11 - (sender.confirmed - start_confirmed)
+    report.add("protocol: ATT MTU", tipup.mtu, "B", at_least=tipup_protocol.MESSAGE_SIZE)
+    report.add("protocol: trips dropped", dropped, "", at_least=1)
+    report.add("protocol: trips seen as missed", tipup.missed_events - start_missed, "", equals=dropped)
+    report.add("protocol: battery/flag from last message", f"{ tipup.battery }%/{ tipup.flag_state }", "")
+    await press(bench.buttons.B_button)
+
+
+@scenario("arm")
+async def link_lost(bench):
+    """A tipup that goes out of range while its link is remade, or while armed, is shown as lost and armed again once back"""
+    sim, report, manager, menus = bench.sim, bench.report, bench.manager, bench.menus
+    sender = bench.peripherals[-1]
+    tipup = manager.connected_devices[addresses_of([sender])[0]]
+    gap_advertise = sender.ble.gap_advertise
+    # Out of range: nothing it advertises reaches the receiver
+    sender.ble.gap_advertise = lambda *args, **kwargs: None
+    try:
+        start_ms = sim.now_ms()
+        # Ask for the other profile for this tipup alone
+        profile = manager.link_profile
+        manager.link_profile = menus.PROFILE_IDLE if profile == menus.PROFILE_ACTIVE else menus.PROFILE_ACTIVE
+        await manager.renegotiate(tipup)
+        manager.link_profile = profile
+        attempts_ms = sum(menus.CONNECT_TIMEOUT_MS + menus.RECONNECT_BACKOFF_MS * attempt
+                          for attempt in range(menus.RECONNECT_ATTEMPTS))
+        report.add("link lost: reported after", sim.now_ms() - start_ms, "ms virtual", at_most=attempts_ms + 1000)
+        report.add("link lost: status", tipup.status, "", equals="lost")
+        await until(lambda: bench.central.alert_scheduler.showing())
+        report.add("link lost: alert screen up", bench.central.alert_scheduler.showing(), "", equals=True)
+    finally:
+        sender.ble.gap_advertise = gap_advertise
+    start_ms = sim.now_ms()
+    sender.advertise()
+    await until(lambda: tipup.status == "armed", timeout=(menus.LINK_LOST_RETRY_MS + menus.CONNECT_TIMEOUT_MS) / 1000 + 5)
+    report.add("link lost: armed again once back", sim.now_ms() - start_ms, "ms virtual",
+               at_most=menus.LINK_LOST_RETRY_MS + menus.CONNECT_TIMEOUT_MS)
+    await press(bench.buttons.B_button)
+
+    # Out of range while armed, the link drops without the receiver asking
+    sender.ble.gap_advertise = lambda *args, **kwargs: None
+    try:
+        start_ms = sim.now_ms()
+        sim.radio.disconnect(tipup.connection.link)
+        await until(lambda: bench.central.alert_scheduler.showing())
+        report.add("link dropped: alert screen up", sim.now_ms() - start_ms, "ms virtual", at_most=100)
+        report.add("link dropped: status", tipup.status, "", equals="lost")
+    finally:
+        sender.ble.gap_advertise = gap_advertise
+    start_ms = sim.now_ms()
+    sender.advertise()
+    await until(lambda: tipup.status == "armed", timeout=(menus.LINK_LOST_RETRY_MS + menus.CONNECT_TIMEOUT_MS) / 1000 + 5)
+    report.add("link dropped: armed again once back", sim.now_ms() - start_ms, "ms virtual",
+               at_most=menus.LINK_LOST_RETRY_MS + menus.CONNECT_TIMEOUT_MS)
+    await press(bench.buttons.B_button)
+
+
+@scenario("boot")
+async def broadcast(bench):
+    """Broadcast tipups, more than the receiver has connection slots, watched from advertisements only"""
+    sim, report, manager = bench.sim, bench.report, bench.manager
+    peripheral_module, count = bench.peripheral_module, bench.broadcast_tipups
+    peripheral_module.BROADCAST_MODE = True
+    try:
+        broadcasters = sim.peripherals(peripheral_module, count)
+        monitor = manager.broadcast_monitor
+        await until(lambda: len(manager.broadcast_devices) >= count, timeout=10)
+        start_ms = sim.now_ms()
+        for tipup in broadcasters:
+            tipup.trip()
+        addresses = addresses_of(broadcasters)
+        await until(lambda: all(manager.broadcast_devices[addr].alert_count for addr in addresses), timeout=10)
+        report.add(f"broadcast: { count } tipups trip to alert", sim.now_ms() - start_ms, "ms virtual", at_most=1000)
+        report.add("broadcast: tipups tracked", len(manager.broadcast_devices), "", at_least=count)
+        report.add("broadcast: trips seen/adverts heard", f"{ monitor.trips }/{ monitor.adverts }", "")
+        await press(bench.buttons.B_button)
+    finally:
+        peripheral_module.BROADCAST_MODE = False
+
+
+@scenario()
+async def sleep(bench):
+    """An unarmed tipup with an advertising timeout stops advertising and sleeps, closing its flag only makes it
+    findable again, also with the switch left closed"""
+    import machine
+    sim, report, module = bench.sim, bench.report, bench.peripheral_module
+    tipup = sim.peripherals(module, 1)[0]
+    trips = []
+    trip = tipup.trip
+
+    def counted_trip(*args):
+        trips.append(sim.now_ms())
+        return trip(*args)
+    tipup.trip = counted_trip
+    tasks = [asyncio.create_task(tipup.led_task()), asyncio.create_task(tipup.indication_task())]
+    timeout_ms, window_ms = 300000, 600000
+    module.ADVERTISE_TIMEOUT_MS = timeout_ms
+
+    def asleep_share(start_ms, start_slept):
+        return (machine.slept_ms - start_slept) / max(sim.now_ms() - start_ms, 1)
+
+    def estimate_ma(share):
+        return share * ESP32_LIGHTSLEEP_MA + (1 - share) * ESP32_AWAKE_MA
+
+    try:
+        start_ms = sim.now_ms()
+        await until(lambda: not tipup.advertising, timeout=timeout_ms / 1000 + 10)
+        report.add("sleep: advertising stopped after", sim.now_ms() - start_ms, "ms virtual",
+                   at_most=timeout_ms + 2 * module.LED_PERIOD_MS)
+        start_ms, start_slept = sim.now_ms(), machine.slept_ms
+        await asyncio.sleep(window_ms / 1000)
+        share = asleep_share(start_ms, start_slept)
+        report.add("sleep: time asleep once stopped", share * 100, "%", at_least=95)
+        report.add("sleep: average current once stopped", estimate_ma(share), "mA estimate")
+
+        # The flag switch stays closed: advertising again without a trip, then back to sleep
+        module.button_a.hold()
+        await until(lambda: tipup.advertising)
+        await until(lambda: not tipup.advertising, timeout=timeout_ms / 1000 + 10)
+        start_ms, start_slept = sim.now_ms(), machine.slept_ms
+        await asyncio.sleep(window_ms / 1000)
+        share = asleep_share(start_ms, start_slept)
+        report.add("sleep: trips from closing the flag to wake", len(trips), "", equals=0)
+        report.add("sleep: trip events queued", (tipup.trip_head - tipup.trip_tail) % module.TRIP_QUEUE_SIZE, "", equals=0)
+        report.add("sleep: time asleep with the switch closed", share * 100, "%", at_least=95)
+    finally:
+        module.ADVERTISE_TIMEOUT_MS = 0
+        module.button_a.release()
+        for task in tasks:
+            task.cancel()
+        if tipup.advertising:
+            tipup.stop_advertising()
+
+
+@scenario("boot")
+async def heap(bench):
+    """Heap growth over repeated menu round trips, traced with tracemalloc only here as it slows the host"""
+    report, manager, buttons = bench.report, bench.manager, bench.buttons
+    tracemalloc.start()
+    try:
+        manager.heap.reset()
+        await manager.set_active_menu(manager.menu(bench.menus.MainMenu))
+        round_trips = 10
+        manager.heap.sample()
+        start_alloc = manager.heap.begin()
+        for _ in range(round_trips):
+            for button in (buttons.right_button, buttons.right_button, buttons.select_button, buttons.Y_button):
+                await press(button)
+        manager.heap.sample()
+        report.add(f"heap: growth over { round_trips } Options round trips", manager.heap.begin() - start_alloc, "B host")
+        for label, average, top, count in manager.heap.growth()[:3]:
+            report.add(f"heap: { label } avg/max growth", f"{ average }/{ top }", f"B host, { count }x")
+    finally:
+        tracemalloc.stop()
+    # Pooled menus: one instance per class however often it was navigated to
+    menu_classes = sum(1 for value in vars(bench.menus).values()
+                       if isinstance(value, type) and issubclass(value, bench.menus.BaseMenu) and value is not bench.menus.BaseMenu)
+    report.add("menus: instances after run", len(manager.menus), "", at_most=menu_classes)
+
+
+@scenario("boot")
+async def display(bench):
+    """Totals from the display driver over everything that ran before"""
+    report, display = bench.report, bench.display
+    stats = display.stats()
+    report.add("display: frame buffer", len(display.buffer), "B")
+    report.add("display: flush time avg", stats["flush_us_avg"], "us virtual")
+    report.add("display: flush time max", stats["flush_us_max"], "us virtual")
+    report.add("display: commands per show()", stats["commands"] / max(stats["shows"], 1), "")
+    report.add("display: show requests/flushes", f"{ stats['requests'] }/{ stats['shows'] }", "")
+    report.add("display: flushes", stats["shows"], "", at_most=max(stats["requests"], 1))
+    # The longest the event loop sits in one blocking write to the panel, a band of rows at most
+    spi = display.spi
+    report.add("display: longest blocking SPI write", spi.longest_write * 8 / spi.baudrate * 1e6, "us virtual",
+               at_most=2000)
+    report.add("display: DMA transfers", spi.dma_transfers, "")
+    for name, (shows, sent) in stats["callers"].items():
+        report.add(f"display: { name } flushes", f"{ shows } / { sent }", "shows/B")
+
+
+def plan(names):
+    """The scenarios to run for names, with what they need, in registration order"""
+    wanted = set()
+
+    def need(name):
+        if name not in wanted:
+            wanted.add(name)
+            for other in SCENARIOS[name][1]:
+                need(other)
+    for name in names:
+        need(name)
+    return [name for name in SCENARIOS if name in wanted]
+
+
+async def run_scenarios(bench, names):
+    try:
+        for name in names:
+            await SCENARIOS[name][0](bench)
+    finally:
+        bench.stop()
+    return bench.report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tipups", type=int, default=3)
+    parser.add_argument("--broadcast-tipups", type=int, default=8)
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS), help="run only this scenario, repeatable")
+    parser.add_argument("--output", help="also write the report to this file")
+    parser.add_argument("--verbose", action="store_true", help="show the device's own print() output")
+    parser.add_argument("--palette", action="store_true", help="run the receiver with the 4-bpp palette frame buffer")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+
+    sim = simulator.install()
+    device_log = sys.stdout if args.verbose else io.StringIO()
+    with contextlib.redirect_stdout(device_log):
+        if args.palette:
+            # The buffer is picked when lcd_screen is imported, swap it before main creates the display
+            import lcd_screen
+            lcd_screen.PALETTE_MODE = True
+            lcd_screen.screen_buffer = bytearray(lcd_screen.PALETTE_BUFFER_SIZE)
+        import main as central
+        import ble_peripheral_device_esp32 as peripheral_module
+        bench = Bench(sim, central, peripheral_module, args.tipups, args.broadcast_tipups, Report())
+        report = sim.run(run_scenarios(bench, plan(args.scenario or list(SCENARIOS))))
+
+    text = report.format()
+    print(text)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+    failures = report.failures()
+    if failures:
+        print(f"{ len(failures) } checks failed: { ', '.join(failures) }")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
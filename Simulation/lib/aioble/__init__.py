@@ -0,0 +1,9 @@
+# Stand-in for aioble covering the central-side calls used by the receiver, backed by the virtual radio
+from .core import log_level, config, stop
+from .device import Device, DeviceDisconnectedError
+from .central import scan
+from .client import GattError
+from . import core, client
+
+ADDR_PUBLIC = 0
+ADDR_RANDOM = 1
@@ -0,0 +1,110 @@
+import asyncio
+from . import core
+from .device import Device
+
+_ADV_TYPE_NAME_SHORT = 0x08
+_ADV_TYPE_NAME = 0x09
+_ADV_TYPE_UUID16_COMPLETE = 0x03
+_ADV_TYPE_MANUFACTURER = 0xFF
+
+# Duty cycle of the whole simulated scanner, read by benchmarks
+airtime = {"scan_ms": 0.0, "window_ms": 0.0}
+
+
+class ScanResult:
+    def __init__(self, device, adv_data, resp_data, rssi, connectable):
+        self.device = device
+        self.adv_data = adv_data
+        self.resp_data = resp_data
+        self.rssi = rssi
+        self.connectable = connectable
+
+    def _decode_field(self, *adv_type):
+        for payload in (self.adv_data, self.resp_data):
+            if not payload:
+                continue
+            i = 0
+            while i + 1 < len(payload):
+                length = payload[i]
+                if length == 0:
+                    break
+                if payload[i + 1] in adv_type:
+                    yield payload[i + 2:i + length + 1]
+                i += 1 + length
+
+    def name(self):
+        for n in self._decode_field(_ADV_TYPE_NAME_SHORT, _ADV_TYPE_NAME):
+            return bytes(n).decode()
+        return None
+
+    def services(self):
+        for u in self._decode_field(_ADV_TYPE_UUID16_COMPLETE):
+            yield int.from_bytes(u[0:2], "little")
+
+    def manufacturer(self, filter=None):
+        for u in self._decode_field(_ADV_TYPE_MANUFACTURER):
+            if len(u) < 2:
+                continue
+            m = int.from_bytes(u[0:2], "little")
+            if filter is None or m == filter:
+                yield (m, bytes(u[2:]))
+
+
+class scan:
+    """Reports advertisements from every advertising node on the virtual radio
+
+    An advertisement is only heard if it lands inside the scan window, so a low duty cycle misses some
+    """
+    def __init__(self, duration_ms, interval_us=None, window_us=None, active=False):
+        self.duration_ms = duration_ms
+        self.interval_us = interval_us or 1280000
+        self.window_us = min(window_us or 11250, self.interval_us)
+        self.active = active
+        self.next_advert = {}
+
+    async def __aenter__(self):
+        radio = core.ble.radio
+        self.radio = radio
+        self.start = radio.clock.now
+        self.end = None if self.duration_ms == 0 else self.start + self.duration_ms / 1000
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        elapsed = self.radio.clock.now - self.start
+        airtime["scan_ms"] += elapsed * 1000
+        airtime["window_ms"] += elapsed * 1000 * self.window_us / self.interval_us
+        return False
+
+    async def cancel(self):
+        self.end = self.radio.clock.now
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        radio = self.radio
+        duty = self.window_us / self.interval_us
+        while True:
+            now = radio.clock.now
+            if self.end is not None and now >= self.end:
+                raise StopAsyncIteration
+            advertisers = radio.advertisers()
+            for node in advertisers:
+                if node not in self.next_advert:
+                    self.next_advert[node] = now + radio.next_advert_delay(node) * radio.random.random()
+            if not advertisers:
+                wait = 0.1
+                node = None
+            else:
+                node = min(advertisers, key=lambda n: self.next_advert[n])
+                wait = max(self.next_advert[node] - now, 0)
+            if self.end is not None:
+                wait = min(wait, self.end - now)
+            await asyncio.sleep(wait)
+            if node is None or radio.clock.now < self.next_advert.get(node, 0) or not node.advertising():
+                continue
+            self.next_advert[node] = radio.clock.now + radio.next_advert_delay(node)
+            if radio.random.random() >= duty:
+                continue
+            return ScanResult(Device(0, node.mac), node.adv_data, node.resp_data if self.active else b"",
+                              radio.rssi(node), node.connectable)
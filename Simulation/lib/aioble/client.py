@@ -0,0 +1,108 @@
+import asyncio
+import bluetooth
+
+_FLAG_NOTIFY = 0x0010
+_FLAG_INDICATE = 0x0020
+_CCCD_UUID = 0x2902
+
+_IRQ_GATTS_WRITE = 3
+
+
+class GattError(Exception):
+    def __init__(self, status):
+        self._status = status
+
+
+class ClientService:
+    def __init__(self, connection, start_handle, end_handle, uuid):
+        self.connection = connection
+        self._start_handle = start_handle
+        self._end_handle = end_handle
+        self.uuid = uuid
+
+    async def characteristic(self, uuid, timeout_ms=2000):
+        await self.connection._round_trip(2, timeout_ms)
+        for service in self.connection.link.peripheral.services:
+            if service.start_handle != self._start_handle:
+                continue
+            chars = service.characteristics
+            for i, (def_handle, value, cccd) in enumerate(chars):
+                if value.uuid == uuid:
+                    end = chars[i + 1][0] - 1 if i + 1 < len(chars) else service.end_handle
+                    return ClientCharacteristic(self, end, value.handle, value.flags & 0xFF, uuid)
+        return None
+
+
+class BaseClientCharacteristic:
+    def __init__(self, value_handle, properties, uuid):
+        self._value_handle = value_handle
+        self.properties = properties
+        self.uuid = uuid
+
+    def _connection(self):
+        return self.connection
+
+    async def read(self, timeout_ms=1000):
+        connection = self._connection()
+        await connection._round_trip(1, timeout_ms)
+        attribute = connection.link.peripheral.attributes.get(self._value_handle)
+        if attribute is None:
+            raise GattError(0x01)
+        return attribute.value
+
+    async def write(self, data, response=None, timeout_ms=1000):
+        connection = self._connection()
+        if response is None:
+            response = False
+        link = connection.link
+        if response:
+            await connection._round_trip(1, timeout_ms)
+        else:
+            connection._check()
+            await asyncio.sleep(0)
+        peripheral = link.peripheral
+        attribute = peripheral.attributes.get(self._value_handle)
+        if attribute is None:
+            if response:
+                raise GattError(0x01)  # Invalid handle
+            return
+        attribute.value = bytes(data)
+        if attribute.uuid != _CCCD_UUID:
+            peripheral.fire(_IRQ_GATTS_WRITE, (link.conn_handle, self._value_handle))
+
+
+class ClientCharacteristic(BaseClientCharacteristic):
+    def __init__(self, service, end_handle, value_handle, properties, uuid):
+        self.service = service
+        self.connection = service.connection
+        self._end_handle = end_handle if end_handle > value_handle else value_handle + 2
+        super().__init__(value_handle, properties, uuid)
+
+    def _register_with_connection(self):
+        self.connection._characteristics[self._value_handle] = self
+
+    async def descriptor(self, uuid, timeout_ms=2000):
+        await self.connection._round_trip(2, timeout_ms)
+        if uuid != bluetooth.UUID(_CCCD_UUID):
+            return None
+        for handle in range(self._value_handle + 1, self._end_handle + 1):
+            attribute = self.connection.link.peripheral.attributes.get(handle)
+            if attribute is not None and attribute.uuid == _CCCD_UUID:
+                return ClientDescriptor(self, handle, uuid)
+        return None
+
+    async def subscribe(self, notify=True, indicate=False):
+        self._register_with_connection()
+        cccd = await self.descriptor(bluetooth.UUID(_CCCD_UUID))
+        if cccd is None:
+            raise ValueError("CCCD not found")
+        await cccd.write(bytes(((notify and 1 or 0) | (indicate and 2 or 0), 0)), response=True)
+
+
+class ClientDescriptor(BaseClientCharacteristic):
+    def __init__(self, characteristic, dsc_handle, uuid):
+        self.characteristic = characteristic
+        super().__init__(dsc_handle, 0x02 | 0x04, uuid)
+
+    def _connection(self):
+        return self.characteristic.connection
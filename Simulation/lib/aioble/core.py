@@ -0,0 +1,27 @@
+import bluetooth
+
+log_level = 1
+
+ble = bluetooth.BLE()
+ble.active(True)
+
+_irq_handlers = []
+
+def register_irq_handler(irq, shutdown):
+    if irq:
+        _irq_handlers.append(irq)
+
+def _ble_irq(event, data):
+    for handler in _irq_handlers:
+        handler(event, data)
+
+ble.irq(_ble_irq)
+
+def config(*args, **kwargs):
+    return ble.config(*args, **kwargs)
+
+def stop():
+    ble.active(False)
+
+def ensure_active():
+    ble.active(True)
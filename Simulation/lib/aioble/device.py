@@ -0,0 +1,98 @@
+import asyncio
+from . import core
+
+
+class DeviceDisconnectedError(Exception):
+    pass
+
+
+class Device:
+    def __init__(self, addr_type, addr):
+        self.addr_type = addr_type
+        self.addr = bytes(addr)
+        self._connection = None
+
+    def __eq__(self, other):
+        return isinstance(other, Device) and self.addr_type == other.addr_type and self.addr == other.addr
+
+    def __hash__(self):
+        return hash((self.addr_type, self.addr))
+
+    def __str__(self):
+        return f"Device({ self.addr_type }, { self.addr_hex() })"
+
+    def addr_hex(self):
+        return ":".join(f"{ b:02x}" for b in self.addr)
+
+    def _node(self):
+        for node in core.ble.radio.nodes:
+            if node.mac == self.addr:
+                return node
+        return None
+
+    async def connect(self, timeout_ms=10000, scan_duration_ms=None, min_conn_interval_us=None, max_conn_interval_us=None):
+        if self._connection is not None and self._connection.is_connected():
+            return self._connection
+        node = self._node()
+        if node is None:
+            raise asyncio.TimeoutError()
+        interval_us = max_conn_interval_us or min_conn_interval_us
+        link = await asyncio.wait_for(core.ble.radio.connect(core.ble, node, interval_us), timeout_ms / 1000)
+        self._connection = DeviceConnection(self, link)
+        return self._connection
+
+
+class DeviceConnection:
+    def __init__(self, device, link):
+        self.device = device
+        self.link = link
+        self._conn_handle = link.conn_handle
+        self._characteristics = {}
+        self.mtu = link.mtu
+
+    def is_connected(self):
+        return self.link.connected
+
+    def _check(self):
+        if not self.link.connected:
+            raise DeviceDisconnectedError()
+
+    async def _round_trip(self, count=1, timeout_ms=None):
+        self._check()
+        delay = count * self.link.round_trip()
+        if timeout_ms is not None and delay > timeout_ms / 1000:
+            await asyncio.sleep(timeout_ms / 1000)
+            raise asyncio.TimeoutError()
+        await asyncio.sleep(delay)
+        self._check()
+
+    async def service(self, uuid, timeout_ms=2000):
+        from .client import ClientService
+        # Discovery by UUID takes a request plus a "not found" terminator
+        await self._round_trip(2, timeout_ms)
+        service = self.link.peripheral.find_service(uuid)
+        if service is None:
+            return None
+        return ClientService(self, service.start_handle, service.end_handle, uuid)
+
+    async def services(self, uuid=None, timeout_ms=2000):
+        from .client import ClientService
+        await self._round_trip(2, timeout_ms)
+        return [ClientService(self, s.start_handle, s.end_handle, s.uuid) for s in self.link.peripheral.services
+                if uuid is None or s.uuid == uuid]
+
+    async def exchange_mtu(self, mtu=None, timeout_ms=1000):
+        await self._round_trip(1, timeout_ms)
+        core.ble.radio.exchange_mtu(self.link, mtu or core.ble.mtu)
+        self.mtu = self.link.mtu
+        return self.mtu
+
+    async def disconnect(self, timeout_ms=2000):
+        if self.link.connected:
+            await asyncio.sleep(self.link.round_trip())
+            core.ble.radio.disconnect(self.link)
+        return True
+
+    async def disconnected(self, timeout_ms=None):
+        while self.link.connected:
+            await asyncio.sleep(0.05)
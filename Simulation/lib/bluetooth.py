@@ -0,0 +1,37 @@
+# Stand-in for the bluetooth module, every BLE() call gets its own controller on the virtual radio
+from sim_state import radio
+from virtual_radio import Node
+
+FLAG_BROADCAST = 0x0001
+FLAG_READ = 0x0002
+FLAG_WRITE_NO_RESPONSE = 0x0004
+FLAG_WRITE = 0x0008
+FLAG_NOTIFY = 0x0010
+FLAG_INDICATE = 0x0020
+
+
+class UUID:
+    def __init__(self, value):
+        if isinstance(value, UUID):
+            self.value = value.value
+        elif isinstance(value, int):
+            self.value = value
+        elif isinstance(value, str):
+            self.value = value.lower()
+        else:
+            self.value = bytes(value)
+
+    def __eq__(self, other):
+        return isinstance(other, UUID) and self.value == other.value
+
+    def __hash__(self):
+        return hash(self.value)
+
+    def __repr__(self):
+        if isinstance(self.value, int):
+            return f"UUID(0x{ self.value:04x})"
+        return f"UUID('{ self.value }')"
+
+
+def BLE():
+    return Node(radio)
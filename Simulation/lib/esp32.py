@@ -0,0 +1,9 @@
+# Stand-in for the esp32 module, machine.lightsleep() ends early when the ext0 pin already sits at its wake level
+WAKEUP_ALL_LOW = False
+WAKEUP_ANY_HIGH = True
+
+wake_ext0 = None
+
+def wake_on_ext0(pin, level):
+    global wake_ext0
+    wake_ext0 = (pin, level)
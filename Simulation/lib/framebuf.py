@@ -0,0 +1,219 @@
+MONO_VLSB = 0
+RGB565 = 1
+GS4_HMSB = 2
+MONO_HLSB = 3
+MONO_HMSB = 4
+GS2_HMSB = 5
+GS8 = 6
+MVLSB = MONO_VLSB
+
+
+class FrameBuffer:
+    def __init__(self, buffer, width, height, format, stride=None):
+        self.buf = buffer
+        self.width = width
+        self.height = height
+        self.format = format
+        self.stride = width if stride is None else stride
+
+    def pixel(self, x, y, c=None):
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return None if c is None else None
+        if c is None:
+            return self._get(x, y)
+        self._set(x, y, c)
+
+    def _get(self, x, y):
+        b = self.buf
+        f = self.format
+        if f == RGB565:
+            i = (y * self.stride + x) * 2
+            return b[i] | (b[i + 1] << 8)
+        if f == GS4_HMSB:
+            i = (y * self.stride + x) >> 1
+            return (b[i] >> 4) & 0x0F if x % 2 == 0 else b[i] & 0x0F
+        if f == MONO_HLSB:
+            i = (y * ((self.stride + 7) // 8)) + (x >> 3)
+            return (b[i] >> (7 - (x & 7))) & 1
+        if f == MONO_HMSB:
+            i = (y * ((self.stride + 7) // 8)) + (x >> 3)
+            return (b[i] >> (x & 7)) & 1
+        if f == MONO_VLSB:
+            i = (y >> 3) * self.stride + x
+            return (b[i] >> (y & 7)) & 1
+        if f == GS8:
+            return b[y * self.stride + x]
+        raise ValueError("format")
+
+    def _set(self, x, y, c):
+        b = self.buf
+        f = self.format
+        if f == RGB565:
+            i = (y * self.stride + x) * 2
+            b[i] = c & 0xFF
+            b[i + 1] = (c >> 8) & 0xFF
+        elif f == GS4_HMSB:
+            i = (y * self.stride + x) >> 1
+            if x % 2 == 0:
+                b[i] = (b[i] & 0x0F) | ((c & 0x0F) << 4)
+            else:
+                b[i] = (b[i] & 0xF0) | (c & 0x0F)
+        elif f == MONO_HLSB:
+            i = (y * ((self.stride + 7) // 8)) + (x >> 3)
+            m = 1 << (7 - (x & 7))
+            b[i] = (b[i] | m) if c & 1 else (b[i] & ~m & 0xFF)
+        elif f == MONO_HMSB:
+            i = (y * ((self.stride + 7) // 8)) + (x >> 3)
+            m = 1 << (x & 7)
+            b[i] = (b[i] | m) if c & 1 else (b[i] & ~m & 0xFF)
+        elif f == MONO_VLSB:
+            i = (y >> 3) * self.stride + x
+            m = 1 << (y & 7)
+            b[i] = (b[i] | m) if c & 1 else (b[i] & ~m & 0xFF)
+        elif f == GS8:
+            b[y * self.stride + x] = c & 0xFF
+        else:
+            raise ValueError("format")
+
+    # The drawing methods below go through _fill_rect and _pixel rather than the public fill_rect and pixel,
+    # the C framebuf does the same, so a subclass overriding those (lcd_screen marks damage there) is not
+    # re-entered by fill, rect, line and the rest
+
+    def fill(self, c):
+        self._fill_rect(0, 0, self.width, self.height, c)
+
+    def fill_rect(self, x, y, w, h, c):
+        self._fill_rect(x, y, w, h, c)
+
+    def _fill_rect(self, x, y, w, h, c):
+        x0 = max(x, 0)
+        y0 = max(y, 0)
+        x1 = min(x + w, self.width)
+        y1 = min(y + h, self.height)
+        if x1 <= x0 or y1 <= y0:
+            return
+        if self.format == RGB565:
+            row = bytes((c & 0xFF, (c >> 8) & 0xFF)) * (x1 - x0)
+            for yy in range(y0, y1):
+                i = (yy * self.stride + x0) * 2
+                self.buf[i:i + len(row)] = row
+            return
+        for yy in range(y0, y1):
+            for xx in range(x0, x1):
+                self._set(xx, yy, c)
+
+    def _pixel(self, x, y, c):
+        if 0 <= x < self.width and 0 <= y < self.height:
+            self._set(x, y, c)
+
+    def rect(self, x, y, w, h, c, f=False):
+        if f:
+            self._fill_rect(x, y, w, h, c)
+            return
+        self._fill_rect(x, y, w, 1, c)
+        self._fill_rect(x, y + h - 1, w, 1, c)
+        self._fill_rect(x, y, 1, h, c)
+        self._fill_rect(x + w - 1, y, 1, h, c)
+
+    def hline(self, x, y, w, c):
+        self._fill_rect(x, y, w, 1, c)
+
+    def vline(self, x, y, h, c):
+        self._fill_rect(x, y, 1, h, c)
+
+    def line(self, x0, y0, x1, y1, c):
+        dx = abs(x1 - x0)
+        dy = -abs(y1 - y0)
+        sx = 1 if x0 < x1 else -1
+        sy = 1 if y0 < y1 else -1
+        err = dx + dy
+        while True:
+            self._pixel(x0, y0, c)
+            if x0 == x1 and y0 == y1:
+                break
+            e2 = 2 * err
+            if e2 >= dy:
+                err += dy
+                x0 += sx
+            if e2 <= dx:
+                err += dx
+                y0 += sy
+
+    def ellipse(self, x, y, xr, yr, c, f=False, m=0xF):
+        # Quadrant mask bits: 0 top right, 1 top left, 2 bottom left, 3 bottom right
+        for dy in range(-yr, yr + 1):
+            half = int(xr * (1 - (dy / yr) ** 2) ** 0.5 + 0.5) if yr else xr
+            for left, bit in ((True, 2 if dy > 0 else 1), (False, 3 if dy > 0 else 0)):
+                if not m & (1 << bit):
+                    continue
+                if f:
+                    if left:
+                        self._fill_rect(x - half, y + dy, half + 1, 1, c)
+                    else:
+                        self._fill_rect(x, y + dy, half + 1, 1, c)
+                else:
+                    self._pixel(x - half if left else x + half, y + dy, c)
+        if not f:
+            # Close the flat top and bottom arcs with the columns' end points
+            for dx in range(-xr, xr + 1):
+                half = int(yr * (1 - (dx / xr) ** 2) ** 0.5 + 0.5) if xr else yr
+                for top in (True, False):
+                    bit = (1 if dx < 0 else 0) if top else (2 if dx < 0 else 3)
+                    if m & (1 << bit):
+                        self._pixel(x + dx, y - half if top else y + half, c)
+
+    def poly(self, x, y, coords, c, f=False):
+        points = [(x + coords[i], y + coords[i + 1]) for i in range(0, len(coords) - 1, 2)]
+        if not points:
+            return
+        if not f:
+            for i in range(len(points)):
+                x0, y0 = points[i - 1]
+                x1, y1 = points[i]
+                self.line(x0, y0, x1, y1, c)
+            return
+        # Even-odd scanline fill through pixel centres
+        top = min(py for _, py in points)
+        bottom = max(py for _, py in points)
+        for row in range(top, bottom + 1):
+            crossings = []
+            for i in range(len(points)):
+                x0, y0 = points[i - 1]
+                x1, y1 = points[i]
+                if (y0 <= row < y1) or (y1 <= row < y0):
+                    crossings.append(x0 + (row - y0) * (x1 - x0) / (y1 - y0))
+            crossings.sort()
+            for i in range(0, len(crossings) - 1, 2):
+                start = int(crossings[i] + 0.5)
+                self._fill_rect(start, row, int(crossings[i + 1] + 0.5) - start + 1, 1, c)
+
+    def text(self, s, x, y, c=1):
+        # Glyph data for the built-in 8x8 font is not reproduced; text draws solid cells
+        for i in range(len(s)):
+            if s[i] != " ":
+                self._fill_rect(x + i * 8 + 1, y + 1, 6, 6, c)
+
+    def scroll(self, xstep, ystep):
+        # Walk away from the direction of travel so no source pixel is overwritten before it is read.
+        # The uncovered strip keeps its old contents, as in the C implementation
+        width, height = self.width, self.height
+        rows = range(height - 1, ystep - 1, -1) if ystep > 0 else range(0, height + ystep)
+        columns = range(width - 1, xstep - 1, -1) if xstep > 0 else range(0, width + xstep)
+        for yy in rows:
+            for xx in columns:
+                self._set(xx, yy, self._get(xx - xstep, yy - ystep))
+
+    def blit(self, fbuf, x, y, key=-1, palette=None):
+        if isinstance(fbuf, (tuple, list)):
+            # (buffer, width, height, format[, stride]) source, MicroPython 1.20+
+            fbuf = FrameBuffer(*fbuf)
+        # Only the part of the source that lands inside this buffer is visited, like the C implementation
+        for sy in range(max(0, -y), min(fbuf.height, self.height - y)):
+            dy = y + sy
+            for sx in range(max(0, -x), min(fbuf.width, self.width - x)):
+                dx = x + sx
+                col = fbuf._get(sx, sy)
+                if palette is not None:
+                    col = palette._get(col, 0)
+                if col != key:
+                    self._set(dx, dy, col)
@@ -0,0 +1,187 @@
+# Stand-ins for the machine module: pins that can be "pressed", an SPI bus that counts bytes and charges
+# transfer time to the virtual clock, and sleep calls that only record how long the CPU would have slept
+from sim_state import clock
+
+# The RP2040 clamps the requested SPI baud rate to half the 125 MHz peripheral clock
+MAX_SPI_BAUDRATE = 62500000
+
+_freq = 125000000
+slept_ms = 0
+
+# Wake reasons, numbered like the ESP32 port
+PIN_WAKE = 2
+TIMER_WAKE = 4
+_wake_reason = 0
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    OPEN_DRAIN = 2
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_FALLING = 4
+    IRQ_RISING = 8
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self.id = id
+        self.mode = mode
+        self._value = 1 if pull == Pin.PULL_UP else 0
+        if value is not None:
+            self._value = value
+        self.handler = None
+        self.trigger = 0
+
+    def __call__(self, value=None):
+        if value is None:
+            return self._value
+        self._value = 1 if value else 0
+
+    def value(self, value=None):
+        return self(value)
+
+    def on(self):
+        self._value = 1
+
+    def off(self):
+        self._value = 0
+
+    def toggle(self):
+        self._value ^= 1
+
+    def irq(self, handler=None, trigger=IRQ_FALLING, hard=False, wake=None):
+        self.handler = handler
+        self.trigger = trigger
+
+    def press(self):
+        """Pull an active-low button to ground and release it, firing the falling-edge IRQ"""
+        self._value = 0
+        if self.handler is not None and self.trigger & Pin.IRQ_FALLING:
+            self.handler(self)
+        self._value = 1
+
+    def hold(self):
+        """Pull an active-low input to ground and leave it there, e.g. a tipup's flag switch staying tripped"""
+        self._value = 0
+        if self.handler is not None and self.trigger & Pin.IRQ_FALLING:
+            self.handler(self)
+
+    def release(self):
+        """Let a held input go back to its pull-up, firing the rising-edge IRQ"""
+        self._value = 1
+        if self.handler is not None and self.trigger & Pin.IRQ_RISING:
+            self.handler(self)
+
+
+class SPI:
+    # id -> the last SPI created on that bus, where rp2.DMA finds the one it feeds
+    buses = {}
+
+    def __init__(self, id, baudrate=1000000, polarity=0, phase=0, bits=8, firstbit=0, sck=None, mosi=None, miso=None):
+        self.id = id
+        self.baudrate = min(baudrate, MAX_SPI_BAUDRATE)
+        self.bytes_written = 0
+        self.writes = 0
+        self.longest_write = 0
+        self.dma_transfers = 0
+        self.busy_until = 0.0       # Virtual time the last DMA transfer finishes clocking out
+        SPI.buses[id] = self
+
+    def write(self, buf):
+        length = len(buf)
+        self.bytes_written += length
+        self.writes += 1
+        self.longest_write = max(self.longest_write, length)
+        # Writes block the CPU until the last bit has been clocked out
+        clock.advance(length * 8 / self.baudrate)
+
+    def dma_write(self, length):
+        """Bytes fed to the TX FIFO by DMA, the CPU is free until busy_until"""
+        self.bytes_written += length
+        self.dma_transfers += 1
+        self.busy_until = max(self.busy_until, clock.now) + length * 8 / self.baudrate
+
+
+class PWM:
+    def __init__(self, pin, freq=None, duty_u16=None):
+        self.pin = pin
+        self._freq = freq or 0
+        self._duty = duty_u16 or 0
+
+    def freq(self, value=None):
+        if value is None:
+            return self._freq
+        self._freq = value
+
+    def duty_u16(self, value=None):
+        if value is None:
+            return self._duty
+        self._duty = value
+
+    def deinit(self):
+        pass
+
+
+class ADC:
+    ATTN_0DB = 0
+    ATTN_2_5DB = 1
+    ATTN_6DB = 2
+    ATTN_11DB = 3
+
+    def __init__(self, pin, atten=None):
+        self.pin = pin
+        self.level = 0xC000
+
+    def read_u16(self):
+        return self.level
+
+    def atten(self, value):
+        pass
+
+
+class _Mem32:
+    """machine.mem32 for the registers the display driver reads. The SPI status register reads idle: the
+    rp2.DMA stand-in only reports done once the transfer has been clocked out"""
+    def __getitem__(self, address):
+        return 0
+
+    def __setitem__(self, address, value):
+        pass
+
+mem32 = _Mem32()
+
+
+def freq(value=None):
+    global _freq
+    if value is None:
+        return _freq
+    _freq = value
+
+def lightsleep(ms=None):
+    """Sleep on the virtual clock. Nothing else runs meanwhile, so only a pin already at its ext0 wake level
+    ends the sleep early, straight away"""
+    global slept_ms, _wake_reason
+    import esp32
+    if esp32.wake_ext0 is not None:
+        pin, level = esp32.wake_ext0
+        if pin.value() == (1 if level else 0):
+            _wake_reason = PIN_WAKE
+            return
+    _wake_reason = TIMER_WAKE
+    slept_ms += ms or 0
+    clock.advance((ms or 0) / 1000)
+
+def wake_reason():
+    return _wake_reason
+
+def deepsleep(ms=None):
+    lightsleep(ms)
+
+def idle():
+    pass
+
+def unique_id():
+    return b"\x5e\x00\x00\x00\x00\x01"
+
+def reset():
+    raise SystemExit("machine.reset()")
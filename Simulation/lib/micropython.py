@@ -0,0 +1,21 @@
+# Stand-in for the micropython module: decorators become no-ops and schedule() runs the callback at once
+def const(value):
+    return value
+
+def schedule(func, arg):
+    func(arg)
+
+def native(func):
+    return func
+
+def viper(func):
+    return func
+
+def alloc_emergency_exception_buf(size):
+    pass
+
+def opt_level(level=None):
+    return 0
+
+def mem_info(verbose=False):
+    print("mem_info() is not available in the simulation")
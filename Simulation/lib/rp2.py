@@ -0,0 +1,39 @@
+# Stand-in for the rp2 module: a DMA channel that feeds SPI TX from a buffer while tasks keep running
+from sim_state import clock
+import machine
+
+# Data registers of SPI0 and SPI1, DMA writes there go out on that bus
+_SPI_DATA_REGISTERS = {0x4003C008: 0, 0x40040008: 1}
+# Charged to the virtual clock on every active() poll, about one pass of the event loop
+POLL_S = 10e-6
+
+
+class DMA:
+    def __init__(self):
+        self.done_at = 0.0
+        self.transfers = 0
+
+    def pack_ctrl(self, **fields):
+        return 0
+
+    def config(self, read=None, write=None, count=None, ctrl=None, trigger=False):
+        bus = machine.SPI.buses.get(_SPI_DATA_REGISTERS.get(write))
+        if bus is None:
+            raise ValueError("DMA stand-in only writes to an SPI data register")
+        if trigger:
+            self.transfers += 1
+            bus.dma_write(count)
+            self.done_at = bus.busy_until
+
+    def active(self, value=None):
+        if value is not None:
+            # active(0) aborts the transfer
+            if not value:
+                self.done_at = clock.now
+            return
+        # Polled from a loop yielding with sleep_ms(0), which never lets the virtual clock run on its own
+        clock.advance(POLL_S)
+        return clock.now < self.done_at
+
+    def close(self):
+        pass
@@ -0,0 +1 @@
+from bluetooth import *
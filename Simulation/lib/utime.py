@@ -0,0 +1,34 @@
+# Stand-in for MicroPython's utime/time tick functions, driven by the virtual clock
+from sim_state import clock
+
+TICKS_PERIOD = 1 << 30
+TICKS_MAX = TICKS_PERIOD - 1
+TICKS_HALFPERIOD = TICKS_PERIOD // 2
+
+def ticks_ms():
+    return clock.ticks_ms() & TICKS_MAX
+
+def ticks_us():
+    return clock.ticks_us() & TICKS_MAX
+
+def ticks_cpu():
+    return ticks_us()
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) & TICKS_MAX
+
+def ticks_diff(ticks1, ticks2):
+    diff = (ticks1 - ticks2) & TICKS_MAX
+    return ((diff + TICKS_HALFPERIOD) & TICKS_MAX) - TICKS_HALFPERIOD
+
+def time():
+    return int(clock.now)
+
+def sleep(seconds):
+    clock.advance(seconds)
+
+def sleep_ms(ms):
+    clock.advance(ms / 1000)
+
+def sleep_us(us):
+    clock.advance(us / 1000000)
@@ -0,0 +1,6 @@
+# Shared by every stand-in module so the display, buttons and radio all see the same simulated time
+from virtual_clock import VirtualClock
+from virtual_radio import Radio
+
+clock = VirtualClock()
+radio = Radio(clock)
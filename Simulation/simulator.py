@@ -0,0 +1,99 @@
+"""Runs the Central and Peripheral code under CPython against stand-ins for the MicroPython modules
+
+    import simulator
+    sim = simulator.install()
+    import main                       # Central/main.py, nothing runs until main.run() is awaited
+    sim.run(scenario(main))
+"""
+import asyncio, gc, os, sys, tempfile, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SIMULATION = os.path.join(ROOT, "Simulation")
+PATHS = (os.path.join(SIMULATION, "lib"), SIMULATION, os.path.join(ROOT, "Central"), os.path.join(ROOT, "Peripheral"))
+
+# Heap of a Pico W running MicroPython, reported through gc.mem_free()/gc.mem_alloc()
+HEAP_SIZE = 192 * 1024
+
+
+class ThreadSafeFlag:
+    """asyncio.ThreadSafeFlag: set() may be called from an IRQ, wait() clears the flag on return"""
+    def __init__(self):
+        self.event = asyncio.Event()
+
+    def set(self):
+        self.event.set()
+
+    def clear(self):
+        self.event.clear()
+
+    async def wait(self):
+        await self.event.wait()
+        self.event.clear()
+
+
+def _wait_for_ms(aw, timeout_ms):
+    return asyncio.wait_for(aw, timeout_ms / 1000)
+
+
+def _sleep_ms(ms):
+    return asyncio.sleep(ms / 1000)
+
+
+class Simulator:
+    def __init__(self):
+        import sim_state
+        from virtual_clock import VirtualEventLoop
+        self.clock = sim_state.clock
+        self.radio = sim_state.radio
+        self.loop = VirtualEventLoop(self.clock)
+        asyncio.set_event_loop(self.loop)
+
+    def now_ms(self):
+        return self.clock.now * 1000
+
+    def run(self, coro):
+        try:
+            return self.loop.run_until_complete(coro)
+        finally:
+            # Background tasks such as main.input_task() never finish on their own
+            tasks = [task for task in asyncio.all_tasks(self.loop) if not task.done()]
+            for task in tasks:
+                task.cancel()
+
+            # gather() inside the loop, called outside it would tie its future to whatever loop is current
+            async def settle():
+                await asyncio.gather(*tasks, return_exceptions=True)
+            self.loop.run_until_complete(settle())
+
+    def peripherals(self, module, count):
+        """Create count instances of a peripheral script's BLEPeripheral, each with its own radio"""
+        return [module.BLEPeripheral() for _ in range(count)]
+
+
+def _mem_alloc():
+    import tracemalloc
+    if tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[0]
+    return 0
+
+
+def install():
+    """Put the stand-ins ahead of the real code on sys.path and add the MicroPython-only APIs"""
+    for path in reversed(PATHS):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+    asyncio.ThreadSafeFlag = ThreadSafeFlag
+    asyncio.wait_for_ms = _wait_for_ms
+    asyncio.sleep_ms = _sleep_ms
+
+    import utime
+    for name in ("ticks_ms", "ticks_us", "ticks_cpu", "ticks_add", "ticks_diff", "sleep_ms", "sleep_us"):
+        setattr(time, name, getattr(utime, name))
+
+    gc.mem_alloc = _mem_alloc
+    gc.mem_free = lambda: HEAP_SIZE - _mem_alloc()
+
+    # Files the device writes to flash land in a scratch directory instead of the working tree
+    os.chdir(tempfile.mkdtemp(prefix="tipup_flash_"))
+    return Simulator()
@@ -0,0 +1,242 @@
+"""Host tests of the display driver against the fake SPI bus in lib/machine.py
+
+    python -m pytest Simulation
+"""
+import os, sys, tracemalloc, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import simulator
+sim = simulator.install()
+import asyncio
+import lcd_screen, widgets
+
+# CASET and RASET with four parameter bytes each, then RAMWR
+WINDOW_BYTES = 5 + 5 + 1
+# One size 2 character cell, 5 x 9 pixels scaled up
+CELL_BYTES = 10 * 18 * 2
+
+
+class DirtyFlushTest(unittest.TestCase):
+    def setUp(self):
+        self.display = lcd_screen.LCD_1inch3()
+        self.display.show()
+
+    def sent(self, action):
+        start = self.display.spi.bytes_written
+        action()
+        self.display.show()
+        return self.display.spi.bytes_written - start
+
+    def test_spinner_step_sends_one_cell(self):
+        screen = widgets.Screen(self.display)
+        spinner = screen.add(widgets.Label(226, 0, "-", color=self.display.cyan))
+        screen.render()
+
+        def step():
+            spinner.set("\\")
+            screen.render()
+        self.assertEqual(self.sent(step), WINDOW_BYTES + CELL_BYTES)
+
+    def test_selector_move_sends_one_cell(self):
+        screen = widgets.Screen(self.display)
+        selector = screen.add(widgets.Selector(70, 21, 0, color=self.display.yellow))
+        screen.render()
+
+        def move():
+            selector.set(1)
+            screen.render()
+        self.assertEqual(self.sent(move), WINDOW_BYTES + CELL_BYTES)
+
+    def test_nothing_drawn_sends_nothing(self):
+        self.assertEqual(self.sent(lambda: None), 0)
+
+    def test_every_primitive_marks_damage(self):
+        display = self.display
+        white = display.white
+        draws = {
+            "pixel": lambda: display.pixel(5, 5, white),
+            "hline": lambda: display.hline(0, 10, 20, white),
+            "vline": lambda: display.vline(10, 0, 20, white),
+            "rect": lambda: display.rect(2, 2, 8, 8, white),
+            "line": lambda: display.line(20, 5, 5, 20, white),
+            "text": lambda: display.text("ab", 0, 30, white),
+        }
+        for name, draw in draws.items():
+            with self.subTest(name):
+                self.assertGreater(self.sent(draw), WINDOW_BYTES)
+
+    def test_blit_needs_a_sized_source(self):
+        import framebuf
+        buf = bytearray(8)
+        with self.assertRaises(TypeError):
+            self.display.blit(framebuf.FrameBuffer(buf, 8, 8, framebuf.MONO_HLSB), 0, 0)
+        self.assertEqual(self.sent(lambda: self.display.blit((buf, 8, 8, framebuf.MONO_HLSB), 0, 0)),
+                         WINDOW_BYTES + 8 * 8 * 2)
+
+
+class ListWidgetTest(unittest.TestCase):
+    def setUp(self):
+        self.display = lcd_screen.LCD_1inch3()
+        self.screen = widgets.Screen(self.display)
+        self.lines = self.screen.add(widgets.ListWidget(0, 40, ["one", "two", "three"]))
+        self.screen.render(True)
+
+    def row_lit(self, y):
+        display = self.display
+        return any(display.pixel(x, y) != display.bg_color for x in range(0, 240))
+
+    def test_wrapping_line_pushes_the_next_ones_down(self):
+        labels = self.lines.labels
+        below = labels[1].y
+        self.lines.set_line(0, "x" * 20)
+        self.screen.render()
+        self.assertGreater(labels[1].y, below)
+        self.assertEqual(labels[2].y - labels[1].y, below - labels[0].y)
+        # The wrapped part of the first line survives the second line being cleared and moved
+        self.assertTrue(self.row_lit(below + 5))
+
+    def test_unwrapping_line_pulls_the_next_ones_up(self):
+        labels = self.lines.labels
+        below = labels[1].y
+        self.lines.set_line(0, "x" * 20)
+        self.screen.render()
+        self.lines.set_line(0, "one")
+        self.screen.render()
+        self.assertEqual(labels[1].y, below)
+        self.assertFalse(self.row_lit(labels[2].y + 30))
+
+
+class OverlappingFlushTest(unittest.TestCase):
+    """The alert's show_async() can start while the compositor's is waiting on a DMA band"""
+    def setUp(self):
+        self.display = lcd_screen.LCD_1inch3()
+        self.assertIsNotNone(self.display.dma, "the simulation provides rp2.DMA")
+        self.display.show()
+
+    def test_second_flush_keeps_the_first_ones_rects(self):
+        display = self.display
+        spi = display.spi
+        white = display.white
+
+        async def scenario():
+            start = spi.bytes_written
+            display.fill_rect(0, 0, 240, 48, white)
+            first = asyncio.create_task(display.show_async())
+            # Let the first band start, it is now waiting on the DMA channel with CS low
+            await asyncio.sleep(0)
+            self.assertTrue(display.band_active)
+            display.fill_rect(0, 200, 240, 24, white)
+            await display.show_async()
+            await first
+            return spi.bytes_written - start
+        sent = sim.run(scenario())
+        # Both regions went out, each band in its own window
+        self.assertEqual(sent, (48 + 24) * 240 * 2 + 3 * WINDOW_BYTES)
+        self.assertEqual(display.dirty_count, 0)
+
+    def test_mode_commands_wait_for_the_band(self):
+        display = self.display
+
+        async def scenario():
+            display.fill_rect(0, 0, 240, 24, display.white)
+            flush = asyncio.create_task(display.show_async())
+            await asyncio.sleep(0)
+            commands = display.commands
+            display.invert(True)
+            display.idle_mode(True)
+            # Nothing reaches the panel while the band holds CS low
+            held = display.commands - commands
+            await flush
+            return held, display.commands - commands
+        held, after = sim.run(scenario())
+        self.assertEqual(held, 0)
+        self.assertEqual(after, 2)
+
+    def test_show_during_a_band_is_left_to_the_compositor(self):
+        display = self.display
+
+        async def scenario():
+            display.fill_rect(0, 0, 240, 24, display.white)
+            flush = asyncio.create_task(display.show_async())
+            await asyncio.sleep(0)
+            commands = display.commands
+            display.fill_rect(0, 100, 10, 10, display.white)
+            display.show()
+            held = display.commands - commands
+            await flush
+            return held
+        self.assertEqual(sim.run(scenario()), 0)
+        self.assertEqual(display.dirty_count, 1)
+        self.assertTrue(display.frame_requested.event.is_set())
+
+
+class ShowAllocationTest(unittest.TestCase):
+    """show() and show_async() send straight from the frame buffer through preallocated command buffers"""
+    def setUp(self):
+        self.display = lcd_screen.LCD_1inch3()
+        self.display.show()
+
+    def traced_shows(self, x, y, w, h, count=200):
+        display = self.display
+        # Warm up anything created lazily on the first flush
+        display.mark_dirty(x, y, w, h)
+        display.show()
+        tracemalloc.start()
+        try:
+            start, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            for _ in range(count):
+                display.mark_dirty(x, y, w, h)
+                display.show()
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return current - start, peak - start
+
+    # CPython boxes the counters' ints and every memoryview slice, MicroPython keeps small ints off the heap.
+    # These bounds leave room for that but not for anything kept per call or a copy of the pixels
+    KEPT_LIMIT = 1024       # Under 6 bytes per show() over 200 calls
+    PEAK_LIMIT = 2048
+
+    def test_band_flush_keeps_nothing_and_copies_nothing(self):
+        # A 20 row band is 9600 bytes, copying it even once would show up in the peak
+        kept, peak = self.traced_shows(0, 100, 240, 20)
+        self.assertLess(kept, self.KEPT_LIMIT)
+        self.assertLess(peak, self.PEAK_LIMIT)
+
+    def test_partial_rect_flush_keeps_nothing_and_copies_nothing(self):
+        # 50 rows of 200 bytes, sent row by row from slices of the buffer
+        kept, peak = self.traced_shows(30, 40, 100, 50)
+        self.assertLess(kept, self.KEPT_LIMIT)
+        self.assertLess(peak, self.PEAK_LIMIT)
+
+    # Live in lcd_screen.py partway through a band: at most the band's memoryview slice (184 B in CPython) and a few
+    # boxed ints. A copy of the rects, a coroutine per band or a lock context would come on top
+    BAND_LIMIT = 256
+
+    def test_async_flush_allocates_nothing_per_band(self):
+        display = self.display
+
+        async def scenario():
+            # Warm up, then trace a second flush of the same two bands
+            display.mark_dirty(0, 0, 240, 48)
+            await display.show_async()
+            display.mark_dirty(0, 0, 240, 48)
+            tracemalloc.start()
+            try:
+                flush = asyncio.create_task(display.show_async())
+                # Let the first band start, it is now waiting on the DMA channel
+                await asyncio.sleep(0)
+                self.assertTrue(display.band_active)
+                snapshot = tracemalloc.take_snapshot()
+            finally:
+                tracemalloc.stop()
+            await flush
+            return snapshot.filter_traces([tracemalloc.Filter(True, lcd_screen.__file__)])
+        snapshot = sim.run(scenario())
+        live = sum(stat.size for stat in snapshot.statistics("filename"))
+        self.assertLess(live, self.BAND_LIMIT)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+"""Host tests of the framebuf stand-in in lib/framebuf.py
+
+    python -m pytest Simulation
+"""
+import os, sys, unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "lib"))
+import framebuf
+
+
+class Counting(framebuf.FrameBuffer):
+    """Counts calls to the public primitives a driver subclass would override"""
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.calls = 0
+
+    def fill_rect(self, *args):
+        self.calls += 1
+        super().fill_rect(*args)
+
+    def pixel(self, *args):
+        self.calls += 1
+        return super().pixel(*args)
+
+
+class FrameBufferTest(unittest.TestCase):
+    def setUp(self):
+        self.fb = Counting(bytearray(16 * 16 * 2), 16, 16, framebuf.RGB565)
+
+    def test_primitives_do_not_reenter_overrides(self):
+        fb = self.fb
+        fb.fill(1)
+        fb.rect(1, 1, 5, 5, 2)
+        fb.rect(1, 1, 5, 5, 2, True)
+        fb.hline(0, 3, 8, 3)
+        fb.vline(3, 0, 8, 3)
+        fb.line(0, 0, 15, 9, 4)
+        fb.ellipse(8, 8, 5, 3, 5)
+        fb.ellipse(8, 8, 5, 3, 5, True)
+        fb.poly(2, 2, (0, 0, 10, 0, 5, 8), 6, True)
+        fb.text("ab", 0, 8, 7)
+        fb.scroll(1, 2)
+        self.assertEqual(fb.calls, 0)
+
+    def test_scroll_moves_pixels(self):
+        fb = self.fb
+        fb._pixel(2, 3, 0x1234)
+        fb.scroll(3, -2)
+        self.assertEqual(fb._get(5, 1), 0x1234)
+        fb.scroll(-3, 2)
+        self.assertEqual(fb._get(2, 3), 0x1234)
+
+    def test_filled_shapes_cover_their_centre(self):
+        fb = self.fb
+        fb.ellipse(8, 8, 4, 2, 9, True)
+        self.assertEqual(fb._get(8, 8), 9)
+        self.assertEqual(fb._get(12, 8), 9)
+        self.assertEqual(fb._get(8, 11), 0)
+        fb.poly(0, 0, (2, 2, 12, 2, 12, 12, 2, 12), 3, True)
+        self.assertEqual(fb._get(7, 7), 3)
+        self.assertEqual(fb._get(13, 7), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+"""Host tests of the receiver's heap telemetry
+
+    python -m pytest Simulation
+"""
+import gc, os, sys, unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import simulator
+simulator.install()
+import heap_telemetry
+
+
+class SampleTest(unittest.TestCase):
+    def setUp(self):
+        self.heap = heap_telemetry.HeapTelemetry()
+
+    def test_periodic_sample_neither_collects_nor_probes(self):
+        with mock.patch.object(gc, "collect") as collect:
+            self.heap.sample()
+        collect.assert_not_called()
+        free, _, largest, probed_free = self.heap.latest()
+        self.assertGreater(free, 0)
+        self.assertIsNone(largest)
+        self.assertIsNone(probed_free)
+
+    def test_probe_on_request_is_kept_across_later_samples(self):
+        self.heap.sample(probe=True)
+        _, _, largest, _ = self.heap.latest()
+        self.assertGreater(largest, 0)
+        self.heap.sample()
+        self.assertEqual(self.heap.latest()[2], largest)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+"""Host tests of the fish-on latency trace
+
+    python -m pytest Simulation
+"""
+import os, sys, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import simulator
+simulator.install()
+import utime
+import latency_trace
+
+
+class LatencyTraceTest(unittest.TestCase):
+    def setUp(self):
+        self.trace = latency_trace.LatencyTrace()
+
+    def test_irq_time_after_the_dequeue_is_bounded(self):
+        # A stale or future timestamp makes ticks_diff() negative, which an array('L') can't hold
+        self.trace.begin(0, 0, utime.ticks_add(utime.ticks_us(), 5000))
+        self.trace.mark(latency_trace.STAGE_WAKE)
+        self.trace.finish()
+        self.assertEqual(self.trace.samples, 1)
+        self.assertEqual(self.trace.maximum[latency_trace.STAGE_QUEUE], 0)
+
+    def test_huge_stage_is_clamped(self):
+        self.trace.begin(0xFFFFFFFF, 0xFFFFFFFF, utime.ticks_us())
+        self.trace.finish()
+        self.assertEqual(self.trace.maximum[latency_trace.STAGE_TIPUP], latency_trace.STAGE_LIMIT_US)
+
+    def test_cancelled_trace_lets_the_next_one_begin(self):
+        trace = self.trace
+        trace.begin(0, 0, utime.ticks_us())
+        trace.cancel()
+        self.assertFalse(trace.active)
+        trace.begin(1000, 2000, utime.ticks_us())
+        self.assertEqual(trace.current[latency_trace.STAGE_TIPUP], 1000)
+        trace.finish()
+        self.assertEqual(trace.samples, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
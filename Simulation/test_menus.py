@@ -0,0 +1,130 @@
+"""Host tests of the receiver's menus against the simulated radio
+
+    python -m pytest Simulation
+"""
+import asyncio, contextlib, io, os, sys, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import simulator
+sim = simulator.install()
+with contextlib.redirect_stdout(io.StringIO()):
+    import main as central
+import menus, utime
+from broadcast_monitor import BroadcastMonitor
+from tipup_device import BROADCAST_COMPANY_ID, BROADCAST_MAGIC, BROADCAST_VERSION, BROADCAST_FLAG_UP
+
+
+class DevicePickerTest(unittest.TestCase):
+    def setUp(self):
+        self.manager = central.menu_manager
+        self.scanner = self.manager.scanner
+
+    def run_quietly(self, coro):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return sim.run(coro)
+
+    def test_cancel_while_boosting_leaves_the_scanner_as_it_was(self):
+        scanner = self.scanner
+
+        async def scenario():
+            scanner.start()
+            await asyncio.sleep(0.1)
+            picker = self.manager.menu(menus.DevicesMenu)
+            task = asyncio.create_task(picker.scan_task())
+            # Let it get as far as restarting the scan at full duty, then leave the menu
+            await asyncio.sleep(0)
+            self.assertEqual(scanner.boosts, 1)
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+            return scanner.boosts, scanner.on_new, scanner.task is not None and not scanner.task.done()
+        boosts, on_new, scanning = self.run_quietly(scenario())
+        self.assertEqual(boosts, 0)
+        self.assertIsNone(on_new)
+        self.assertTrue(scanning)
+
+    def test_listed_device_reports_the_latest_rssi(self):
+        scanner = self.scanner
+        picker = self.manager.menu(menus.DevicesMenu)
+
+        class Device:
+            addr = b"\x01\x02\x03\x04\x05\x06"
+        slot = scanner.free_slot()
+        scanner.devices[slot] = Device
+        scanner.names[slot] = "tipup"
+        scanner.slot_for[Device.addr] = slot
+        scanner.rssi[slot] = -80
+        with contextlib.redirect_stdout(io.StringIO()):
+            picker.found(slot)
+        entry = picker.device_list[Device.addr]
+        scanner.rssi[slot] = -50
+        self.assertEqual(entry.rssi(), -50)
+        scanner.remove(slot)
+        self.assertIsNone(entry.rssi())
+
+
+class AlertSchedulerTest(unittest.TestCase):
+    def test_alert_acknowledged_before_it_is_drawn_drops_its_trace(self):
+        manager, scheduler = central.menu_manager, central.alert_scheduler
+        tipup = scheduler.unknown
+
+        async def scenario():
+            task = asyncio.create_task(scheduler.run())
+            await asyncio.sleep(0)
+            manager.latency.begin(0, 0, utime.ticks_us())
+            scheduler.notify_tipup(tipup)
+            # The button press gets in before the scheduler's task runs
+            scheduler.acknowledge()
+            await asyncio.sleep(0.1)
+            task.cancel()
+            return manager.latency.active
+        with contextlib.redirect_stdout(io.StringIO()):
+            active = sim.run(scenario())
+        self.assertFalse(active)
+
+
+class BroadcastMonitorTest(unittest.TestCase):
+    addr = b"\x0a\x0b\x0c\x0d\x0e\x0f"
+
+    def setUp(self):
+        self.manager = central.menu_manager
+        self.monitor = BroadcastMonitor(self.manager, central.alert_scheduler)
+
+    def tearDown(self):
+        self.manager.broadcast_devices.clear()
+        central.alert_scheduler.acknowledge()
+
+    def observe(self, flags, trips):
+        test = self
+
+        class Device:
+            addr = test.addr
+
+        class Result:
+            device = Device
+
+            def manufacturer(self, company_id):
+                yield company_id, bytes((BROADCAST_MAGIC, BROADCAST_VERSION, 0x34, 0x12, flags, trips))
+
+            def name(self):
+                return "tipup"
+        before = self.monitor.trips
+        self.monitor.observe(Result())
+        return self.monitor.trips - before
+
+    def test_counter_step_raises_one_alert_per_trip(self):
+        self.observe(0, 3)
+        self.assertEqual(self.observe(BROADCAST_FLAG_UP, 5), 2)
+
+    def test_reboot_resyncs_without_alerting(self):
+        self.observe(0, 3)
+        self.assertEqual(self.observe(0, 0), 0)
+        self.assertEqual(self.observe(BROADCAST_FLAG_UP, 1), 1)
+
+    def test_reboot_with_the_flag_up_alerts_once(self):
+        self.observe(0, 3)
+        self.assertEqual(self.observe(BROADCAST_FLAG_UP, 1), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,33 @@
+"""Host tests of the Pico tipup script against the simulated radio
+
+    python -m pytest Simulation
+"""
+import os, sys, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import simulator
+simulator.install()
+import ble_peripheral_device
+
+
+class FlagSwitchTest(unittest.TestCase):
+    def setUp(self):
+        self.tipup = ble_peripheral_device.BLEPeripheral()
+
+    def test_closing_the_switch_trips_and_readvertises(self):
+        tipup = self.tipup
+        before = tipup.manufacturer_data()
+        tipup.flag.hold()
+        self.assertEqual(tipup.trip_counter, 1)
+        self.assertTrue(tipup.binary_state)
+        self.assertNotEqual(tipup.manufacturer_data(), before)
+
+    def test_bounce_does_not_count_twice(self):
+        tipup = self.tipup
+        tipup.flag.hold()
+        tipup.flag_changed(tipup.flag)
+        self.assertEqual(tipup.trip_counter, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+"""Host tests of the receiver's per-tipup message bookkeeping
+
+    python -m pytest Simulation
+"""
+import os, sys, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import simulator
+simulator.install()
+from tipup_device import TipupDevice
+
+
+class RecordMessageTest(unittest.TestCase):
+    def setUp(self):
+        self.tipup = TipupDevice(1, "tipup", "00:00:00:00:00:01")
+
+    def record(self, seq, uptime_ms):
+        return self.tipup.record_message(1, seq, uptime_ms, 1, 90)
+
+    def test_resend_is_a_duplicate(self):
+        self.assertTrue(self.record(5, 1000))
+        self.assertFalse(self.record(5, 1000))
+        self.assertEqual(self.tipup.duplicates, 1)
+
+    def test_gap_counts_missed_events(self):
+        self.record(5, 1000)
+        self.record(8, 2000)
+        self.assertEqual(self.tipup.missed_events, 2)
+
+    def test_reboot_starts_the_sequence_over(self):
+        self.record(1, 1000)
+        self.record(2, 90000)
+        # Rebooted: numbering starts from 1 again with a small uptime
+        self.assertTrue(self.record(1, 800))
+        self.assertEqual(self.tipup.duplicates, 0)
+        self.assertEqual(self.tipup.missed_events, 0)
+        self.assertEqual(self.tipup.reboots, 1)
+        self.record(2, 1500)
+        self.assertEqual(self.tipup.missed_events, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
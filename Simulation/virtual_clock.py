@@ -0,0 +1,45 @@
+import asyncio, selectors
+
+class VirtualClock:
+    """Simulated time in seconds, only moves when the event loop is idle or a model charges time"""
+    def __init__(self):
+        self.now = 0.0
+
+    def advance(self, seconds):
+        if seconds > 0:
+            self.now += seconds
+
+    def ticks_us(self):
+        return int(self.now * 1000000)
+
+    def ticks_ms(self):
+        return int(self.now * 1000)
+
+
+class SimulationStalled(RuntimeError):
+    pass
+
+
+class _VirtualSelector:
+    # Wraps the real selector: instead of blocking until the next timer, jump the clock to it
+    def __init__(self, clock):
+        self.clock = clock
+        self.selector = selectors.DefaultSelector()
+
+    def select(self, timeout=None):
+        if timeout is None:
+            raise SimulationStalled("every task is waiting on an event that can never happen")
+        self.clock.advance(timeout)
+        return self.selector.select(0)
+
+    def __getattr__(self, name):
+        return getattr(self.selector, name)
+
+
+class VirtualEventLoop(asyncio.SelectorEventLoop):
+    def __init__(self, clock):
+        super().__init__(_VirtualSelector(clock))
+        self.clock = clock
+
+    def time(self):
+        return self.clock.now
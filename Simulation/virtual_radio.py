@@ -0,0 +1,259 @@
+import asyncio, random
+
+# IRQ event codes, as in the MicroPython bluetooth module
+_IRQ_CENTRAL_CONNECT = 1
+_IRQ_CENTRAL_DISCONNECT = 2
+_IRQ_GATTS_WRITE = 3
+_IRQ_PERIPHERAL_CONNECT = 7
+_IRQ_PERIPHERAL_DISCONNECT = 8
+_IRQ_GATTC_NOTIFY = 18
+_IRQ_GATTC_INDICATE = 19
+_IRQ_GATTS_INDICATE_DONE = 20
+_IRQ_MTU_EXCHANGED = 21
+_IRQ_CONNECTION_UPDATE = 27
+
+_FLAG_NOTIFY = 0x0010
+_FLAG_INDICATE = 0x0020
+
+# Stack defaults used when nothing else is requested
+DEFAULT_CONN_INTERVAL_US = 30000
+MIN_ADV_INTERVAL_US = 20000
+DEFAULT_MTU = 23
+
+
+class Attribute:
+    def __init__(self, handle, uuid, flags=0):
+        self.handle = handle
+        self.uuid = uuid
+        self.flags = flags
+        self.value = b""
+
+
+class GattService:
+    def __init__(self, uuid, start_handle):
+        self.uuid = uuid
+        self.start_handle = start_handle
+        self.end_handle = start_handle
+        self.characteristics = []   # (def_handle, value Attribute, cccd Attribute or None)
+
+
+class Link:
+    """One connection between a central node and a peripheral node"""
+    def __init__(self, radio, central, peripheral, conn_handle, interval_us):
+        self.radio = radio
+        self.central = central
+        self.peripheral = peripheral
+        self.conn_handle = conn_handle
+        self.interval_us = interval_us
+        self.latency = 0
+        self.supervision_timeout_ms = 4000
+        self.mtu = DEFAULT_MTU
+        self.connected = True
+
+    def round_trip(self):
+        # A request and its response each wait, on average, half a connection event away
+        return self.interval_us / 1000000
+
+
+class Node:
+    """State of one simulated BLE controller, reached through bluetooth.BLE()"""
+    def __init__(self, radio):
+        self.radio = radio
+        self.mac = bytes((0x02, 0x5E, 0x00, 0x00, 0x00, len(radio.nodes) + 1))
+        self.is_active = False
+        self.handler = None
+        self.services = []
+        self.attributes = {}
+        self.next_handle = 1
+        self.adv_interval_us = 0
+        self.adv_data = b""
+        self.resp_data = b""
+        self.connectable = True
+        self.mtu = DEFAULT_MTU
+        self.links = {}         # conn_handle -> Link
+        self.indications_sent = 0
+        radio.nodes.append(self)
+
+    # -- bluetooth.BLE API --
+    def active(self, state=None):
+        if state is None:
+            return self.is_active
+        self.is_active = bool(state)
+        return self.is_active
+
+    def irq(self, handler):
+        self.handler = handler
+
+    def config(self, *args, **kwargs):
+        if kwargs:
+            if "mtu" in kwargs:
+                self.mtu = kwargs["mtu"]
+            return None
+        name = args[0]
+        if name == "mac":
+            return (0, self.mac)
+        if name == "mtu":
+            return self.mtu
+        return None
+
+    def gap_advertise(self, interval_us, adv_data=None, resp_data=None, connectable=True):
+        if interval_us is None or interval_us == 0:
+            self.adv_interval_us = 0
+            return
+        self.adv_interval_us = max(interval_us, MIN_ADV_INTERVAL_US)
+        if adv_data is not None:
+            self.adv_data = bytes(adv_data)
+        if resp_data is not None:
+            self.resp_data = bytes(resp_data)
+        self.connectable = connectable
+
+    def gatts_register_services(self, services):
+        result = []
+        for uuid, characteristics in services:
+            service = GattService(uuid, self.next_handle)
+            self.next_handle += 1
+            handles = []
+            for characteristic in characteristics:
+                char_uuid, flags = characteristic[0], characteristic[1]
+                def_handle = self.next_handle
+                value = Attribute(def_handle + 1, char_uuid, flags)
+                self.next_handle += 2
+                cccd = None
+                if flags & (_FLAG_NOTIFY | _FLAG_INDICATE):
+                    cccd = Attribute(self.next_handle, 0x2902)
+                    cccd.value = b"\x00\x00"
+                    self.next_handle += 1
+                    self.attributes[cccd.handle] = cccd
+                self.attributes[value.handle] = value
+                service.characteristics.append((def_handle, value, cccd))
+                handles.append(value.handle)
+            service.end_handle = self.next_handle - 1
+            self.services.append(service)
+            result.append(tuple(handles))
+        return tuple(result)
+
+    def gatts_write(self, value_handle, data, send_update=False):
+        self.attributes[value_handle].value = bytes(data)
+
+    def gatts_read(self, value_handle):
+        return self.attributes[value_handle].value
+
+    def gatts_notify(self, conn_handle, value_handle, data=None):
+        self.radio.server_update(self, conn_handle, value_handle, data, _IRQ_GATTC_NOTIFY)
+
+    def gatts_indicate(self, conn_handle, value_handle, data=None):
+        self.indications_sent += 1
+        self.radio.server_update(self, conn_handle, value_handle, data, _IRQ_GATTC_INDICATE)
+
+    def gap_disconnect(self, conn_handle):
+        link = self.links.get(conn_handle)
+        if link is None:
+            return False
+        self.radio.disconnect(link)
+        return True
+
+    # -- helpers --
+    def fire(self, event, data):
+        if self.handler is not None:
+            self.handler(event, data)
+
+    def advertising(self):
+        return self.adv_interval_us > 0
+
+    def find_service(self, uuid):
+        for service in self.services:
+            if service.uuid == uuid:
+                return service
+        return None
+
+
+class Radio:
+    """Virtual air linking every Node: advertising, connections and GATT round trips cost simulated time"""
+    def __init__(self, clock, seed=1):
+        self.clock = clock
+        self.nodes = []
+        self.next_conn_handle = 0
+        self.random = random.Random(seed)
+        self.connecting = False
+        self.airtime_us = 0
+
+    def later(self, seconds, callback, *args):
+        asyncio.get_event_loop().call_later(seconds, callback, *args)
+
+    def advertisers(self):
+        return [node for node in self.nodes if node.advertising()]
+
+    def next_advert_delay(self, node):
+        # Advertising events are spaced by the interval plus up to 10 ms of random delay
+        return (node.adv_interval_us + self.random.randint(0, 10000)) / 1000000
+
+    def rssi(self, node):
+        return -40 - (node.mac[-1] * 7) % 50
+
+    async def connect(self, central, peripheral, interval_us=None):
+        if self.connecting:
+            raise OSError(114)  # EALREADY, only one connection may be pending
+        self.connecting = True
+        try:
+            # The controller waits for the next connectable advertisement
+            while not (peripheral.advertising() and peripheral.connectable):
+                await asyncio.sleep(0.01)
+            await asyncio.sleep(self.next_advert_delay(peripheral))
+        finally:
+            self.connecting = False
+
+        conn_handle = self.next_conn_handle
+        self.next_conn_handle += 1
+        link = Link(self, central, peripheral, conn_handle, interval_us or DEFAULT_CONN_INTERVAL_US)
+        central.links[conn_handle] = link
+        peripheral.links[conn_handle] = link
+        peripheral.adv_interval_us = 0
+        peripheral.fire(_IRQ_CENTRAL_CONNECT, (conn_handle, 0, memoryview(central.mac)))
+        central.fire(_IRQ_PERIPHERAL_CONNECT, (conn_handle, 0, memoryview(peripheral.mac)))
+        return link
+
+    def disconnect(self, link):
+        if not link.connected:
+            return
+        link.connected = False
+        link.central.links.pop(link.conn_handle, None)
+        link.peripheral.links.pop(link.conn_handle, None)
+        link.peripheral.fire(_IRQ_CENTRAL_DISCONNECT, (link.conn_handle, 0, memoryview(link.central.mac)))
+        link.central.fire(_IRQ_PERIPHERAL_DISCONNECT, (link.conn_handle, 0, memoryview(link.peripheral.mac)))
+
+    def update_connection(self, link, interval_us, latency, supervision_timeout_ms):
+        link.interval_us = interval_us
+        link.latency = latency
+        link.supervision_timeout_ms = supervision_timeout_ms
+        data = (link.conn_handle, interval_us // 1250, latency, supervision_timeout_ms // 10, 0)
+        link.central.fire(_IRQ_CONNECTION_UPDATE, data)
+        link.peripheral.fire(_IRQ_CONNECTION_UPDATE, data)
+
+    def exchange_mtu(self, link, mtu):
+        link.mtu = min(mtu, link.peripheral.mtu)
+        link.central.fire(_IRQ_MTU_EXCHANGED, (link.conn_handle, link.mtu))
+        link.peripheral.fire(_IRQ_MTU_EXCHANGED, (link.conn_handle, link.mtu))
+
+    def server_update(self, node, conn_handle, value_handle, data, event):
+        link = node.links.get(conn_handle)
+        if link is None or not link.connected:
+            raise OSError(128)  # ENOTCONN
+        if data is None:
+            data = node.attributes[value_handle].value
+        payload = bytes(data)[:link.mtu - 3]
+        self.airtime_us += 80 + 8 * len(payload)
+        # Sent at the next connection event, which on average is half an interval away
+        delay = self.random.uniform(0, link.interval_us) / 1000000
+        self.later(delay, self.deliver, link, value_handle, payload, event)
+
+    def deliver(self, link, value_handle, payload, event):
+        if not link.connected:
+            return
+        link.central.fire(event, (link.conn_handle, value_handle, memoryview(payload)))
+        if event == _IRQ_GATTC_INDICATE:
+            # The confirmation comes back on the following connection event
+            self.later(link.interval_us / 1000000, self.confirm, link, value_handle)
+
+    def confirm(self, link, value_handle):
+        status = 0 if link.connected else 1
+        link.peripheral.fire(_IRQ_GATTS_INDICATE_DONE, (link.conn_handle, value_handle, status))